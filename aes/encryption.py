@@ -1,9 +1,32 @@
 # AES 256
+import struct
+from functools import lru_cache
+
 from .key import key_expansion
 
 # Chiffrement AES 256 (ECB)
 # Chiffre un texte en clair avec une clé AES 256 bits
 def encrypt(plaintext: str, key: str) -> str:
+    # Vérifier la longueur de la clé
+    if len(key) != 32:
+        raise ValueError("La clé doit être de 32 octets (256 bits).")
+
+    # Même format que encrypt_reference (ECB + remplissage PKCS#7, hexadécimal)
+    return encrypt_bytes(plaintext.encode(), key.encode()).hex()
+
+# Déchiffrement AES 256 (ECB)
+# Déchiffre un texte chiffré avec une clé AES 256 bits
+# Le texte chiffré doit être en hexadécimal
+def decrypt(encrypted_text: str, key: str) -> str:
+    # Vérifier la longueur de la clé
+    if len(key) != 32:
+        raise ValueError("La clé doit être de 32 octets (256 bits).")
+
+    return decrypt_bytes(bytes.fromhex(encrypted_text), key.encode()).decode()
+
+# Implémentation de référence, ronde par ronde sur des matrices 4x4
+# Chiffre un texte en clair avec une clé AES 256 bits
+def encrypt_reference(plaintext: str, key: str) -> str:
     # Gestion de la clé
 
     # Convertir la clé en octets
@@ -67,10 +90,10 @@ def encrypt(plaintext: str, key: str) -> str:
     
     return encrypted_text
 
-# Déchiffrement AES 256 (ECB)
+# Implémentation de référence du déchiffrement
 # Déchiffre un texte chiffré avec une clé AES 256 bits
 # Le texte chiffré doit être en hexadécimal
-def decrypt(encrypted_text: str, key: str) -> str:
+def decrypt_reference(encrypted_text: str, key: str) -> str:
     # Gestion de la clé
 
     # Convertir la clé en octets
@@ -318,4 +341,128 @@ def inv_mix_columns(matrix):
 def add_round_key(mat, round_key):
     for i in range(4):
         for j in range(4):
-            mat[i][j] = mat[i][j] ^ round_key[i][j]
\ No newline at end of file
+            mat[i][j] = mat[i][j] ^ round_key[i][j]
+
+# ───────────── API octets, version rapide par tables ─────────────
+# Chaque ronde combine SubBytes, ShiftRows et MixColumns en 4 recherches
+# dans des tables de mots de 32 bits (T-tables), et la clé étendue est
+# mise en cache : c'est l'API à utiliser pour les gros volumes.
+
+SBOX = bytes(value for row in S_BOX for value in row)
+INV_SBOX = bytes(value for row in INV_S_BOX for value in row)
+
+def _rotate_right(word, n):
+    return ((word >> n) | (word << (32 - n))) & 0xFFFFFFFF
+
+def _build_tables():
+    te0, td0 = [], []
+    for x in range(256):
+        s = SBOX[x]
+        te0.append((galois_multiply(s, 2) << 24) | (s << 16) | (s << 8) | galois_multiply(s, 3))
+        s = INV_SBOX[x]
+        td0.append((galois_multiply(s, 14) << 24) | (galois_multiply(s, 9) << 16)
+                   | (galois_multiply(s, 13) << 8) | galois_multiply(s, 11))
+    te = [te0] + [[_rotate_right(w, 8 * n) for w in te0] for n in (1, 2, 3)]
+    td = [td0] + [[_rotate_right(w, 8 * n) for w in td0] for n in (1, 2, 3)]
+    return te, td
+
+(TE0, TE1, TE2, TE3), (TD0, TD1, TD2, TD3) = _build_tables()
+
+class RoundKeys:
+    """Clé AES-256 étendue, sous forme de mots de 32 bits pour le chiffrement et le déchiffrement."""
+    __slots__ = ("encrypt", "decrypt")
+
+    def __init__(self, key: bytes):
+        if len(key) != 32:
+            raise ValueError("La clé doit être de 32 octets (256 bits).")
+        matrices = key_expansion(key)
+        # Une matrice par ronde, colonne j = mot j
+        words = [
+            (m[0][j] << 24) | (m[1][j] << 16) | (m[2][j] << 8) | m[3][j]
+            for m in matrices for j in range(4)
+        ]
+        self.encrypt = tuple(words)
+
+        # Chiffrement inverse équivalent : InvMixColumns appliqué aux clés des rondes internes
+        inverse = list(words[56:60])
+        for n in range(13, 0, -1):
+            for w in words[4 * n:4 * n + 4]:
+                inverse.append(TD0[SBOX[w >> 24]] ^ TD1[SBOX[(w >> 16) & 255]]
+                               ^ TD2[SBOX[(w >> 8) & 255]] ^ TD3[SBOX[w & 255]])
+        inverse.extend(words[0:4])
+        self.decrypt = tuple(inverse)
+
+@lru_cache(maxsize=64)
+def expand_key(key: bytes) -> RoundKeys:
+    """Étend une clé de 32 octets une seule fois par clé."""
+    return RoundKeys(key)
+
+def encrypt_blocks(data: bytes, round_keys: RoundKeys) -> bytes:
+    """Chiffre des blocs de 16 octets (longueur multiple de 16), sans remplissage."""
+    if len(data) % 16:
+        raise ValueError("La longueur doit être un multiple de 16 octets.")
+    rk = round_keys.encrypt
+    te0, te1, te2, te3, sbox = TE0, TE1, TE2, TE3, SBOX
+    words = struct.unpack(f">{len(data) // 4}I", data)
+    out = []
+    for b in range(0, len(words), 4):
+        s0 = words[b] ^ rk[0]
+        s1 = words[b + 1] ^ rk[1]
+        s2 = words[b + 2] ^ rk[2]
+        s3 = words[b + 3] ^ rk[3]
+        for r in range(4, 56, 4):
+            t0 = te0[s0 >> 24] ^ te1[(s1 >> 16) & 255] ^ te2[(s2 >> 8) & 255] ^ te3[s3 & 255] ^ rk[r]
+            t1 = te0[s1 >> 24] ^ te1[(s2 >> 16) & 255] ^ te2[(s3 >> 8) & 255] ^ te3[s0 & 255] ^ rk[r + 1]
+            t2 = te0[s2 >> 24] ^ te1[(s3 >> 16) & 255] ^ te2[(s0 >> 8) & 255] ^ te3[s1 & 255] ^ rk[r + 2]
+            t3 = te0[s3 >> 24] ^ te1[(s0 >> 16) & 255] ^ te2[(s1 >> 8) & 255] ^ te3[s2 & 255] ^ rk[r + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+        # Ronde finale sans MixColumns
+        out.append(((sbox[s0 >> 24] << 24) | (sbox[(s1 >> 16) & 255] << 16)
+                    | (sbox[(s2 >> 8) & 255] << 8) | sbox[s3 & 255]) ^ rk[56])
+        out.append(((sbox[s1 >> 24] << 24) | (sbox[(s2 >> 16) & 255] << 16)
+                    | (sbox[(s3 >> 8) & 255] << 8) | sbox[s0 & 255]) ^ rk[57])
+        out.append(((sbox[s2 >> 24] << 24) | (sbox[(s3 >> 16) & 255] << 16)
+                    | (sbox[(s0 >> 8) & 255] << 8) | sbox[s1 & 255]) ^ rk[58])
+        out.append(((sbox[s3 >> 24] << 24) | (sbox[(s0 >> 16) & 255] << 16)
+                    | (sbox[(s1 >> 8) & 255] << 8) | sbox[s2 & 255]) ^ rk[59])
+    return struct.pack(f">{len(out)}I", *out)
+
+def decrypt_blocks(data: bytes, round_keys: RoundKeys) -> bytes:
+    """Déchiffre des blocs de 16 octets (longueur multiple de 16), sans remplissage."""
+    if len(data) % 16:
+        raise ValueError("La longueur doit être un multiple de 16 octets.")
+    rk = round_keys.decrypt
+    td0, td1, td2, td3, inv_sbox = TD0, TD1, TD2, TD3, INV_SBOX
+    words = struct.unpack(f">{len(data) // 4}I", data)
+    out = []
+    for b in range(0, len(words), 4):
+        s0 = words[b] ^ rk[0]
+        s1 = words[b + 1] ^ rk[1]
+        s2 = words[b + 2] ^ rk[2]
+        s3 = words[b + 3] ^ rk[3]
+        for r in range(4, 56, 4):
+            t0 = td0[s0 >> 24] ^ td1[(s3 >> 16) & 255] ^ td2[(s2 >> 8) & 255] ^ td3[s1 & 255] ^ rk[r]
+            t1 = td0[s1 >> 24] ^ td1[(s0 >> 16) & 255] ^ td2[(s3 >> 8) & 255] ^ td3[s2 & 255] ^ rk[r + 1]
+            t2 = td0[s2 >> 24] ^ td1[(s1 >> 16) & 255] ^ td2[(s0 >> 8) & 255] ^ td3[s3 & 255] ^ rk[r + 2]
+            t3 = td0[s3 >> 24] ^ td1[(s2 >> 16) & 255] ^ td2[(s1 >> 8) & 255] ^ td3[s0 & 255] ^ rk[r + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+        # Ronde finale sans InvMixColumns
+        out.append(((inv_sbox[s0 >> 24] << 24) | (inv_sbox[(s3 >> 16) & 255] << 16)
+                    | (inv_sbox[(s2 >> 8) & 255] << 8) | inv_sbox[s1 & 255]) ^ rk[56])
+        out.append(((inv_sbox[s1 >> 24] << 24) | (inv_sbox[(s0 >> 16) & 255] << 16)
+                    | (inv_sbox[(s3 >> 8) & 255] << 8) | inv_sbox[s2 & 255]) ^ rk[57])
+        out.append(((inv_sbox[s2 >> 24] << 24) | (inv_sbox[(s1 >> 16) & 255] << 16)
+                    | (inv_sbox[(s0 >> 8) & 255] << 8) | inv_sbox[s3 & 255]) ^ rk[58])
+        out.append(((inv_sbox[s3 >> 24] << 24) | (inv_sbox[(s2 >> 16) & 255] << 16)
+                    | (inv_sbox[(s1 >> 8) & 255] << 8) | inv_sbox[s0 & 255]) ^ rk[59])
+    return struct.pack(f">{len(out)}I", *out)
+
+def encrypt_bytes(data: bytes, key: bytes) -> bytes:
+    """AES-256 ECB avec remplissage PKCS#7, compatible avec encrypt()."""
+    padding_length = 16 - (len(data) % 16)
+    return encrypt_blocks(data + bytes([padding_length] * padding_length), expand_key(key))
+
+def decrypt_bytes(data: bytes, key: bytes) -> bytes:
+    """Inverse de encrypt_bytes."""
+    decrypted = decrypt_blocks(data, expand_key(key))
+    return decrypted[:-decrypted[-1]]
@@ -8,6 +8,8 @@ import os
 from dataclasses import dataclass, asdict
 from typing import Dict, Any, Optional
 
+from storage import snapshot_writer
+
 
 @dataclass
 class NetworkConfig:
@@ -18,6 +20,11 @@ class NetworkConfig:
     connection_timeout: int = 120  # seconds for considering peer disconnected
     max_retries: int = 3
     retry_delay: float = 1.0  # seconds
+    outbound_high_watermark: int = 16 * 1024 * 1024  # bytes queued per peer before producers wait
+    outbound_low_watermark: int = 4 * 1024 * 1024    # bytes queued per peer before producers resume
+    compression_enabled: bool = True
+    compression_min_size: int = 512  # bytes, smaller payloads are sent as-is
+    compression_level: int = 6       # zlib level 1-9
 
 
 @dataclass
@@ -27,6 +34,7 @@ class FileConfig:
     downloads_folder: str = "downloads"
     temp_folder: str = "temp"
     allowed_extensions: list = None
+    compressed_extensions: list = None  # already compressed, not worth recompressing
     
     def __post_init__(self):
         if self.allowed_extensions is None:
@@ -42,6 +50,13 @@ class FileConfig:
                 # Code
                 '.py', '.js', '.html', '.css', '.json', '.xml', '.md'
             ]
+        if self.compressed_extensions is None:
+            self.compressed_extensions = [
+                '.jpg', '.jpeg', '.png', '.gif', '.webp',
+                '.zip', '.rar', '.7z', '.gz',
+                '.mp3', '.mp4', '.avi', '.mkv', '.flac',
+                '.docx', '.odt'
+            ]
 
 
 @dataclass
@@ -54,6 +69,17 @@ class UIConfig:
     theme: str = "dark"
     show_timestamps: bool = True
     show_file_previews: bool = True
+    render_batch_window: int = 33  # ms; messages arriving within it share one repaint
+    history_page_size: int = 200  # messages loaded at once when opening or scrolling up history
+    history_max_pages: int = 5  # older pages kept in memory; farther ones are read again when scrolled back to
+    thumbnail_quality: int = 85  # JPEG quality of the previews sent with shared images
+    preview_cache_size: int = 32 * 1024 * 1024  # bytes of rendered image previews kept in memory
+    preview_cache_folder: str = "data/previews"  # preview sources kept for history, "" to disable
+    preview_cache_disk_size: int = 64 * 1024 * 1024  # bytes
+    gif_frame_budget: int = 8 * 1024 * 1024  # bytes of rendered frames kept per animation
+    image_workers: int = 2  # processes rendering image previews
+    image_worker_processes: bool = True  # False renders in threads (always the case on a single CPU)
+    image_queue_depth: int = 8  # waiting history previews; older ones are dropped
 
 
 @dataclass
@@ -66,6 +92,21 @@ class SecurityConfig:
     enable_file_integrity_check: bool = True
 
 
+@dataclass
+class StorageConfig:
+    """Conversation storage configuration."""
+    backend: str = "log"  # log (JSON Lines files) or sqlite (single database with search)
+    conversations_folder: str = "conversations"
+    database_path: str = "data/messages.db"
+    fsync_policy: str = "batch"  # always, batch or never
+    fsync_interval: float = 1.0  # seconds between fsyncs with the batch policy
+    compaction_threshold: float = 0.25  # rewrite a log once this share of its bytes is garbage
+    encrypt_at_rest: bool = False  # seal stored messages with a key from ENCODHEX_STORAGE_PASSPHRASE or key_file
+    key_file: str = "data/storage.key"
+    kdf_iterations: int = 200_000  # PBKDF2 rounds when a passphrase is used
+    save_delay: float = 0.5  # seconds to coalesce contact, group and config saves
+
+
 @dataclass
 class AppConfig:
     """Main application configuration."""
@@ -73,12 +114,14 @@ class AppConfig:
     files: FileConfig
     ui: UIConfig
     security: SecurityConfig
+    storage: StorageConfig
     
     def __init__(self):
         self.network = NetworkConfig()
         self.files = FileConfig()
         self.ui = UIConfig()
         self.security = SecurityConfig()
+        self.storage = StorageConfig()
 
 
 class ConfigManager:
@@ -88,6 +131,7 @@ class ConfigManager:
         self.config_file = config_file
         self.config = AppConfig()
         self.load_config()
+        snapshot_writer.delay = self.config.storage.save_delay
     
     def load_config(self) -> None:
         """Load configuration from JSON file."""
@@ -101,24 +145,21 @@ class ConfigManager:
             print("Using default configuration.")
     
     def save_config(self) -> None:
-        """Save current configuration to JSON file."""
-        try:
-            # Ensure data directory exists
-            os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-            
-            # Convert config to dictionary
-            config_dict = {
-                'network': asdict(self.config.network),
-                'files': asdict(self.config.files),
-                'ui': asdict(self.config.ui),
-                'security': asdict(self.config.security)
-            }
-            
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config_dict, f, indent=2, ensure_ascii=False)
-                
-        except Exception as e:
-            print(f"Error saving config to {self.config_file}: {e}")
+        """Schedule a save of the current configuration to JSON file.
+        
+        The write is coalesced with other saves and done by the background
+        snapshot writer; call snapshot_writer.flush() to force it."""
+        snapshot_writer.save(self.config_file, self.to_dict)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the configuration to a dictionary."""
+        return {
+            'network': asdict(self.config.network),
+            'files': asdict(self.config.files),
+            'ui': asdict(self.config.ui),
+            'security': asdict(self.config.security),
+            'storage': asdict(self.config.storage)
+        }
     
     def _update_config_from_dict(self, data: Dict[str, Any]) -> None:
         """Update configuration from dictionary data."""
@@ -130,6 +171,8 @@ class ConfigManager:
             self._update_dataclass(self.config.ui, data['ui'])
         if 'security' in data:
             self._update_dataclass(self.config.security, data['security'])
+        if 'storage' in data:
+            self._update_dataclass(self.config.storage, data['storage'])
     
     def _update_dataclass(self, obj: Any, data: Dict[str, Any]) -> None:
         """Update dataclass object with dictionary data."""
@@ -153,6 +196,10 @@ class ConfigManager:
         """Get security configuration."""
         return self.config.security
     
+    def get_storage_config(self) -> StorageConfig:
+        """Get storage configuration."""
+        return self.config.storage
+    
     def update_network_config(self, **kwargs) -> None:
         """Update network configuration."""
         for key, value in kwargs.items():
@@ -181,6 +228,13 @@ class ConfigManager:
                 setattr(self.config.security, key, value)
         self.save_config()
     
+    def update_storage_config(self, **kwargs) -> None:
+        """Update storage configuration."""
+        for key, value in kwargs.items():
+            if hasattr(self.config.storage, key):
+                setattr(self.config.storage, key, value)
+        self.save_config()
+    
     def reset_to_defaults(self) -> None:
         """Reset configuration to default values."""
         self.config = AppConfig()
@@ -189,15 +243,8 @@ class ConfigManager:
     def export_config(self, file_path: str) -> bool:
         """Export configuration to a specific file."""
         try:
-            config_dict = {
-                'network': asdict(self.config.network),
-                'files': asdict(self.config.files),
-                'ui': asdict(self.config.ui),
-                'security': asdict(self.config.security)
-            }
-            
             with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(config_dict, f, indent=2, ensure_ascii=False)
+                json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
             return True
         except Exception:
             return False
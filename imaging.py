@@ -0,0 +1,239 @@
+"""
+Image preview rendering for EncodHex chat application.
+Decoding, resizing and conversion to terminal pixels or ASCII art, plus a
+pool of worker processes that runs them away from the interface, with a
+bounded queue whose stale requests are dropped rather than rendered.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from PIL import Image
+from rich_pixels import Pixels
+
+PREVIEW_RESAMPLE = Image.Resampling.BILINEAR  # A preview is a few thousand cells, LANCZOS shows no difference
+PREVIEW_REDUCING_GAP = 2.0  # Shrink by integer factors first, leaving at most 2x to the filter
+ASCII_CHARS = "@%#*+=-:. "  # Dark to light
+# Character of each gray level, applied to a whole image with bytes.translate
+ASCII_TABLE = bytes(ord(ASCII_CHARS[gray * (len(ASCII_CHARS) - 1) // 255]) for gray in range(256))
+ASCII_MAX_SIZE = (40, 20)  # Characters
+
+
+# ─────────────────────────────── rendering ───────────────────────────────
+def fit_within(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """Largest size with the aspect ratio of `size` that fits in `box`."""
+    img_width, img_height = size
+    width, height = box
+    aspect_ratio = img_width / img_height
+    if aspect_ratio > width / height:
+        return width, max(1, int(width / aspect_ratio))
+    return max(1, int(height * aspect_ratio)), height
+
+def shrink_for_preview(img: Image.Image, box: Tuple[int, int]) -> Image.Image:
+    """RGB copy of an image fitted to `box`, made without touching every source pixel when possible.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale (draft), other formats are
+    reduced by an integer factor, and only the last step is filtered."""
+    target = fit_within(img.size, box)
+    img.draft(None, target)  # No-op once loaded or for formats without scaled decoding
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        # Palette and other modes cannot be filtered directly
+        img = img.convert('RGB')
+    img = img.resize(target, PREVIEW_RESAMPLE, reducing_gap=PREVIEW_REDUCING_GAP)
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+def render_still(data: bytes, box: Tuple[int, int]) -> Optional[Pixels]:
+    """Pixels of a still image fitted to `box`, or None for an animation.
+
+    Animations keep a decoder open between frames, so they are rendered by
+    the caller; errors are raised for the caller to report."""
+    with Image.open(BytesIO(data)) as img:
+        if getattr(img, 'is_animated', False):
+            return None
+        return Pixels.from_image(shrink_for_preview(img, box))
+
+def image_to_ascii(img: Image.Image) -> str:
+    """ASCII art of an image, one character per pixel (at most ASCII_MAX_SIZE).
+
+    The grayscale conversion and the mapping to characters run in C, over
+    the whole image at once."""
+    img = img.convert('L')
+    width, height = min(img.width, ASCII_MAX_SIZE[0]), min(img.height, ASCII_MAX_SIZE[1])
+    if (width, height) != img.size:
+        img = img.resize((width, height))
+    chars = img.tobytes().translate(ASCII_TABLE)
+    return b"\n".join(chars[row:row + width] for row in range(0, len(chars), width)).decode('ascii')
+
+def render_ascii(path: str, box: Tuple[int, int]) -> Tuple[str, Tuple[int, int]]:
+    """ASCII art of an image file fitted to `box`, and the size of the image."""
+    with Image.open(path) as img:
+        size = img.size  # Before draft() decodes at a reduced scale
+        return image_to_ascii(shrink_for_preview(img, box)), size
+
+
+# ───────────────────────────── worker pool ─────────────────────────────
+@contextlib.contextmanager
+def spawning_from_imaging():
+    """Processes spawned meanwhile take this module as their main module.
+
+    A spawned process first runs the parent's main module again, as
+    __mp_main__. When the application is started as a script, that would
+    set the whole interface up once more (state, folders, configuration,
+    caches) in every worker, which only needs this module."""
+    main = sys.modules["__main__"]
+    spec = getattr(main, "__spec__", None)
+    main.__spec__ = __spec__
+    try:
+        yield
+    finally:
+        main.__spec__ = spec
+
+class RequestDropped(Exception):
+    """A request was cancelled, or pushed out of the queue by newer ones, before its result came."""
+
+@dataclass
+class ImageJob:
+    function: Callable
+    args: Tuple
+    tag: Any
+    wanted: Optional[Callable[[], bool]]
+    result: asyncio.Future
+
+class ImageWorkerPool:
+    """Runs image work in worker processes, so it does not hold the interface's GIL.
+
+    At most `workers` requests run at once, the others wait in order.
+    Requests made with a tag (previews that can go stale, like history
+    scrolled past) are limited to `queue_depth` waiting ones: the oldest is
+    dropped when a new one does not fit. They are also dropped if their
+    `wanted` check fails when a worker becomes free, or when cancel() is
+    called with their tag; the caller then gets RequestDropped. Work
+    already running in a process cannot be interrupted, only its result
+    discarded. Untagged requests are always completed.
+
+    Workers are spawned rather than forked, as the interface runs threads
+    that a fork would copy in the middle of their work, and they import
+    only this module (see spawning_from_imaging). Threads are used
+    instead with `processes=False`, if processes cannot be started, or on a
+    single CPU, where workers would only compete with the interface for it.
+    """
+
+    def __init__(self, workers: int = 2, queue_depth: int = 8, processes: bool = True):
+        self.workers = max(1, workers)
+        self.queue_depth = max(1, queue_depth)
+        self.processes = processes and (os.cpu_count() or 1) > 1
+        self.dropped = 0  # Requests that never started, for diagnostics
+        self.pending: Deque[ImageJob] = deque()
+        self.active: List[ImageJob] = []
+        self._executor: Optional[concurrent.futures.Executor] = None
+
+    def executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.processes:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="image-worker")
+        return self._executor
+
+    def start(self):
+        """Start the workers ahead of the first request, which would otherwise wait for them."""
+        for _ in range(self.workers):
+            self.submit(os.getpid)
+
+    def submit(self, function: Callable, *args) -> concurrent.futures.Future:
+        try:
+            # Workers are started on demand, by submit()
+            with spawning_from_imaging():
+                return self.executor().submit(function, *args)
+        except (BrokenProcessPool, OSError):
+            # Processes cannot be started here: carry on with threads
+            self._fall_back_to_threads()
+            return self.executor().submit(function, *args)
+
+    async def run(self, function: Callable, *args, tag: Any = None,
+                  wanted: Optional[Callable[[], bool]] = None) -> Any:
+        """Result of function(*args), computed by a worker (picklable function and arguments)."""
+        job = ImageJob(function, args, tag, wanted, asyncio.get_running_loop().create_future())
+        self.pending.append(job)
+        if tag is not None:
+            waiting = [queued for queued in self.pending if queued.tag is not None]
+            for stale in waiting[:len(waiting) - self.queue_depth]:
+                self.pending.remove(stale)
+                self._drop(stale)
+        self._start_jobs()
+        return await job.result
+
+    def cancel(self, tag: Any):
+        """Drop the requests made with `tag`, queued or running."""
+        for queued in [queued for queued in self.pending if queued.tag == tag]:
+            self.pending.remove(queued)
+            self._drop(queued)
+        for job in self.active:
+            if job.tag == tag and not job.result.done():
+                job.result.set_exception(RequestDropped())
+
+    def shutdown(self):
+        """Drop every queued request and stop the workers without waiting for them."""
+        while self.pending:
+            self._drop(self.pending.popleft())
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _drop(self, job: ImageJob):
+        if not job.result.done():
+            self.dropped += 1
+            job.result.set_exception(RequestDropped())
+
+    def _start_jobs(self):
+        while self.pending and len(self.active) < self.workers:
+            job = self.pending.popleft()
+            if job.result.done():
+                continue  # The caller stopped waiting
+            if job.wanted is not None and not job.wanted():
+                self._drop(job)
+                continue
+            self.active.append(job)
+            future = self.submit(job.function, *job.args)
+            loop = job.result.get_loop()
+            future.add_done_callback(lambda future, job=job: self._finished(loop, job, future))
+
+    def _finished(self, loop: asyncio.AbstractEventLoop, job: ImageJob, future: concurrent.futures.Future):
+        """Called in a worker-management thread: hand the result over to the event loop."""
+        try:
+            loop.call_soon_threadsafe(self._complete, job, future)
+        except RuntimeError:
+            pass  # The loop is closed, nobody is waiting anymore
+
+    def _complete(self, job: ImageJob, future: concurrent.futures.Future):
+        self.active.remove(job)
+        error = None if future.cancelled() else future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # A worker died (killed, out of memory): retry the request in threads
+            self._fall_back_to_threads()
+            self.pending.appendleft(job)
+        elif not job.result.done():
+            if future.cancelled():
+                job.result.set_exception(RequestDropped())
+            elif error is not None:
+                job.result.set_exception(error)
+            else:
+                job.result.set_result(future.result())
+        self._start_jobs()
+
+    def _fall_back_to_threads(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.processes = False
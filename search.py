@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
 """searchable_directory_tree.py – FAST REFACTORED VERSION
 
-A **drop‑in** searchable / filterable DirectoryTree that works only with
-visible/expanded items for maximum performance.
+A **drop‑in** searchable / filterable DirectoryTree that searches the whole
+subtree through a background filename index.
 
 Key improvements in this refactor:
 ----------------------------------
-1. **No recursive directory scanning** – only filters immediate children of expanded nodes
-2. **Instant search** – searches only through currently visible/expanded items
-3. **Smart filtering** – shows matching files in expanded folders, hides non-matching folders
+1. **Background index** – every name below the root is listed once by a worker
+   thread (os.scandir), then refreshed incrementally: only folders whose
+   modification time changed are listed again
+2. **Instant search** – substring matches over the whole index in milliseconds,
+   fuzzy (in-order characters) matches when no name contains the query
+3. **Smart filtering** – only the branches leading to matches are loaded and
+   opened, folders without matches are hidden
 4. **Image filtering** – toggle between all files and images only
-5. **Responsive UI** – no delays or throttling needed due to minimal processing
+5. **Responsive UI** – searching never walks the tree, and no folder outside
+   the matching branches is read
 
 Run the file directly to launch the demo:
 
@@ -18,24 +23,29 @@ Run the file directly to launch the demo:
 
 Controls
 ~~~~~~~~
-• **Type** – live search through visible items
+• **Type** – live search through the whole tree
 • **F2**  – images‑only toggle (png / jpg / gif …)
 • **F3**  – show / hide dot‑files
 • **Ctrl‑C** – quit demo
 """
 from __future__ import annotations
 
+import asyncio
 import os
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal
+from textual.message import Message
 from textual.reactive import reactive
 from textual.timer import Timer
 from textual.widgets import DirectoryTree, Footer, Header, Input, Static
 
-__all__ = ["SearchableDirectoryTree"]
+__all__ = ["FileIndex", "SearchMatches", "SearchableDirectoryTree"]
 
 # ────────────────────────────── helpers ────────────────────────────── #
 IMG_EXTS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tiff", ".svg", ".ico", ".avif"}
@@ -50,9 +60,220 @@ def matches_search(name: str, search_term: str) -> bool:
         return True
     return search_term.lower() in name.lower()
 
+# ─────────────────────────── filename index ───────────────────────── #
+INDEX_MAX_ENTRIES = 300_000  # Names kept in memory; deeper ones are left out
+SEARCH_LIMIT = 500  # Matches revealed in the tree for one query
+
+@dataclass
+class SearchMatches:
+    """Where the matches of a query are in the tree."""
+    paths: Set[str] = field(default_factory=set)  # Matching files and folders
+    folders: Set[str] = field(default_factory=set)  # Matching folders, shown with all their content
+    branches: Set[str] = field(default_factory=set)  # Folders leading to matches, opened to reveal them
+    limited: bool = False  # More matches than SEARCH_LIMIT
+
+    def shows(self, path: str) -> bool:
+        """Whether a path belongs in the tree for this search."""
+        if path in self.paths or path in self.branches:
+            return True
+        child, parent = path, os.path.dirname(path)
+        while parent != child:
+            if parent in self.folders:
+                return True
+            if parent in self.branches:
+                return False
+            child, parent = parent, os.path.dirname(parent)
+        return False
+
+class FileIndex:
+    """Names of every file and folder below a root, searched as one string.
+
+    A background thread lists the tree with os.scandir (without following
+    symlinked folders) and keeps each folder's modification time: a refresh
+    stats the known folders and lists again only those where entries were
+    added, removed or renamed. The names are kept lowercased in a single
+    newline-separated string, so a query is a str.find or regex scan done in
+    C over the whole index, not a Python loop over paths.
+    """
+
+    def __init__(self, root: str | os.PathLike, *, show_hidden: bool = False,
+                 max_entries: int = INDEX_MAX_ENTRIES) -> None:
+        self.root = str(Path(root).expanduser().resolve())
+        self.show_hidden = show_hidden
+        self.max_entries = max_entries
+        self.ready = False  # The first listing is complete
+        self.complete = True  # False when max_entries left part of the tree out
+        self._folders: Dict[str, Tuple[int, List[str], List[str]]] = {}  # Folder -> (mtime_ns, files, subfolders)
+        # Lowercased names joined by newlines, the offset where each starts, and (folder, name, is_dir) of each
+        self._names: Tuple[str, List[int], List[Tuple[str, str, bool]]] = ("", [], [])
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, done: Optional[Callable[["FileIndex", bool], None]] = None) -> None:
+        """Build or refresh the index in a background thread.
+
+        done(index, changed) is called from that thread when it finishes;
+        nothing happens if a refresh is already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, args=(done,), name="file-index", daemon=True)
+        self._thread.start()
+
+    def _run(self, done: Optional[Callable[["FileIndex", bool], None]]) -> None:
+        changed = self.refresh()
+        if done is not None:
+            done(self, changed)
+
+    def refresh(self) -> bool:
+        """Bring the index up to date in the calling thread; True if any name changed."""
+        known = self._folders
+        folders: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        changed = not self.ready
+        count = 0
+        complete = True
+        stack = [self.root]
+        while stack:
+            folder = stack.pop()
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                continue  # Removed since its parent was listed
+            listing = known.get(folder)
+            if listing is None or listing[0] != mtime:
+                listing = self._list(folder, mtime)
+                changed = True
+            folders[folder] = listing
+            count += len(listing[1]) + len(listing[2])
+            if count > self.max_entries:
+                complete = False
+                break
+            stack.extend(os.path.join(folder, name) for name in listing[2])
+        changed = changed or folders.keys() != known.keys()
+        if changed:
+            self._names = self._flatten(folders)
+        self._folders = folders
+        self.complete = complete
+        self.ready = True
+        return changed
+
+    def _list(self, folder: str, mtime: int) -> Tuple[int, List[str], List[str]]:
+        files: List[str] = []
+        subfolders: List[str] = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if not self.show_hidden and entry.name.startswith("."):
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    (subfolders if is_dir else files).append(entry.name)
+        except OSError:
+            pass  # Unreadable folder: indexed as empty
+        return mtime, files, subfolders
+
+    @staticmethod
+    def _flatten(folders: Dict[str, Tuple[int, List[str], List[str]]]):
+        entries: List[Tuple[str, str, bool]] = []
+        for folder in sorted(folders):
+            _, files, subfolders = folders[folder]
+            entries.extend((folder, name, True) for name in subfolders)
+            entries.extend((folder, name, False) for name in files)
+        offsets: List[int] = []
+        position = 0
+        for _, name, _ in entries:
+            offsets.append(position)
+            position += len(name) + 1
+        return "\n".join(name.lower() for _, name, _ in entries), offsets, entries
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT,
+               accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, bool]]:
+        """(path, is_dir) of names containing the query, case-insensitive, in folder order.
+
+        When no name contains it, names holding its characters in order
+        (with anything in between) are returned instead. `accept(path)`
+        further filters the matching files (folders always match); at most
+        `limit` accepted matches are returned."""
+        query = query.strip().lower()
+        if not query or "\n" in query:
+            return []
+        names, offsets, entries = self._names
+
+        def keep(line: int) -> bool:
+            folder, name, is_dir = entries[line]
+            return is_dir or accept is None or accept(os.path.join(folder, name))
+
+        lines = self._find(names, offsets, lambda start: names.find(query, start), keep, limit)
+        if not lines and len(query) > 1:
+            lines = self._find(names, offsets, lambda start: self._find_in_order(names, query, start), keep, limit)
+        return [(os.path.join(entries[line][0], entries[line][1]), entries[line][2]) for line in lines]
+
+    @staticmethod
+    def _find(names: str, offsets: List[int], find: Callable[[int], int],
+              keep: Callable[[int], bool], limit: int) -> List[int]:
+        """Lines of the first `limit` kept matches of find(start), one per line."""
+        lines: List[int] = []
+        position = find(0)
+        while position != -1 and len(lines) < limit:
+            line = bisect_right(offsets, position) - 1
+            if keep(line):
+                lines.append(line)
+            if line + 1 == len(offsets):
+                break
+            position = find(offsets[line + 1])
+        return lines
+
+    @staticmethod
+    def _find_in_order(names: str, query: str, start: int) -> int:
+        """Offset of the first line from `start` holding the query's characters in order, or -1.
+
+        Each character is taken at its first occurrence after the previous
+        one, which finds a match if the line has one: every line is scanned
+        once, whatever the query."""
+        position = names.find(query[0], start)
+        while position != -1:
+            end = names.find("\n", position)
+            if end == -1:
+                end = len(names)
+            found = position
+            for char in query[1:]:
+                found = names.find(char, found + 1, end)
+                if found == -1:
+                    break
+            else:
+                return position
+            position = names.find(query[0], end + 1)
+        return -1
+
+    def reveal(self, query: str, accept: Optional[Callable[[str], bool]] = None,
+               limit: int = SEARCH_LIMIT) -> SearchMatches:
+        """Matches of a query and the folders leading to them from the root.
+
+        `accept` further filters the matching files (folders always match)."""
+        matches = SearchMatches()
+        found = self.search(query, limit + 1, accept)
+        matches.limited = len(found) > limit
+        for path, is_dir in found[:limit]:
+            matches.paths.add(path)
+            if is_dir:
+                matches.folders.add(path)
+            child, parent = path, os.path.dirname(path)
+            while parent != self.root and parent != child and parent not in matches.branches:
+                matches.branches.add(parent)
+                child, parent = parent, os.path.dirname(parent)
+        return matches
+
 # ─────────────────────────── main widget ──────────────────────────── #
 class SearchableDirectoryTree(DirectoryTree):
-    """DirectoryTree with fast search through visible/expanded items only."""
+    """DirectoryTree with fast search through the whole subtree, from a filename index."""
+
+    class IndexUpdated(Message):
+        """The filename index finished a build or refresh (posted from its thread)."""
+
+        def __init__(self, index: FileIndex, changed: bool) -> None:
+            super().__init__()
+            self.index = index
+            self.changed = changed
 
     search_term: reactive[str] = reactive("")
     images_only: reactive[bool] = reactive(False)
@@ -65,14 +286,26 @@ class SearchableDirectoryTree(DirectoryTree):
         search: str = "",
         images_only: bool = False,
         show_hidden: bool = False,
+        search_delay: float = 1.0,
         **kwargs,
     ) -> None:
+        # Ensure we start with a valid path
+        if not path or not os.path.exists(path):
+            path = os.getcwd()
         super().__init__(path, **kwargs)
         self.search_term = search
         self.images_only = images_only
         self.show_hidden = show_hidden
+        self.search_delay = search_delay  # Seconds without typing before a search is applied
         self._search_timer: Timer | None = None
         self._pending_filters: dict = {}
+        self.file_index = FileIndex(path, show_hidden=show_hidden)
+        self.matches: SearchMatches | None = None  # Set while a search is shown from the index
+        self._browsed: set[str] = set()  # Folders open before the search
+        self._reopen: set[str] = set()  # Folders to open as soon as they are loaded
+
+    def on_mount(self) -> None:
+        self._start_index()
 
     # Public ------------------------------------------------------------------ #
     def set_filters(
@@ -82,7 +315,7 @@ class SearchableDirectoryTree(DirectoryTree):
         images_only: bool | None = None,
         show_hidden: bool | None = None,
     ) -> None:
-        """Change any filter with 1-second debouncing to prevent rapid reloads."""
+        """Change any filter, debouncing search input to prevent rapid reloads."""
         # Store the pending filter changes
         if search is not None:
             self._pending_filters['search'] = search
@@ -100,8 +333,8 @@ class SearchableDirectoryTree(DirectoryTree):
         if search is None and (images_only is not None or show_hidden is not None):
             self._apply_pending_filters()
         else:
-            # Start a new timer for search input (1 second delay)
-            self._search_timer = self.set_timer(1.0, self._apply_pending_filters)
+            # Start a new timer for search input
+            self._search_timer = self.set_timer(self.search_delay, self._apply_pending_filters)
 
     def _apply_pending_filters(self) -> None:
         """Apply all pending filter changes."""
@@ -111,25 +344,53 @@ class SearchableDirectoryTree(DirectoryTree):
         if 'images_only' in self._pending_filters:
             self.images_only = self._pending_filters['images_only']
         if 'show_hidden' in self._pending_filters:
+            if self._pending_filters['show_hidden'] != self.show_hidden:
+                # Hidden folders are left out of the index unless shown
+                self.file_index = FileIndex(self.path, show_hidden=self._pending_filters['show_hidden'])
             self.show_hidden = self._pending_filters['show_hidden']
         
         # Clear pending filters
         self._pending_filters.clear()
         self._search_timer = None
         
-        # Now apply the filters
+        # Now apply the filters, and catch up with changes on disk for the next ones
         self._force_full_reload()
+        if self.search_term.strip() or not self.file_index.ready:
+            self._start_index()
+
+    def _start_index(self) -> None:
+        self.file_index.start(lambda index, changed: self.post_message(self.IndexUpdated(index, changed)))
+
+    def on_searchable_directory_tree_index_updated(self, message: IndexUpdated) -> None:
+        """Show the matches from the new index if the search depends on them."""
+        if message.index is self.file_index and message.changed and self.search_term.strip():
+            self._force_full_reload()
 
     def _force_full_reload(self) -> None:
-        """Force a complete reload of the tree including all expanded nodes."""
-        # Store the current expanded state
-        expanded_paths = self._get_expanded_paths()
+        """Reload the tree from the root with the current filters.
+
+        With a search and the index ready, only the branches leading to
+        matches anywhere below the root are kept, and they are opened as they
+        load; clearing the search opens again the folders open before it."""
+        self.workers.cancel_group(self, "search")
+        if self.search_term.strip() and self.file_index.ready:
+            self.run_worker(self._show_matches(self.search_term, self.images_only), group="search", exclusive=True)
+            return
+        self._reopen = self._browsed if self.matches is not None else set()
+        self.matches = None
         
-        # Reload the entire tree
+        # Reload the root: folders still open are listed again, the others on demand
+        self.reload()
+
+    async def _show_matches(self, search: str, images_only: bool) -> None:
+        """Query the index in a thread, away from the interface, then reload the tree with the matches."""
+        accept = (lambda path: is_image(Path(path))) if images_only else None
+        matches = await asyncio.to_thread(self.file_index.reveal, search, accept)
+        if self.matches is None:
+            self._browsed = self._get_expanded_paths()
+        self.matches = matches
+        self._reopen = matches.branches
         self.reload()
-        
-        # Restore the expanded state after a short delay
-        self.call_later(lambda: self._restore_expanded_state(expanded_paths))
     
     def _get_expanded_paths(self) -> set[str]:
         """Get the paths of all currently expanded directories."""
@@ -149,29 +410,21 @@ class SearchableDirectoryTree(DirectoryTree):
             collect_expanded(self.root)
         
         return expanded
-    
-    def _restore_expanded_state(self, expanded_paths: set[str]) -> None:
-        """Restore the expanded state of directories."""
-        def expand_matching(node):
-            if hasattr(node, 'data') and node.data:
-                try:
-                    if str(node.data.path) in expanded_paths:
-                        node.expand()
-                except Exception:
-                    pass
-            if hasattr(node, 'children'):
-                for child in node.children:
-                    expand_matching(child)
-        
-        if hasattr(self, 'root') and self.root:
-            expand_matching(self.root)
+
+    def _populate_node(self, node, content: Iterable[Path]) -> None:
+        """Add a folder's content, then open the subfolders to reveal (each is loaded in turn)."""
+        super()._populate_node(node, content)
+        for child in node.children:
+            if child.data is not None and str(child.data.path) in self._reopen:
+                child.expand()
 
     # Internal ---------------------------------------------------------------- #
     def filter_paths(self, paths: Iterable[Path]) -> List[Path]:
-        """Filter only the immediate children paths (visible items only)."""
+        """Filter the children of a folder being loaded."""
         search = self.search_term.strip()
         img_only = self.images_only
         show_hidden = self.show_hidden
+        matches = self.matches
         filtered: list[Path] = []
 
         for path in paths:
@@ -181,13 +434,17 @@ class SearchableDirectoryTree(DirectoryTree):
             if not show_hidden and name.startswith("."):
                 continue
 
+            # With the index, keep only the matches and the branches leading to them
+            if matches is not None and not matches.shows(str(path)):
+                continue
+
             is_file = path.is_file()
             is_dir = path.is_dir()
 
             # Handle files
             if is_file:
-                # Check if filename matches search term
-                if search and not matches_search(name, search):
+                # Until the index is ready, match the names of the loaded folders
+                if matches is None and search and not matches_search(name, search):
                     continue
                 
                 # Check image filter
@@ -199,16 +456,8 @@ class SearchableDirectoryTree(DirectoryTree):
             
             # Handle directories
             elif is_dir:
-                # For directories, we always include them if they pass basic filters
-                # The user can expand them to see their contents
-                # We only filter by search term if it's a direct match
-                if search:
-                    # If directory name doesn't match search term, we still include it
-                    # because it might contain matching files when expanded
-                    # But if it does match, we definitely include it
-                    pass
-                
-                # Directory passed filters
+                # Without the index, directories are always included:
+                # they might contain matching files when expanded
                 filtered.append(path)
 
         return filtered
@@ -275,10 +524,10 @@ class _Demo(App):
         yield Header()
         with Horizontal(id="toolbar"):
             yield Static("🔍", id="search_icon")
-            yield Input(placeholder="Search files in expanded folders…", id="search_box")
+            yield Input(placeholder="Search files below this folder…", id="search_box")
             yield Static("F2 images‑only  •  F3 hidden  •  Ctrl‑C quit", id="hints")
         yield SearchableDirectoryTree("./", id="tree")
-        yield Static("Ready - expand folders and search through visible items", id="status")
+        yield Static("Ready - search through the whole tree", id="status")
         yield Footer()
 
     def on_mount(self) -> None:
@@ -299,6 +548,11 @@ class _Demo(App):
                 status_parts.append("Clearing search (pending...)")
         elif tree.search_term:
             status_parts.append(f"Search: '{tree.search_term}'")
+            if tree.matches is not None:
+                more = "+" if tree.matches.limited else ""
+                status_parts.append(f"{len(tree.matches.paths)}{more} matches")
+            else:
+                status_parts.append("indexing…")
         
         if tree.images_only:
             status_parts.append("Images only")
@@ -309,7 +563,7 @@ class _Demo(App):
         if status_parts:
             self.status.update(" • ".join(status_parts))
         else:
-            self.status.update("Ready - expand folders and search through visible items")
+            self.status.update("Ready - search through the whole tree")
 
     # ───────────────────────── callbacks / actions ─────────────────────────── #
     def on_input_changed(self, msg: Input.Changed) -> None:
@@ -0,0 +1,1075 @@
+"""
+Conversation storage for EncodHex chat application.
+Append-only JSON Lines logs with a sidecar offset index for random access,
+or an optional SQLite store with full-text search, plus a background writer
+for small JSON state files (contacts, groups, configuration) and a
+content-addressed cache of image previews.
+"""
+
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+LOG_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".idx"
+LEGACY_SUFFIX = ".json"
+FSYNC_POLICIES = ("always", "batch", "never")
+PASSPHRASE_ENV = "ENCODHEX_STORAGE_PASSPHRASE"
+
+
+# ───────────────────────────── at-rest encryption ─────────────────────────────
+class StorageKeyError(Exception):
+    """Write refused: the log holds sealed records that cannot be opened (wrong storage key,
+    or encryption at rest disabled)."""
+
+
+class RecordCipher:
+    """AES-256-GCM for stored records; a sealed record is nonce (12) || ciphertext || tag (16)."""
+
+    NONCE_SIZE = 12
+    TAG_SIZE = 16
+
+    def __init__(self, key: bytes):
+        self.aead = AESGCM(hmac.new(key, b"encodhex-storage-encryption", hashlib.sha256).digest())
+
+    def seal_many(self, payloads: List[bytes]) -> List[bytes]:
+        """Encrypt payloads, each under its own random nonce."""
+        nonces = os.urandom(self.NONCE_SIZE * len(payloads))
+        sealed = []
+        for n, payload in enumerate(payloads):
+            nonce = nonces[n * self.NONCE_SIZE:(n + 1) * self.NONCE_SIZE]
+            sealed.append(nonce + self.aead.encrypt(nonce, payload, None))
+        return sealed
+
+    def open_many(self, tokens: List[bytes]) -> List[Optional[bytes]]:
+        """Decrypt sealed records; None for records that fail authentication."""
+        opened: List[Optional[bytes]] = []
+        for token in tokens:
+            if len(token) < self.NONCE_SIZE + self.TAG_SIZE:
+                opened.append(None)
+                continue
+            try:
+                opened.append(self.aead.decrypt(token[:self.NONCE_SIZE], token[self.NONCE_SIZE:], None))
+            except InvalidTag:
+                opened.append(None)
+        return opened
+
+    def seal_text(self, text: str) -> str:
+        return base64.b64encode(self.seal_many([text.encode("utf-8")])[0]).decode("ascii")
+
+    def open_text(self, token: str) -> Optional[str]:
+        payload = self.open_many([base64.b64decode(token)])[0]
+        return None if payload is None else payload.decode("utf-8")
+
+
+def load_storage_key(key_file: str, iterations: int = 200_000) -> bytes:
+    """Storage key for this session.
+
+    With ENCODHEX_STORAGE_PASSPHRASE set, the key is derived from the
+    passphrase with PBKDF2-HMAC-SHA256 and a salt kept in key_file.
+    Otherwise key_file holds a random data key, readable by its owner only.
+    """
+    directory = os.path.dirname(key_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    passphrase = os.environ.get(PASSPHRASE_ENV)
+    path = key_file + ".salt" if passphrase else key_file
+
+    if not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(16 if passphrase else 32))
+    with open(path, "rb") as f:
+        secret = f.read()
+
+    if passphrase:
+        return hashlib.pbkdf2_hmac("sha256", passphrase.encode("utf-8"), secret, iterations)
+    return secret
+
+
+class ConversationLog:
+    """One conversation stored as an append-only JSON Lines file.
+
+    Every record is one line. The sidecar index holds the byte offset of
+    each line as little-endian uint64, so record i can be read with a
+    single seek. Appending costs one write per file whatever the history
+    length. A log holding sealed records the cipher cannot open is
+    locked: its readable records are still returned, nothing is written.
+    """
+
+    KEY_PROBE_RECORDS = 8
+
+    def __init__(self, base_path: str, fsync_policy: str = "batch", fsync_interval: float = 1.0,
+                 cipher: Optional[RecordCipher] = None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.base_path = base_path
+        self.key = base_path
+        self.log_path = base_path + LOG_SUFFIX
+        self.index_path = base_path + INDEX_SUFFIX
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.cipher = cipher  # Encrypts new lines; plaintext lines stay readable
+        self.offsets = array('Q')
+        self.size = 0  # End of the last complete record
+        self.garbage = 0  # Bytes of unreadable records still in the log
+        self.locked = False  # Holds sealed records this cipher cannot open: readable rows only, no writes
+        self.last_sync = time.monotonic()
+        self.dirty = False
+        self._log = None
+        self._index = None
+        self._open()
+
+    # ───────────── opening and recovery ─────────────
+    def _open(self):
+        directory = os.path.dirname(self.log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.log_path):
+            self._migrate_legacy()
+        if not os.path.exists(self.log_path):
+            open(self.log_path, "wb").close()
+
+        if not self._load_index():
+            self._rebuild_index()
+        self._log = open(self.log_path, "ab")
+        self._index = open(self.index_path, "ab")
+
+    def _load_index(self) -> bool:
+        """Load the sidecar index; False when it does not match the log."""
+        if not os.path.exists(self.index_path):
+            return os.path.getsize(self.log_path) == 0
+        offsets = array('Q')
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        if len(data) % offsets.itemsize:
+            return False
+        offsets.frombytes(data)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+
+        log_size = os.path.getsize(self.log_path)
+        if not offsets:
+            if log_size:
+                return False
+        else:
+            # The last indexed record must end exactly at the end of the log
+            with open(self.log_path, "rb") as f:
+                f.seek(offsets[-1])
+                line = f.readline()
+                if not line.endswith(b"\n") or f.tell() != log_size:
+                    return False
+        self.offsets = offsets
+        self.size = log_size
+        # The newest records tell whether this cipher can open the log
+        self.read_range(max(0, len(offsets) - self.KEY_PROBE_RECORDS))
+        return True
+
+    def _rebuild_index(self):
+        """Scan the log, drop a torn trailing record and rewrite the index."""
+        lines = []  # Position, length and kind of each complete line
+        sealed = opened = 0
+        position = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Torn write at the tail
+                payloads, line_sealed, line_opened = self._open_lines([line])
+                sealed += line_sealed
+                opened += line_opened
+                kind = "record" if self._parse(payloads) else "sealed" if line_sealed else "garbage"
+                lines.append((position, len(line), kind))
+                position += len(line)
+
+        # Not one sealed record opens: the key is wrong or missing, they are not garbage
+        self._note_key(sealed, opened)
+        self.offsets = array('Q')
+        self.garbage = 0
+        for line_position, length, kind in lines:
+            if kind == "record" or (kind == "sealed" and self.locked):
+                self.offsets.append(line_position)
+            else:
+                self.garbage += length
+        if position != os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(position)
+        self.size = position
+        self._write_index_file(self.index_path, self.offsets)
+
+    def _migrate_legacy(self):
+        """Convert a whole-file JSON conversation from older versions."""
+        legacy_path = self.base_path + LEGACY_SUFFIX
+        if not os.path.exists(legacy_path):
+            return
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self._write_files(records)
+        os.replace(legacy_path, legacy_path + ".bak")
+
+    # ───────────── reading ─────────────
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def read(self, position: int) -> Dict[str, Any]:
+        """Read one record by position."""
+        return self.read_range(position, position + 1)[0]
+
+    def read_range(self, start: int, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Read records [start, stop) with one seek."""
+        stop = len(self.offsets) if stop is None else min(stop, len(self.offsets))
+        if start >= stop:
+            return []
+        self._flush()
+        begin = self.offsets[start]
+        end = self.offsets[stop] if stop < len(self.offsets) else self.size
+        with open(self.log_path, "rb") as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+
+        return self._decode_lines(data.splitlines())
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        return self.read_range(0)
+
+    # ───────────── writing ─────────────
+    def append(self, record: Dict[str, Any]):
+        self.append_many([record])
+
+    def append_many(self, records: Iterable[Dict[str, Any]]):
+        """Append records and their offsets, then apply the fsync policy."""
+        self._check_writable()
+        lines = []
+        offsets = array('Q')
+        position = self.size
+        for line in self._encode_lines(records):
+            offsets.append(position)
+            lines.append(line)
+            position += len(line)
+        if not lines:
+            return
+
+        self._log.write(b"".join(lines))
+        self._index.write(self._index_bytes(offsets))
+        # Hand the bytes to the OS right away; a process crash loses nothing
+        self._flush()
+        self.offsets.extend(offsets)
+        self.size = position
+        self.dirty = True
+
+        if self.fsync_policy == "always":
+            self.sync()
+        elif self.fsync_policy == "batch" and time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def rewrite(self, records: List[Dict[str, Any]]):
+        """Replace the whole log atomically."""
+        self._check_writable()
+        self._close_handles()
+        self._write_files(records)
+        self.garbage = 0
+        self._log = open(self.log_path, "ab")
+        self._index = open(self.index_path, "ab")
+
+    def compact(self):
+        """Rewrite the log without its unreadable records."""
+        self._check_writable()
+        records = self.read_all()
+        if len(records) != len(self.offsets):
+            raise StorageKeyError(f"{self.log_path}: indexed records cannot be opened, not compacting")
+        self.rewrite(records)
+
+    def needs_compaction(self, threshold: float) -> bool:
+        return not self.locked and self.size > 0 and self.garbage / self.size >= threshold
+
+    def sync(self):
+        """Flush and fsync both files."""
+        if self._log is None:
+            return
+        self._flush()
+        if self.dirty:
+            os.fsync(self._log.fileno())
+            os.fsync(self._index.fileno())
+            self.dirty = False
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if self._log is None:
+            return
+        if self.fsync_policy != "never":
+            self.sync()
+        self._close_handles()
+
+    # ───────────── helpers ─────────────
+    def _encode_lines(self, records: Iterable[Dict[str, Any]]) -> List[bytes]:
+        payloads = [json.dumps(record, ensure_ascii=False).encode("utf-8") for record in records]
+        if self.cipher is None:
+            return [payload + b"\n" for payload in payloads]
+        return [base64.b64encode(token) + b"\n" for token in self.cipher.seal_many(payloads)]
+
+    def _decode_lines(self, lines: List[bytes]) -> List[Dict[str, Any]]:
+        """Parse stored lines, skipping unreadable ones. JSON lines are plaintext, others sealed."""
+        payloads, sealed, opened = self._open_lines(lines)
+        self._note_key(sealed, opened)
+        return self._parse(payloads)
+
+    def _open_lines(self, lines: List[bytes]) -> Tuple[List[Optional[bytes]], int, int]:
+        """Payload of each line (None when unreadable), the number of well-formed sealed lines and of those opened."""
+        payloads: List[Optional[bytes]] = []
+        sealed = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith(b"{"):
+                payloads.append(line)
+            else:
+                try:
+                    token = base64.b64decode(line, validate=True)
+                except ValueError:
+                    token = b""
+                if len(token) >= RecordCipher.NONCE_SIZE + RecordCipher.TAG_SIZE:
+                    sealed.append((len(payloads), token))
+                payloads.append(None)
+        opened = 0
+        if sealed and self.cipher is not None:
+            for (position, _), payload in zip(sealed, self.cipher.open_many([token for _, token in sealed])):
+                payloads[position] = payload
+                opened += payload is not None
+        return payloads, len(sealed), opened
+
+    def _note_key(self, sealed: int, opened: int):
+        if sealed and not opened:
+            self.locked = True
+
+    def _check_writable(self):
+        # Writing would mix keys in one log, and a rewrite would drop the records it cannot read
+        if self.locked:
+            reason = "wrong storage key" if self.cipher is not None else "encryption at rest disabled"
+            raise StorageKeyError(f"{self.log_path}: sealed records cannot be opened ({reason}), not writing")
+
+    @staticmethod
+    def _parse(payloads: List[Optional[bytes]]) -> List[Dict[str, Any]]:
+        records = []
+        for payload in payloads:
+            if payload is None:
+                continue  # Unreadable records are not indexed
+            try:
+                records.append(json.loads(payload))
+            except ValueError:
+                continue
+        return records
+
+    def _flush(self):
+        if self._log is not None:
+            self._log.flush()
+            self._index.flush()
+
+    def _close_handles(self):
+        if self._log is not None:
+            self._log.close()
+            self._index.close()
+        self._log = None
+        self._index = None
+
+    def _write_files(self, records: List[Dict[str, Any]]):
+        """Write log and index to temp files, fsync them and swap them in."""
+        offsets = array('Q')
+        position = 0
+        log_tmp = self.log_path + ".tmp"
+        with open(log_tmp, "wb") as f:
+            for line in self._encode_lines(records):
+                offsets.append(position)
+                f.write(line)
+                position += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+        index_tmp = self.index_path + ".tmp"
+        self._write_index_file(index_tmp, offsets)
+
+        os.replace(log_tmp, self.log_path)
+        os.replace(index_tmp, self.index_path)
+        self.offsets = offsets
+        self.size = position
+
+    @staticmethod
+    def _index_bytes(offsets: array) -> bytes:
+        if sys.byteorder != "little":
+            offsets = array('Q', offsets)
+            offsets.byteswap()
+        return offsets.tobytes()
+
+    def _write_index_file(self, path: str, offsets: array):
+        with open(path, "wb") as f:
+            f.write(self._index_bytes(offsets))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def conversation_path(folder: str, identifier: str) -> str:
+    """Base path (without suffix) of a conversation's files."""
+    return os.path.join(folder, identifier.replace('/', '_').replace(':', '_'))
+
+
+# ───────────────────────────── SQLite store ─────────────────────────────
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation TEXT NOT NULL,
+    message_id TEXT,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    message_type TEXT NOT NULL DEFAULT 'text',
+    sealed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (conversation, id);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_by_message_id ON messages (conversation, message_id)
+    WHERE message_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS files (
+    message_rowid INTEGER PRIMARY KEY REFERENCES messages (id) ON DELETE CASCADE,
+    sender TEXT,
+    filename TEXT,
+    file_size INTEGER,
+    file_type TEXT,
+    file_hash TEXT,
+    timestamp TEXT,
+    download_available INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_by_hash ON files (file_hash);
+CREATE TABLE IF NOT EXISTS previews (
+    message_rowid INTEGER PRIMARY KEY REFERENCES messages (id) ON DELETE CASCADE,
+    preview_hash TEXT NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, content='messages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+FILE_COLUMNS = ("sender", "filename", "file_size", "file_type", "file_hash", "timestamp", "download_available")
+
+
+class MessageStore:
+    """SQLite database holding every conversation, in WAL mode.
+
+    Writes are queued and applied by one writer thread in batched
+    transactions, so the event loop never waits on disk. Reads use a
+    separate connection; call flush() first to see queued writes. With a
+    cipher, message content and file names are stored sealed, and search
+    opens and matches rows in Python instead of using the FTS index.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 0.05,
+                 cipher: Optional[RecordCipher] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cipher = cipher
+        self.duplicates: Dict[str, int] = {}  # Rows dropped by the writer as duplicate message_ids, per conversation
+        self.locked: Set[str] = set()  # Conversations holding sealed rows the cipher cannot open
+
+        writer = self._connect(check_same_thread=False)  # Handed over to the writer thread
+        writer.executescript(SCHEMA)
+        columns = [row[1] for row in writer.execute("PRAGMA table_info(messages)")]
+        if "sealed" not in columns:
+            # Databases from before encryption at rest hold plaintext rows only
+            writer.execute("ALTER TABLE messages ADD COLUMN sealed INTEGER NOT NULL DEFAULT 0")
+        self.fts_enabled = False
+        if cipher is None:
+            try:
+                writer.executescript(FTS_SCHEMA)
+                self.fts_enabled = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search falls back to LIKE scans
+                pass
+        writer.commit()
+
+        self._reader = self._connect(check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Tuple[str, Any]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, args=(writer,), name="message-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    # ───────────── writer thread ─────────────
+    def _write_loop(self, connection: sqlite3.Connection):
+        running = True
+        while running:
+            operations = [self._queue.get()]
+            # Gather whatever else arrives within the flush interval, unless a reader is waiting
+            deadline = time.monotonic() + self.flush_interval
+            while len(operations) < self.batch_size and not (operations[-1] and operations[-1][0] == "barrier"):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    operations.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                with connection:
+                    for operation in operations:
+                        if operation is None:
+                            running = False
+                        elif operation[0] == "insert":
+                            self._insert(connection, *operation[1])
+                        elif operation[0] == "replace":
+                            conversation, records = operation[1]
+                            connection.execute("DELETE FROM messages WHERE conversation = ?", (conversation,))
+                            self._insert(connection, conversation, records)
+            except sqlite3.Error as e:
+                print(f"Error writing messages: {e}")
+            finally:
+                for operation in operations:
+                    if operation is not None and operation[0] == "barrier":
+                        operation[1].set()
+                    self._queue.task_done()
+        connection.close()
+
+    def _seal_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Copies of records with content, file names and preview hashes sealed, encrypted in one batch."""
+        texts = [record["content"] for record in records]
+        texts += [record["file_info"]["filename"] for record in records if record.get("file_info")]
+        texts += [record["preview_hash"] for record in records if record.get("preview_hash")]
+        sealed = iter(base64.b64encode(token).decode("ascii")
+                      for token in self.cipher.seal_many([text.encode("utf-8") for text in texts]))
+        copies = [dict(record, content=next(sealed)) for record in records]
+        for record in copies:
+            if record.get("file_info"):
+                record["file_info"] = dict(record["file_info"], filename=next(sealed))
+        for record in copies:
+            if record.get("preview_hash"):
+                record["preview_hash"] = next(sealed)
+        return copies
+
+    def _open_records(self, records: List[Dict[str, Any]]) -> bool:
+        """Reverse of _seal_records, in place; unreadable fields become empty strings.
+        False, leaving the records sealed, when not one field opens."""
+        if not records:
+            return True
+        if self.cipher is None:
+            return False
+        fields = [(record, "content") for record in records]
+        fields += [(record["file_info"], "filename") for record in records if "file_info" in record]
+        fields += [(record, "preview_hash") for record in records if "preview_hash" in record]
+        opened = self.cipher.open_many([base64.b64decode(holder[key]) for holder, key in fields])
+        if all(payload is None for payload in opened):
+            return False
+        for (holder, key), payload in zip(fields, opened):
+            holder[key] = "" if payload is None else payload.decode("utf-8")
+        return True
+
+    def _insert(self, connection: sqlite3.Connection, conversation: str, records: List[Dict[str, Any]]):
+        if self.cipher is not None:
+            records = self._seal_records(records)
+        sealed = int(self.cipher is not None)
+        insert_sql = ("INSERT OR IGNORE INTO messages (conversation, message_id, sender, content, timestamp, "
+                      "message_type, sealed) VALUES (?, ?, ?, ?, ?, ?, ?)")
+        plain: List[Dict[str, Any]] = []
+        inserted = 0
+        # Runs of plain messages go through executemany; file and preview messages need
+        # their rowid for the metadata row, and arrival order is kept across both
+        for record in records + [None]:
+            if record is not None and not (record.get("file_info") or record.get("preview_hash")):
+                plain.append(record)
+                continue
+            if plain:
+                inserted += connection.executemany(
+                    insert_sql,
+                    [(conversation, item.get("message_id"), item["sender"], item["content"],
+                      item["timestamp"], item.get("message_type", "text"), sealed) for item in plain]
+                ).rowcount
+                plain = []
+            if record is None:
+                break
+            cursor = connection.execute(
+                insert_sql,
+                (conversation, record.get("message_id"), record["sender"], record["content"],
+                 record["timestamp"], record.get("message_type", "file"), sealed)
+            )
+            inserted += cursor.rowcount
+            if cursor.rowcount and record.get("file_info"):
+                file_info = record["file_info"]
+                connection.execute(
+                    f"INSERT INTO files (message_rowid, {', '.join(FILE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, *(file_info.get(column) for column in FILE_COLUMNS))
+                )
+            if cursor.rowcount and record.get("preview_hash"):
+                connection.execute(
+                    "INSERT INTO previews (message_rowid, preview_hash) VALUES (?, ?)",
+                    (cursor.lastrowid, record["preview_hash"])
+                )
+        if inserted < len(records):
+            self.duplicates[conversation] = self.duplicates.get(conversation, 0) + len(records) - inserted
+
+    # ───────────── public API ─────────────
+    def insert(self, conversation: str, records: List[Dict[str, Any]]):
+        """Queue records for insertion; returns immediately."""
+        if records:
+            self._queue.put(("insert", (conversation, records)))
+
+    def replace(self, conversation: str, records: List[Dict[str, Any]]):
+        """Queue a replacement of a conversation's messages."""
+        self._queue.put(("replace", (conversation, records)))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued write is committed."""
+        done = threading.Event()
+        self._queue.put(("barrier", done))
+        return done.wait(timeout)
+
+    def count(self, conversation: str) -> int:
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation = ?", (conversation,)
+            ).fetchone()
+        return row[0]
+
+    def read_range(self, conversation: str, start: int, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Messages [start, stop) of a conversation in arrival order."""
+        limit = -1 if stop is None else max(0, stop - start)
+        _, records = self._read(conversation, "ORDER BY m.id LIMIT ? OFFSET ?", (limit, start))
+        return records
+
+    def read_page(self, conversation: str, before: Optional[int], limit: int) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """Row ids and messages of the `limit` messages before row id `before` (the newest
+        when None), in arrival order. A seek in the (conversation, id) index, however old the page."""
+        if before is None:
+            ids, records = self._read(conversation, "ORDER BY m.id DESC LIMIT ?", (limit,))
+        else:
+            ids, records = self._read(conversation, "AND m.id < ? ORDER BY m.id DESC LIMIT ?", (before, limit))
+        return ids[::-1], records[::-1]
+
+    def _read(self, conversation: str, query: str, args: Tuple) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """Row ids and readable messages of a conversation; sealed rows that cannot be opened are left out."""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT m.id, m.message_id, m.sender, m.content, m.timestamp, m.message_type, m.sealed, "
+                f"{', '.join('f.' + column for column in FILE_COLUMNS)}, f.message_rowid, p.preview_hash "
+                "FROM messages m LEFT JOIN files f ON f.message_rowid = m.id "
+                "LEFT JOIN previews p ON p.message_rowid = m.id "
+                f"WHERE m.conversation = ? {query}",
+                (conversation, *args)
+            ).fetchall()
+        records = [self._row_to_record(row[1:]) for row in rows]
+        # Rows written before encryption at rest was enabled stay plaintext
+        if not self._open_records([record for record, row in zip(records, rows) if row[6]]):
+            self.locked.add(conversation)
+            records = [record for record, row in zip(records, rows) if not row[6]]
+        return [row[0] for row in rows], records
+
+    @staticmethod
+    def _row_to_record(row) -> Dict[str, Any]:
+        message_id, sender, content, timestamp, message_type = row[:5]
+        record = {"sender": sender, "content": content, "timestamp": timestamp, "message_type": message_type}
+        if message_id is not None:
+            record["message_id"] = message_id
+        if row[-2] is not None:
+            file_info = dict(zip(FILE_COLUMNS, row[6:-2]))
+            file_info["download_available"] = bool(file_info["download_available"])
+            record["file_info"] = file_info
+        if row[-1] is not None:
+            record["preview_hash"] = row[-1]
+        return record
+
+    def search(self, query: str, conversation: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Full-text search over message content, newest first."""
+        terms = query.split()
+        if not terms:
+            return []
+        if self.cipher is not None:
+            return self._search_sealed(terms, conversation, limit)
+        # Sealed rows left from a session with encryption at rest are not searchable
+        scope = "AND m.sealed = 0 " + ("AND m.conversation = ? " if conversation else "")
+        scope_args = (conversation,) if conversation else ()
+
+        with self._read_lock:
+            if self.fts_enabled:
+                # Quote every term so user input is never parsed as FTS syntax
+                match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+                rows = self._reader.execute(
+                    "SELECT m.conversation, m.sender, m.content, m.timestamp, m.message_type "
+                    "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                    f"WHERE messages_fts MATCH ? {scope}ORDER BY m.id DESC LIMIT ?",
+                    (match, *scope_args, limit)
+                ).fetchall()
+            else:
+                like = " AND ".join("m.content LIKE ?" for _ in terms)
+                rows = self._reader.execute(
+                    "SELECT m.conversation, m.sender, m.content, m.timestamp, m.message_type "
+                    f"FROM messages m WHERE {like} {scope}ORDER BY m.id DESC LIMIT ?",
+                    (*[f"%{term}%" for term in terms], *scope_args, limit)
+                ).fetchall()
+
+        return [
+            {"conversation": row[0], "sender": row[1], "content": row[2], "timestamp": row[3], "message_type": row[4]}
+            for row in rows
+        ]
+
+    def _search_sealed(self, terms: List[str], conversation: Optional[str], limit: int,
+                       batch_size: int = 1000) -> List[Dict[str, Any]]:
+        """Search without an index: open rows newest first, a batch at a time, and match every term
+        case-insensitively. Rows sealed under another key are skipped."""
+        needles = [term.casefold() for term in terms]
+        scope = "AND m.conversation = ? " if conversation else ""
+        scope_args = (conversation,) if conversation else ()
+        results: List[Dict[str, Any]] = []
+        before = None
+        while len(results) < limit:
+            with self._read_lock:
+                rows = self._reader.execute(
+                    "SELECT m.id, m.conversation, m.sender, m.content, m.timestamp, m.message_type, m.sealed "
+                    f"FROM messages m WHERE {'m.id < ? ' if before is not None else '1 '}{scope}"
+                    "ORDER BY m.id DESC LIMIT ?",
+                    (*(() if before is None else (before,)), *scope_args, batch_size)
+                ).fetchall()
+            if not rows:
+                break
+            before = rows[-1][0]
+            contents: List[Optional[str]] = [row[3] for row in rows]
+            sealed = [n for n, row in enumerate(rows) if row[6]]
+            for n, payload in zip(sealed, self.cipher.open_many([base64.b64decode(rows[n][3]) for n in sealed])):
+                contents[n] = None if payload is None else payload.decode("utf-8")
+            for row, content in zip(rows, contents):
+                if content is not None and all(needle in content.casefold() for needle in needles):
+                    results.append({"conversation": row[1], "sender": row[2], "content": content,
+                                    "timestamp": row[4], "message_type": row[5]})
+                    if len(results) == limit:
+                        break
+        return results
+
+    def close(self):
+        """Commit queued writes and stop the writer thread."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+
+class StoredConversation:
+    """One conversation of a MessageStore, with the same interface as ConversationLog."""
+
+    def __init__(self, store: MessageStore, conversation: str):
+        self.store = store
+        self.conversation = conversation
+        self.key = f"sqlite:{conversation}"
+        # Queued rows are not visible to count() yet, so track the length here
+        self.length = store.count(conversation)
+        self._duplicates = store.duplicates.get(conversation, 0)
+        self._oldest: Optional[Tuple[int, int]] = None  # Position and row id of the oldest message paged in
+        if self.length:
+            # The newest rows tell whether this cipher can open the conversation
+            store.read_page(conversation, None, ConversationLog.KEY_PROBE_RECORDS)
+
+    @property
+    def locked(self) -> bool:
+        """Holds sealed rows the cipher cannot open: readable rows only, no writes."""
+        return self.conversation in self.store.locked
+
+    def __len__(self) -> int:
+        # Appended rows the writer dropped as duplicates since the last call no longer count
+        duplicates = self.store.duplicates.get(self.conversation, 0)
+        self.length -= duplicates - self._duplicates
+        self._duplicates = duplicates
+        return self.length
+
+    def read_range(self, start: int, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Messages [start, stop); waits for queued writes, so call it off the event loop."""
+        self.store.flush()
+        length = len(self)
+        stop = length if stop is None else min(stop, length)
+        if start >= stop:
+            return []
+        # History is paged newest first: continue from the oldest message read so far
+        if stop == length:
+            before = None
+        elif self._oldest is not None and self._oldest[0] == stop:
+            before = self._oldest[1]
+        else:
+            return self.store.read_range(self.conversation, start, stop)
+        ids, records = self.store.read_page(self.conversation, before, stop - start)
+        if ids:
+            self._oldest = (stop - len(ids), ids[0])
+        return records
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        return self.read_range(0)
+
+    def append(self, record: Dict[str, Any]):
+        self.append_many([record])
+
+    def append_many(self, records: Iterable[Dict[str, Any]]):
+        self._check_writable()
+        records = list(records)
+        self.store.insert(self.conversation, records)
+        self.length += len(records)
+
+    def rewrite(self, records: List[Dict[str, Any]]):
+        self._check_writable()
+        self.store.replace(self.conversation, records)
+        self.length = len(records)
+        self._duplicates = self.store.duplicates.get(self.conversation, 0)
+        self._oldest = None
+
+    def needs_compaction(self, threshold: float) -> bool:
+        return False
+
+    def compact(self):
+        pass
+
+    def sync(self):
+        self.store.flush()
+
+    def close(self):
+        # The store is shared between conversations and closed with the app
+        pass
+
+    def _check_writable(self):
+        if self.locked:
+            reason = "wrong storage key" if self.store.cipher is not None else "encryption at rest disabled"
+            raise StorageKeyError(f"{self.store.path}: {self.conversation} holds sealed messages that cannot be "
+                                  f"opened ({reason}), not writing")
+
+
+# ───────────────────────────── small JSON state files ─────────────────────────────
+def write_json_atomic(path: str, data: Any):
+    """Write data as JSON to a temp file, fsync it and swap it in."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotWriter:
+    """Coalesces saves of JSON state files and writes them off the caller's thread.
+
+    save() only records which file is dirty and how to snapshot it. The
+    writer thread waits `delay` seconds so a burst of changes becomes one
+    write per file, then snapshots, serializes and atomically replaces
+    each file. flush() writes everything pending before returning.
+    """
+
+    def __init__(self, delay: float = 0.5):
+        self.delay = delay
+        self.writes = 0  # Files written, for diagnostics
+        self._dirty: Dict[str, Callable[[], Any]] = {}
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()  # Serializes the thread and flush()
+        self._flush_requested = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def save(self, path: str, snapshot: Callable[[], Any]):
+        """Mark path dirty; snapshot() is called on the writer thread."""
+        with self._condition:
+            if self._closed:
+                write_json_atomic(path, snapshot())
+                return
+            self._dirty[path] = snapshot
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty and not self._closed:
+                    self._condition.wait()
+                if self._closed and not self._dirty:
+                    return
+                # Let the burst settle, unless a flush or shutdown comes first
+                deadline = time.monotonic() + self.delay
+                while not (self._flush_requested or self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._condition:
+                pending, self._dirty = self._dirty, {}
+                self._flush_requested = False
+            for path, snapshot in pending.items():
+                try:
+                    write_json_atomic(path, snapshot())
+                    self.writes += 1
+                except Exception as e:
+                    print(f"Error saving {path}: {e}")
+
+    def flush(self):
+        """Write every dirty file now, from the calling thread."""
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify()
+        self._write_pending()
+
+    def close(self):
+        """Flush and stop the writer thread; later saves are written synchronously."""
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+
+# Shared by the configuration manager and the application state
+snapshot_writer = SnapshotWriter()
+
+
+# ───────────────────────────── image previews ─────────────────────────────
+class PreviewCache:
+    """Content-addressed cache of rendered image previews.
+
+    Rendered previews are kept in a memory LRU bounded by their estimated
+    size in bytes, keyed by the SHA-256 of the source image plus whatever
+    the caller's rendering depends on (target size, quality). With a
+    folder, the source bytes of (small) previews are also stored there
+    by hash, so they can be rendered again after a restart; the folder is
+    trimmed to max_disk_bytes, least recently used first.
+    """
+
+    def __init__(self, max_bytes: int, folder: Optional[str] = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.folder = folder or None
+        self.max_disk_bytes = max_disk_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()  # Previews are rendered in worker threads
+        self._disk_size: Optional[int] = None
+        if self.folder:
+            os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key: Tuple) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple, value: Any, size: int):
+        """Cache a rendered preview; entries larger than the whole cache are not kept."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def _source_path(self, content_hash: str) -> str:
+        return os.path.join(self.folder, content_hash)
+
+    def store_source(self, data: bytes) -> str:
+        """Keep the source bytes on disk (when enabled) and return their hash."""
+        content_hash = self.content_hash(data)
+        if self.folder is None or len(data) > self.max_disk_bytes:
+            return content_hash
+        path = self._source_path(content_hash)
+        if os.path.exists(path):
+            os.utime(path)
+            return content_hash
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._disk_size is not None:
+                self._disk_size += len(data)
+        self._trim_disk()
+        return content_hash
+
+    def load_source(self, content_hash: str) -> Optional[bytes]:
+        """Source bytes stored under a hash, or None if they were never kept or were evicted."""
+        if self.folder is None or not all(c in "0123456789abcdef" for c in content_hash):
+            return None
+        path = self._source_path(content_hash)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Recently used, evicted last
+        except OSError:
+            return None
+        return data
+
+    def _trim_disk(self):
+        with self._lock:
+            files = None
+            if self._disk_size is None:
+                files = self._scan_folder()
+                self._disk_size = sum(size for _, size, _ in files)
+            if self._disk_size <= self.max_disk_bytes:
+                return
+            if files is None:
+                files = self._scan_folder()
+            files.sort(key=lambda item: item[2])
+            for path, size, _ in files:
+                if self._disk_size <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self._disk_size -= size
+                except OSError:
+                    pass
+
+    def _scan_folder(self) -> List[Tuple[str, int, float]]:
+        files = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
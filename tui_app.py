@@ -12,14 +12,23 @@ import base64
 import hashlib
 import mimetypes
 import shutil
+import heapq
+import itertools
+import time
+import zlib
 from datetime import datetime
+from io import BytesIO
 import threading
 import concurrent.futures
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple, Union, Any
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, Any
 from dataclasses import dataclass, field
+from collections import OrderedDict
 from textual.app import App, ComposeResult
 from textual.containers import Container, ScrollableContainer, Horizontal, Vertical
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.geometry import Region, Size
 from textual.widgets import Header, Footer, Input, Label, Static, Button, DirectoryTree, DataTable
 from textual.reactive import reactive
 from textual.screen import ModalScreen
@@ -32,7 +41,7 @@ mimetypes.add_type("image/svg+xml", ".svg")
 from PIL import Image, ImageOps
 from rich_pixels import Pixels
 # from textual_slider import Slider  # Not available, use regular Input instead
-from aes.encryption import encrypt, decrypt
+from aes.encryption import encrypt, decrypt, decrypt_blocks, encrypt_blocks, expand_key
 from diffie_hellman.diffie_hellman import (
     generate_parameters,
     generate_private_key,
@@ -40,6 +49,12 @@ from diffie_hellman.diffie_hellman import (
     compute_shared_key,
 )
 from textual_filedrop import FileDrop, getfiles
+from config import config_manager
+from imaging import (ImageWorkerPool, RequestDropped, fit_within, image_to_ascii, render_ascii, render_still,
+                     shrink_for_preview)
+from search import SearchableDirectoryTree
+from storage import (ConversationLog, MessageStore, PreviewCache, RecordCipher, StoredConversation,
+                     conversation_path, load_storage_key, snapshot_writer)
 
 # ──────────────────────────── Data Classes ────────────────────────────
 @dataclass
@@ -84,7 +99,38 @@ class Group:
     def from_dict(cls, data: dict) -> "Group":
         return cls(**data)
 
-@dataclass
+TIME_FORMAT = "%H:%M:%S"  # Timestamps exchanged with peers
+
+def parse_timestamp(value: Union[int, float, str, None]) -> int:
+    """Epoch seconds for a stored or received timestamp.
+    
+    Peers send HH:MM:SS strings (taken as today), older history may hold
+    ISO dates, and records written since are plain epoch seconds."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not value:
+        return int(time.time())
+    if value.isdigit():
+        return int(value)
+    try:
+        if len(value) == 8 and value[2] == ":" and value[5] == ":":
+            hour, minute, second = value.split(":")
+            parsed = datetime.now().replace(hour=int(hour), minute=int(minute), second=int(second), microsecond=0)
+        else:
+            parsed = datetime.fromisoformat(value)
+        return int(parsed.timestamp())
+    except ValueError:
+        return int(time.time())
+
+def format_timestamp(value: Union[int, str], fmt: str = TIME_FORMAT) -> str:
+    """Display form of a timestamp; strings are shown as received."""
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value).strftime(fmt)
+    return value
+
+# Message records are kept for every line of every open conversation, so they
+# use __slots__, intern their repeated strings and store timestamps as ints.
+@dataclass(slots=True)
 class FileMessage:
     """Represents a file message for conversation storage."""
     sender: str
@@ -92,9 +138,13 @@ class FileMessage:
     file_size: int
     file_type: str
     file_hash: str
-    timestamp: str
+    timestamp: int  # Epoch seconds
     download_available: bool = True
     
+    def __post_init__(self):
+        self.sender = sys.intern(self.sender)
+        self.timestamp = parse_timestamp(self.timestamp)
+    
     def to_dict(self) -> dict:
         return {
             "sender": self.sender,
@@ -110,14 +160,21 @@ class FileMessage:
     def from_dict(cls, data: dict) -> "FileMessage":
         return cls(**data)
 
-@dataclass
+@dataclass(slots=True)
 class ConversationMessage:
     """Represents a message in conversation history."""
     sender: str
     content: str
-    timestamp: str
+    timestamp: int  # Epoch seconds
     message_type: str = "text"  # text, file, system
     file_info: Optional[FileMessage] = None
+    message_id: Optional[str] = None  # Mesh message ID, for received messages
+    preview_hash: Optional[str] = None  # Image messages: key of the preview in preview_cache
+    
+    def __post_init__(self):
+        self.sender = sys.intern(self.sender)
+        self.message_type = sys.intern(self.message_type)
+        self.timestamp = parse_timestamp(self.timestamp)
     
     def to_dict(self) -> dict:
         result = {
@@ -128,6 +185,10 @@ class ConversationMessage:
         }
         if self.file_info:
             result["file_info"] = self.file_info.to_dict()
+        if self.message_id:
+            result["message_id"] = self.message_id
+        if self.preview_hash:
+            result["preview_hash"] = self.preview_hash
         return result
     
     @classmethod
@@ -140,10 +201,128 @@ class ConversationMessage:
             content=data["content"],
             timestamp=data["timestamp"],
             message_type=data.get("message_type", "text"),
-            file_info=file_info
+            file_info=file_info,
+            message_id=data.get("message_id"),
+            preview_hash=data.get("preview_hash")
         )
 
-@dataclass
+# Outbound priorities, lower values are sent first
+PRIORITY_CONTROL = 0  # hello, peer list, DH exchange
+PRIORITY_TEXT = 1
+PRIORITY_IMAGE = 2
+PRIORITY_FILE = 3
+
+MESSAGE_PRIORITIES = {
+    "text": PRIORITY_TEXT,
+    "image": PRIORITY_IMAGE,
+    "file": PRIORITY_FILE,
+}
+
+class PeerOutbox:
+    """Prioritized outbound queues for one peer with byte-based backpressure.
+    
+    Control and text frames go through an interactive lane and images/files
+    through a bulk lane, so a large file in flight never delays a chat line.
+    Within a lane, producers wait once more than `high_watermark` bytes are
+    queued and resume when its backlog drains below `low_watermark`; control
+    frames never wait.
+    """
+    
+    LANES = ("interactive", "bulk")
+    
+    def __init__(self, transmit, high_watermark: int, low_watermark: int):
+        self._transmit = transmit  # async (message: str) -> bool
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self._queues: Dict[str, list] = {lane: [] for lane in self.LANES}
+        self._queued_bytes: Dict[str, int] = {lane: 0 for lane in self.LANES}
+        self._writable: Dict[str, asyncio.Event] = {lane: asyncio.Event() for lane in self.LANES}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}  # Future of the frame each lane is sending
+        self._counter = itertools.count()
+        self._closed = False
+        for event in self._writable.values():
+            event.set()
+    
+    @property
+    def queued_bytes(self) -> int:
+        """Total bytes waiting to be sent to this peer."""
+        return sum(self._queued_bytes.values())
+    
+    @staticmethod
+    def priority_for(payload: dict) -> int:
+        """Get the outbound priority of a JSON payload."""
+        return MESSAGE_PRIORITIES.get(payload.get("type"), PRIORITY_CONTROL)
+    
+    async def send(self, payload: dict) -> bool:
+        """Queue a payload and wait until it has been delivered (or failed)."""
+        priority = self.priority_for(payload)
+        lane = "interactive" if priority <= PRIORITY_TEXT else "bulk"
+        
+        # Backpressure: wait for the lane to drain before serializing more data
+        if priority != PRIORITY_CONTROL:
+            await self._writable[lane].wait()
+        if self._closed:
+            return False
+        
+        message = json.dumps(payload)
+        size = len(message)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[lane], (priority, next(self._counter), message, size, future))
+        
+        self._queued_bytes[lane] += size
+        if self._queued_bytes[lane] >= self.high_watermark:
+            self._writable[lane].clear()
+        
+        worker = self._workers.get(lane)
+        if worker is None or worker.done():
+            self._workers[lane] = asyncio.create_task(self._drain(lane))
+        
+        return await future
+    
+    async def _drain(self, lane: str):
+        """Send queued frames of a lane in priority order until it is empty."""
+        queue = self._queues[lane]
+        while queue:
+            _, _, message, size, future = heapq.heappop(queue)
+            self._in_flight[lane] = future
+            delivered = False
+            try:
+                delivered = await self._transmit(message)
+            except Exception:
+                pass
+            finally:
+                # Also reached when close() cancels the worker mid-send
+                self._in_flight.pop(lane, None)
+                self._release(lane, size)
+                if not future.done():
+                    future.set_result(delivered)
+    
+    def _release(self, lane: str, size: int):
+        """Account for a frame leaving a lane."""
+        self._queued_bytes[lane] -= size
+        if self._queued_bytes[lane] <= self.low_watermark:
+            self._writable[lane].set()
+    
+    def close(self):
+        """Drop everything still queued and stop the lane workers."""
+        self._closed = True
+        for lane, queue in self._queues.items():
+            while queue:
+                _, _, _, size, future = heapq.heappop(queue)
+                self._release(lane, size)
+                if not future.done():
+                    future.set_result(False)
+        for future in self._in_flight.values():
+            if not future.done():
+                future.set_result(False)
+        for worker in self._workers.values():
+            worker.cancel()
+        self._workers.clear()
+        for event in self._writable.values():
+            event.set()
+
+@dataclass(slots=True)
 class PeerConnection:
     """Represents a connection to a peer."""
     ip: str
@@ -154,6 +333,26 @@ class PeerConnection:
     websocket: Optional[Any] = None
     connection_established: bool = False
     contact_name: Optional[str] = None  # Associated contact name
+    outbox: Optional[PeerOutbox] = None  # Created on first send
+    compression: Optional[str] = None  # Codec negotiated during the handshake
+    heartbeat: bool = False  # Peer answers pings; older versions don't advertise it
+    bytes_saved: int = 0  # Payload bytes saved by compression towards this peer
+    
+    # Liveness tracking
+    liveness: str = "alive"  # alive, suspect
+    last_seen: float = field(default_factory=time.monotonic)
+    last_ping: float = 0.0
+    rtt: Optional[float] = None  # Smoothed round-trip time in seconds
+    pending_pings: Dict[str, float] = field(default_factory=dict)
+    
+    def mark_seen(self):
+        """Record that the peer just sent us something."""
+        self.last_seen = time.monotonic()
+        self.liveness = "alive"
+    
+    def record_rtt(self, sample: float):
+        """Fold a new round-trip sample into the smoothed RTT."""
+        self.rtt = sample if self.rtt is None else 0.8 * self.rtt + 0.2 * sample
 
 @dataclass 
 class DHExchange:
@@ -163,6 +362,21 @@ class DHExchange:
     public_key: Optional[int] = None
     completed: bool = False
 
+@dataclass(eq=False)
+class HistoryPage:
+    """Messages [start, stop) of a stored conversation, paged in while scrolling up.
+    
+    `messages` is None once the page was dropped to bound memory; it is
+    read again from `log` when it is scrolled back into view."""
+    log: Any
+    start: int
+    stop: int
+    messages: Optional[List[ConversationMessage]] = None
+
+def peer_rtt_order(peer: PeerConnection) -> Tuple[int, float]:
+    """Sort key putting live peers with the lowest RTT first."""
+    return (peer.liveness != "alive", peer.rtt if peer.rtt is not None else float("inf"))
+
 @dataclass
 class AppState:
     """Central application state."""
@@ -196,6 +410,13 @@ class AppState:
     groups: Dict[str, Group] = field(default_factory=dict)
     current_conversation: List[ConversationMessage] = field(default_factory=list)
     current_group: Optional[str] = None
+    conversation_log: Optional[Union[ConversationLog, StoredConversation]] = None  # Where current_conversation is persisted
+    message_store: Optional[MessageStore] = None  # Opened on first use with the sqlite backend
+    record_cipher: Optional[RecordCipher] = None  # Storage key, derived once per session
+    persisted_count: int = 0  # Messages of current_conversation already in conversation_log
+    history_start: int = 0  # Position in conversation_log of the oldest message in view
+    history_pages: List[HistoryPage] = field(default_factory=list)  # Older pages in view, oldest first
+    load_generation: int = 0  # Bumped by each conversation load, so only the latest one is shown
     
     def __post_init__(self):
         """Initialize folders and load data."""
@@ -231,9 +452,14 @@ class AppState:
             if contact.ip == ip and contact.port == port:
                 contact_name = name
                 contact.last_connected = datetime.now().isoformat()
+                self.save_contacts()
                 break
         
         peer = PeerConnection(ip=ip, port=port, websocket=websocket, contact_name=contact_name)
+        previous = self.peers.get(key)
+        if previous and previous.outbox:
+            # Keep frames already queued for this peer
+            peer.outbox = previous.outbox
         self.peers[key] = peer
         self.dh_exchanges[key] = DHExchange()
         return peer
@@ -246,27 +472,50 @@ class AppState:
     def remove_peer(self, ip: str, port: int):
         """Remove a peer connection."""
         key = self.get_peer_key(ip, port)
-        self.peers.pop(key, None)
+        peer = self.peers.pop(key, None)
+        if peer and peer.outbox:
+            peer.outbox.close()
         self.dh_exchanges.pop(key, None)
         self.hello_done.discard(key)
     
+    def clear_peers(self):
+        """Drop every peer connection and its queued frames."""
+        for peer in self.peers.values():
+            if peer.outbox:
+                peer.outbox.close()
+        self.peers.clear()
+        self.dh_exchanges.clear()
+        self.hello_done.clear()
+    
     def get_ready_peers(self) -> List[PeerConnection]:
         """Get all peers with established encryption."""
         return [peer for peer in self.peers.values() if peer.encryption_ready and peer.connection_established]
-    
+
+    def get_self_key(self) -> str:
+        """Get the mesh key identifying this node."""
+        return self.get_peer_key(self.local_ip, self.port)
+
+    def get_relay_targets(self, reached: Set[str], exclude_peer: Optional[str] = None) -> List[PeerConnection]:
+        """Get ready peers that still need a relayed copy of a message, fastest first."""
+        targets = []
+        for peer in self.get_ready_peers():
+            peer_key = self.get_peer_key(peer.ip, peer.port)
+            if peer_key != exclude_peer and peer_key not in reached:
+                targets.append(peer)
+        return sorted(targets, key=peer_rtt_order)
+
     def get_connected_peer_count(self) -> int:
         """Get count of fully connected peers."""
         return len(self.get_ready_peers())
     
     # Contact management
     def save_contacts(self):
-        """Save contacts to file."""
-        try:
-            data = {name: contact.to_dict() for name, contact in self.contacts.items()}
-            with open("data/contacts.json", "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error saving contacts: {e}")
+        """Schedule a save of contacts to file (coalesced, written in the background)."""
+        snapshot_writer.save("data/contacts.json", self.contacts_snapshot)
+    
+    def contacts_snapshot(self) -> dict:
+        # list() copies the items at once, so the writer thread never sees the dict change
+        return {name: contact.to_dict() for name, contact in list(self.contacts.items())}
     
     def load_contacts(self):
         """Load contacts from file."""
@@ -306,13 +555,12 @@ class AppState:
     
     # Group management
     def save_groups(self):
-        """Save groups to file."""
-        try:
-            data = {name: group.to_dict() for name, group in self.groups.items()}
-            with open("data/groups.json", "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error saving groups: {e}")
+        """Schedule a save of groups to file (coalesced, written in the background)."""
+        snapshot_writer.save("data/groups.json", self.groups_snapshot)
+    
+    def groups_snapshot(self) -> dict:
+        return {name: dict(group.to_dict(), contacts=list(group.contacts))
+                for name, group in list(self.groups.items())}
     
     def load_groups(self):
         """Load groups from file."""
@@ -333,43 +581,193 @@ class AppState:
         return True
     
     # Conversation management
+    def get_record_cipher(self) -> Optional[RecordCipher]:
+        """Cipher for encrypted-at-rest history, or None when it is disabled."""
+        storage_config = config_manager.get_storage_config()
+        if not storage_config.encrypt_at_rest:
+            return None
+        if self.record_cipher is None:
+            self.record_cipher = RecordCipher(load_storage_key(storage_config.key_file, storage_config.kdf_iterations))
+        return self.record_cipher
+    
+    def open_storage(self):
+        """Derive the storage key and open the message store now, on the event loop.
+        
+        Executor threads reading history then find them ready: two threads
+        opening the store at once would start two writers on one database."""
+        if config_manager.get_storage_config().backend == "sqlite":
+            self.get_message_store()
+        else:
+            self.get_record_cipher()
+    
+    def get_message_store(self) -> MessageStore:
+        if self.message_store is None:
+            self.message_store = MessageStore(config_manager.get_storage_config().database_path,
+                                              cipher=self.get_record_cipher())
+        return self.message_store
+    
+    def open_conversation_log(self, identifier: str) -> Union[ConversationLog, StoredConversation]:
+        """Open where a conversation is stored, compacting an append-only log if needed."""
+        storage_config = config_manager.get_storage_config()
+        if storage_config.backend == "sqlite":
+            key = f"sqlite:{identifier}"
+        else:
+            base_path = conversation_path(storage_config.conversations_folder, identifier)
+            key = base_path
+        if self.conversation_log and self.conversation_log.key == key:
+            return self.conversation_log
+        
+        if storage_config.backend == "sqlite":
+            return StoredConversation(self.get_message_store(), identifier)
+        log = ConversationLog(base_path, storage_config.fsync_policy, storage_config.fsync_interval,
+                              cipher=self.get_record_cipher())
+        if log.needs_compaction(storage_config.compaction_threshold):
+            log.compact()
+        return log
+    
+    def switch_conversation_log(self, log: ConversationLog):
+        if self.conversation_log is not None and self.conversation_log is not log:
+            self.conversation_log.close()
+        self.conversation_log = log
+    
     def save_conversation(self, identifier: str):
-        """Save current conversation to file."""
+        """Append messages of the current conversation that are not stored yet."""
         try:
-            filename = f"conversations/{identifier.replace('/', '_').replace(':', '_')}.json"
-            data = [msg.to_dict() for msg in self.current_conversation]
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            log = self.open_conversation_log(identifier)
+            if log is not self.conversation_log:
+                # Whatever the log already holds stays; the page on screen came from
+                # another log, so there is no older page of this one to load
+                self.switch_conversation_log(log)
+                self.history_start = 0
+            log.append_many(msg.to_dict() for msg in self.current_conversation[self.persisted_count:])
+            self.persisted_count = len(self.current_conversation)
         except Exception as e:
             print(f"Error saving conversation: {e}")
     
-    def load_conversation(self, identifier: str) -> bool:
-        """Load conversation from file."""
+    def read_conversation(self, identifier: str) -> Optional[Tuple[Union[ConversationLog, StoredConversation], int, List[dict]]]:
+        """Open a conversation and read its newest page, None when it is empty.
+
+        Blocking (disk, queued database writes): the app runs it in an executor."""
+        log = self.open_conversation_log(identifier)
+        if not len(log):
+            if log is not self.conversation_log:
+                log.close()
+            return None
+        page_size = config_manager.get_ui_config().history_page_size
+        start = max(0, len(log) - page_size)
         try:
-            filename = f"conversations/{identifier.replace('/', '_').replace(':', '_')}.json"
-            if os.path.exists(filename):
-                with open(filename, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.current_conversation = [ConversationMessage.from_dict(msg) for msg in data]
-                return True
+            return log, start, log.read_range(start)
+        except Exception:
+            if log is not self.conversation_log:
+                log.close()
+            raise
+    
+    def show_page(self, page) -> bool:
+        """Make a page from read_conversation the current conversation."""
+        if page is None:
+            return False
+        log, start, records = page
+        self.history_start = start
+        self.history_pages = []
+        self.current_conversation = [ConversationMessage.from_dict(msg) for msg in records]
+        self.persisted_count = len(self.current_conversation)
+        self.switch_conversation_log(log)
+        return True
+    
+    async def load_conversation_async(self, identifier: str) -> Optional[bool]:
+        """Load the newest page of a conversation, read in an executor; older pages come from
+        load_older_messages. None if another load started meanwhile."""
+        self.load_generation += 1
+        generation = self.load_generation
+        page = None
+        try:
+            self.open_storage()
+            loop = asyncio.get_event_loop()
+            page = await loop.run_in_executor(None, self.read_conversation, identifier)
+            if (page is not None and self.conversation_log is not None and page[0] is not self.conversation_log
+                    and page[0].key == self.conversation_log.key):
+                # A message was saved there meanwhile, through another handle: read it again through that one
+                page[0].close()
+                page = await loop.run_in_executor(None, self.read_conversation, identifier)
         except Exception as e:
             print(f"Error loading conversation: {e}")
-        return False
+        if generation != self.load_generation:
+            if page is not None and page[0] is not self.conversation_log:
+                page[0].close()
+            return None
+        return self.show_page(page)
+    
+    async def load_older_messages(self) -> Optional[HistoryPage]:
+        """Read the page of history just before the oldest one in view and add it to history_pages."""
+        log, stop = self.conversation_log, self.history_start
+        if not stop or log is None:
+            return None
+        page_size = config_manager.get_ui_config().history_page_size
+        page = HistoryPage(log, max(0, stop - page_size), stop)
+        if not await self.read_history_page(page) or stop != self.history_start:
+            return None
+        self.history_start = page.start
+        self.history_pages.insert(0, page)
+        return page
+    
+    async def read_history_page(self, page: HistoryPage) -> bool:
+        """Read a page's messages in an executor; False if its conversation is not the open one."""
+        if page.log is not self.conversation_log:
+            return False
+        try:
+            loop = asyncio.get_event_loop()
+            records = await loop.run_in_executor(None, page.log.read_range, page.start, page.stop)
+            messages = [ConversationMessage.from_dict(msg) for msg in records]
+        except Exception as e:
+            print(f"Error loading conversation: {e}")
+            return False
+        if page.log is not self.conversation_log:
+            return False  # Another conversation was opened meanwhile
+        page.messages = messages
+        return True
+    
+    def loaded_messages(self) -> Iterator[ConversationMessage]:
+        """Messages in memory, oldest first: the older pages still loaded, then the current ones."""
+        for page in self.history_pages:
+            if page.messages is not None:
+                yield from page.messages
+        yield from self.current_conversation
+    
+    def close_conversation(self):
+        """Sync and close the current conversation log and the message store."""
+        if self.conversation_log is not None:
+            self.conversation_log.close()
+            self.conversation_log = None
+        self.persisted_count = 0
+        self.history_start = 0
+        self.history_pages = []
+        if self.message_store is not None:
+            self.message_store.close()
+            self.message_store = None
+    
+    def search_messages(self, query: str) -> List[dict]:
+        """Full-text search over stored messages (sqlite backend); blocking, after open_storage."""
+        store = self.get_message_store()
+        store.flush()
+        return store.search(query)
+    
+    def get_conversation_identifier(self) -> Optional[str]:
+        """Identifier the current conversation is saved under, if any."""
+        if self.current_group:
+            return f"group_{self.current_group}"
+        # Save with peer info if available
+        peers = self.get_ready_peers()
+        if peers:
+            peer_names = [p.contact_name or f"{p.ip}_{p.port}" for p in peers]
+            return "_".join(sorted(peer_names))
+        return None
     
     def add_message_to_conversation(self, message: ConversationMessage):
-        """Add a message to current conversation."""
+        """Add a message to current conversation and append it to the log."""
         self.current_conversation.append(message)
-        # Auto-save every 10 messages or if it's a file
-        if len(self.current_conversation) % 10 == 0 or message.message_type == "file":
-            if self.current_group:
-                self.save_conversation(f"group_{self.current_group}")
-            else:
-                # Save with peer info if available
-                peers = self.get_ready_peers()
-                if peers:
-                    peer_names = [p.contact_name or f"{p.ip}_{p.port}" for p in peers]
-                    identifier = "_".join(sorted(peer_names))
-                    self.save_conversation(identifier)
+        identifier = self.get_conversation_identifier()
+        if identifier:
+            self.save_conversation(identifier)
 
 # Global app state
 app_state = AppState()
@@ -414,19 +812,76 @@ def generate_message_id() -> str:
     random_part = random.randint(10000, 99999)
     return f"{app_state.username}_{timestamp}_{random_part}"
 
-def get_file_info(file_path: str) -> Tuple[str, int, str, str]:
-    """Get file information: name, size, type, hash."""
+def get_display_info(file_path: str) -> Tuple[str, int, str]:
+    """Get file information for display: name, size, type, without reading the file."""
     filename = os.path.basename(file_path)
     file_size = os.path.getsize(file_path)
     file_type, _ = mimetypes.guess_type(file_path)
     if not file_type:
         file_type = "application/octet-stream"
-    
-    # Calculate hash for integrity
+    return filename, file_size, file_type
+
+FILE_HASH_CHUNK = 1024 * 1024  # bytes read at a time when hashing a file
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 of a file, read in chunks rather than all at once."""
+    digest = hashlib.sha256()
     with open(file_path, 'rb') as f:
-        file_hash = hashlib.sha256(f.read()).hexdigest()
+        for chunk in iter(lambda: f.read(FILE_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FileInfoCache:
+    """Name, size, type and hash of outgoing files, hashed once per version of a file.
+    
+    Entries are keyed by (path, size, mtime, inode), so a file modified or
+    replaced is hashed again. Callers asking for a file being hashed wait
+    for that hash instead of starting another one.
+    """
     
-    return filename, file_size, file_type, file_hash
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hashes = 0  # Files hashed, for diagnostics
+        self._entries: "OrderedDict[Tuple, Tuple[str, int, str, str]]" = OrderedDict()
+        self._hashing: Dict[Tuple, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, file_path: str) -> Tuple[str, int, str, str]:
+        """Get file information: name, size, type, hash (blocking on a first hash)."""
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        with self._lock:
+            info = self._entries.get(key)
+            if info is not None:
+                self._entries.move_to_end(key)
+                return info
+            hashing = self._hashing.get(key)
+            if hashing is None:
+                self._hashing[key] = concurrent.futures.Future()
+        if hashing is not None:
+            return hashing.result()
+        
+        try:
+            filename, _, file_type = get_display_info(file_path)
+            info = (filename, stat.st_size, file_type, hash_file(file_path))
+        except BaseException as e:
+            with self._lock:
+                self._hashing.pop(key).set_exception(e)
+            raise
+        with self._lock:
+            self.hashes += 1
+            self._entries[key] = info
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._hashing.pop(key).set_result(info)
+        return info
+    
+    async def get_async(self, file_path: str) -> Tuple[str, int, str, str]:
+        """get() run off the event loop."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.get, file_path)
+
+file_info_cache = FileInfoCache()
 
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format."""
@@ -444,72 +899,469 @@ def is_image_file(filename: str) -> bool:
     """Check if file is an image."""
     return filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tiff', '.svg'))
 
-async def process_image_for_display_async(image_path: str) -> Union[Pixels, str, List[Pixels]]:
-    """Process image for display in chat, handling both static images and animated GIFs."""
-    def _process_image():
-        try:
-            with Image.open(image_path) as img:
-                # Check if it's an animated GIF
-                if hasattr(img, 'is_animated') and img.is_animated:
-                    # Process GIF frames
-                    frames = []
-                    frame_count = getattr(img, 'n_frames', 1)
-                    
-                    # Limit frames for performance
-                    max_frames = min(frame_count, 10)
-                    
-                    for frame_num in range(max_frames):
-                        img.seek(frame_num)
-                        frame = img.copy()
-                        if frame.mode != 'RGB':
-                            frame = frame.convert('RGB')
-                        
-                        # Get chat display dimensions
-                        width, height = app_state.get_image_dimensions()
-                        
-                        # Resize frame maintaining aspect ratio
-                        img_width, img_height = frame.size
-                        aspect_ratio = img_width / img_height
-                        
-                        if aspect_ratio > width / height:
-                            new_width = width
-                            new_height = int(new_width / aspect_ratio)
-                        else:
-                            new_height = height
-                            new_width = int(new_height * aspect_ratio)
-                        
-                        resized_frame = frame.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                        frames.append(Pixels.from_image(resized_frame))
-                    
-                    return frames
+# ─────────────────────────── Wire compression ───────────────────────────
+# Payloads are compressed before encryption (ciphertext doesn't compress)
+SUPPORTED_COMPRESSION = ["zlib"]
+
+def advertised_compression() -> List[str]:
+    """Codecs this node offers in its handshake."""
+    return SUPPORTED_COMPRESSION if config_manager.get_network_config().compression_enabled else []
+
+def negotiate_compression(offered) -> Optional[str]:
+    """Pick the codec to use with a peer from the codecs it offered."""
+    for codec in advertised_compression():
+        if offered and codec in offered:
+            return codec
+    return None
+
+def decompress_payload(encoded: str) -> bytes:
+    """Decode a compressed payload, refusing anything larger than a file may be."""
+    limit = app_state.max_file_size * 2
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(base64.b64decode(encoded), limit)
+    if decompressor.unconsumed_tail:
+        raise ValueError("Données décompressées trop volumineuses")
+    return data
+
+class WirePayload:
+    """A text, image or file payload with its compressed form computed at most once.
+    
+    `plain` is what goes through `encrypt` when the peer doesn't support
+    compression (the message text, or the base64 of the file bytes).
+    """
+    
+    def __init__(self, plain: Optional[str] = None, raw: Optional[bytes] = None,
+                 filename: Optional[str] = None, is_text: bool = False):
+        self._plain = plain
+        self._raw = raw
+        self.filename = filename
+        self.is_text = is_text
+        self._compressed: Optional[str] = None
+        self._compressed_done = False
+        self._compressing: Optional[asyncio.Future] = None  # Shared by the peers waiting for it
+    
+    @classmethod
+    def from_text(cls, message: str) -> "WirePayload":
+        return cls(plain=message, is_text=True)
+    
+    @classmethod
+    def from_b64(cls, data_b64: str, filename: Optional[str] = None) -> "WirePayload":
+        return cls(plain=data_b64, filename=filename)
+    
+    @classmethod
+    def from_file(cls, file_path: str) -> "WirePayload":
+        with open(file_path, 'rb') as f:
+            return cls(raw=f.read(), filename=os.path.basename(file_path))
+    
+    @property
+    def plain(self) -> str:
+        if self._plain is None:
+            self._plain = base64.b64encode(self._raw).decode('utf-8')
+        return self._plain
+    
+    @property
+    def plain_size(self) -> int:
+        """Length of `plain`, without base64-encoding the file bytes to find out."""
+        if self._plain is None:
+            return (len(self._raw) + 2) // 3 * 4
+        return len(self._plain)
+    
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = self._plain.encode('utf-8') if self.is_text else base64.b64decode(self._plain)
+        return self._raw
+    
+    @property
+    def compressed(self) -> Optional[str]:
+        """Base64 of the zlib stream, or None when compressing doesn't pay off."""
+        if not self._compressed_done:
+            self._compressed_done = True
+            network_config = config_manager.get_network_config()
+            skip = config_manager.get_file_config().compressed_extensions
+            extension = os.path.splitext(self.filename or "")[1].lower()
+            if self.plain_size >= network_config.compression_min_size and extension not in skip:
+                encoded = base64.b64encode(zlib.compress(self.raw, network_config.compression_level)).decode('ascii')
+                if len(encoded) < self.plain_size:
+                    self._compressed = encoded
+        return self._compressed
+    
+    def for_peer(self, peer: PeerConnection) -> Tuple[str, Optional[str]]:
+        """Get the body to encrypt for a peer and its encoding tag."""
+        if peer.compression and self.compressed is not None:
+            peer.bytes_saved += self.plain_size - len(self.compressed)
+            return self.compressed, peer.compression
+        return self.plain, None
+    
+    async def encrypt_for_peer(self, peer: PeerConnection) -> Tuple[str, Optional[str]]:
+        """Encrypted body for a peer and its encoding tag.
+        
+        Compression runs once in an executor and is shared by every peer;
+        encoding and encryption run on encrypt_executor, so large payloads
+        never stall the event loop."""
+        if peer.compression:
+            if self._compressing is None and not self._compressed_done:
+                loop = asyncio.get_event_loop()
+                self._compressing = loop.run_in_executor(None, lambda: self.compressed)
+            if self._compressing is not None:
+                await asyncio.shield(self._compressing)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(encrypt_executor, self._encrypt_for_peer, peer)
+    
+    def _encrypt_for_peer(self, peer: PeerConnection) -> Tuple[str, Optional[str]]:
+        body, encoding = self.for_peer(peer)
+        return encrypt_chunked(body, peer.shared_key), encoding
+
+def decode_text_body(body: str, encoding: Optional[str]) -> str:
+    """Turn a decrypted text body back into the message."""
+    if encoding == "zlib":
+        return decompress_payload(body).decode('utf-8')
+    return body
+
+def decode_binary_body(body: str, encoding: Optional[str]) -> bytes:
+    """Turn a decrypted image/file body back into the original bytes."""
+    if encoding == "zlib":
+        return decompress_payload(body)
+    return base64.b64decode(body)
+
+RECEIVE_CHUNK = 64 * 1024  # bytes of ciphertext decrypted at a time when receiving a file
+
+# The cipher is pure Python and holds the GIL: encrypting for several peers at once
+# gains nothing and makes the event loop wait behind each of them, so one at a time
+encrypt_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="encrypt")
+
+def encrypt_chunked(plaintext: str, key: str, chunk_size: int = RECEIVE_CHUNK) -> str:
+    """Same output as `encrypt`, computed a chunk of whole blocks at a time.
+    
+    Run in an executor: short calls let the event loop thread take the
+    GIL back between chunks."""
+    if len(key) != 32:
+        raise ValueError("La clé doit être de 32 octets (256 bits).")
+    round_keys = expand_key(key.encode())
+    data = plaintext.encode()
+    padding_length = 16 - (len(data) % 16)
+    step = chunk_size // 16 * 16
+    last = len(data) - len(data) % 16
+    chunks = [encrypt_blocks(data[start:min(start + step, last)], round_keys).hex()
+              for start in range(0, last, step)]
+    chunks.append(encrypt_blocks(data[last:] + bytes([padding_length] * padding_length), round_keys).hex())
+    return "".join(chunks)
+
+def decrypt_chunks(encrypted_text: str, key: str, chunk_size: int = RECEIVE_CHUNK) -> Iterator[bytes]:
+    """Plaintext of `decrypt` piece by piece.
+    
+    The cipher works on independent 16-byte blocks, so the hex ciphertext
+    is decrypted a chunk of whole blocks at a time; the padding is removed
+    from the last one."""
+    if len(key) != 32:
+        raise ValueError("La clé doit être de 32 octets (256 bits).")
+    round_keys = expand_key(key.encode())
+    step = chunk_size // 16 * 32  # hex digits of whole blocks
+    for start in range(0, len(encrypted_text), step):
+        chunk = decrypt_blocks(bytes.fromhex(encrypted_text[start:start + step]), round_keys)
+        if start + step >= len(encrypted_text):
+            chunk = chunk[:-chunk[-1]]
+        yield chunk
+
+def decode_body_chunks(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Original bytes of a decrypted image/file body given piece by piece (see decode_binary_body)."""
+    decompressor = zlib.decompressobj() if encoding == "zlib" else None
+    limit = app_state.max_file_size * 2
+    produced = 0
+    pending = b""  # Base64 left over from the previous chunk, less than one group
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            data = base64.b64decode(pending)
+        else:
+            pending += chunk
+            usable = len(pending) - len(pending) % 4
+            data = base64.b64decode(pending[:usable])
+            pending = pending[usable:]
+        
+        if decompressor is not None:
+            # Refuse anything larger than a file may be, like decompress_payload
+            data = decompressor.decompress(data, limit - produced + 1)
+            if chunk is None:
+                data += decompressor.flush()
+            produced += len(data)
+            if produced > limit:
+                raise ValueError("Données décompressées trop volumineuses")
+        if data:
+            yield data
+
+def receive_file(encrypted_text: str, key: str, encoding: Optional[str], path: str,
+                 expected_size: int, expected_hash: str) -> bool:
+    """Decrypt a received file straight to disk in one pass; False if its hash does not match.
+    
+    Chunks are hashed as they are written to `path`.part, preallocated to
+    the announced size; the file is renamed to `path` only once verified.
+    """
+    part_path = path + ".part"
+    digest = hashlib.sha256()
+    try:
+        with open(part_path, 'wb') as f:
+            if 0 < expected_size <= app_state.max_file_size:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(f.fileno(), 0, expected_size)
                 else:
-                    # Process static image
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    # Get chat display dimensions
-                    width, height = app_state.get_image_dimensions()
-                    
-                    # Resize maintaining aspect ratio
-                    img_width, img_height = img.size
-                    aspect_ratio = img_width / img_height
-                    
-                    if aspect_ratio > width / height:
-                        new_width = width
-                        new_height = int(new_width / aspect_ratio)
-                    else:
-                        new_height = height
-                        new_width = int(new_height * aspect_ratio)
-                    
-                    resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    return Pixels.from_image(resized_img)
-                    
-        except Exception as e:
-            return f"❌ Erreur de traitement d'image: {e}"
+                    f.truncate(expected_size)
+            
+            written = 0
+            for data in decode_body_chunks(decrypt_chunks(encrypted_text, key), encoding):
+                digest.update(data)
+                f.write(data)
+                written += len(data)
+            f.truncate(written)  # In case the announced size was wrong
+        
+        if digest.hexdigest() != expected_hash:
+            os.remove(part_path)
+            return False
+        os.replace(part_path, path)
+        return True
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+GIF_DEFAULT_FRAME_DURATION = 0.1  # seconds, used when a frame has no usable duration
+THUMBNAIL_MAX_FRAMES = 300  # frames of an animation kept in the preview sent to peers
+PREVIEW_PIXEL_BYTES = 150  # Memory taken by one rendered pixel, for the cache budget
+
+class GifPreview:
+    """Animated preview whose frames are decoded and rendered when first needed.
+    
+    One decoder is kept open and advanced in playback order. Rendered frames
+    are kept while they fit in `budget` bytes (the first one always), so a
+    short animation is decoded once and a long one streams in bounded memory.
+    Frame durations and the frame count are learned while decoding.
+    Frames are rendered as terminal pixels, or with `render_frame` (ASCII
+    art for the file browser), taking `pixel_bytes` per pixel.
+    """
     
-    # Run in thread pool to avoid blocking
+    def __init__(self, data: bytes, box: Tuple[int, int], budget: int,
+                 render_frame: Callable[[Image.Image], Any] = Pixels.from_image,
+                 pixel_bytes: int = PREVIEW_PIXEL_BYTES):
+        self.data = data
+        self.box = box
+        self.budget = budget
+        self.render_frame = render_frame
+        self.pixel_bytes = pixel_bytes
+        self.durations: List[float] = []
+        self.frame_count: Optional[int] = None  # Known once the decoder reached the end
+        self.frames: "OrderedDict[int, Pixels]" = OrderedDict()
+        self.frame_size = 0  # Memory of one rendered frame
+        self._image: Optional[Image.Image] = None
+        self._lock = threading.Lock()  # Frames are rendered in worker threads
+        self._closed = False
+    
+    def render(self, index: int) -> Optional[Pixels]:
+        """Frame `index`, decoding it if needed (blocking); None past the last frame."""
+        with self._lock:
+            pixels = self.frames.get(index)
+            if pixels is not None:
+                self.frames.move_to_end(index)
+                return pixels
+            if self._closed or (self.frame_count is not None and index >= self.frame_count):
+                return None
+            
+            if self._image is None:
+                self._image = Image.open(BytesIO(self.data))
+            try:
+                # Forward seeks continue from the current frame, going back restarts
+                self._image.seek(index)
+            except (EOFError, OSError):
+                # The end, or a truncated file: play what could be decoded
+                self.frame_count = max(1, index)
+                return None
+            if index == len(self.durations):
+                self.durations.append(gif_frame_duration(self._image))
+            
+            frame = shrink_for_preview(self._image.copy(), self.box)
+            self.frame_size = frame.width * frame.height * self.pixel_bytes
+            pixels = self.render_frame(frame)
+            self.frames[index] = pixels
+            while len(self.frames) * self.frame_size > self.budget and len(self.frames) > 2:
+                oldest = next(iter(self.frames))
+                if oldest == 0:
+                    self.frames.move_to_end(0)  # Kept for history and first display
+                    oldest = next(iter(self.frames))
+                del self.frames[oldest]
+            if self.frame_count is not None and len(self.frames) == self.frame_count:
+                # Every frame is cached: the decoder is not needed anymore
+                self._image.close()
+                self._image = None
+            return pixels
+    
+    def first_frame(self) -> Pixels:
+        return self.render(0)
+    
+    def close(self):
+        """Release the decoder; frames not rendered yet are lost."""
+        with self._lock:
+            if self._image is not None:
+                self._image.close()
+                self._image = None
+            self._closed = True
+    
+    def next_index(self, index: int) -> int:
+        """Frame shown after `index`, looping once the end is known."""
+        if self.frame_count is not None and index + 1 >= self.frame_count:
+            return 0
+        return index + 1
+    
+    def duration(self, index: int) -> float:
+        if index < len(self.durations):
+            return self.durations[index]
+        return GIF_DEFAULT_FRAME_DURATION
+
+def gif_frame_duration(img: Image.Image) -> float:
+    """Duration of the current frame; like browsers, treat 0-10 ms as unset."""
+    duration = img.info.get('duration') or 0
+    if duration <= 10:
+        return GIF_DEFAULT_FRAME_DURATION
+    return duration / 1000
+
+preview_cache = PreviewCache(
+    config_manager.get_ui_config().preview_cache_size,
+    config_manager.get_ui_config().preview_cache_folder,
+    config_manager.get_ui_config().preview_cache_disk_size,
+)
+image_pool = ImageWorkerPool(
+    config_manager.get_ui_config().image_workers,
+    config_manager.get_ui_config().image_queue_depth,
+    config_manager.get_ui_config().image_worker_processes,
+)
+
+def chat_preview_key(content_hash: str) -> Tuple:
+    """Cache key of a chat preview: the rendering depends on the display size and quality."""
+    width, height = app_state.get_image_dimensions()
+    return (content_hash, "chat", width, height, app_state.image_quality)
+
+def read_image_source(image: Union[str, bytes]) -> Tuple[bytes, str]:
+    """Bytes of an image file (or the bytes given) and their content hash."""
+    if isinstance(image, str):
+        with open(image, 'rb') as f:
+            image = f.read()
+    return image, PreviewCache.content_hash(image)
+
+def store_image_thumbnail(image_path: str) -> Tuple[bytes, str]:
+    """Make the thumbnail sent for a shared image and keep it for history."""
+    thumbnail = make_image_thumbnail(image_path)
+    return thumbnail, preview_cache.store_source(thumbnail)
+
+def render_gif_preview(data: bytes) -> Union[GifPreview, str]:
+    try:
+        # Only the first frame now, the others as the animation plays
+        preview = GifPreview(data, app_state.get_image_dimensions(),
+                             config_manager.get_ui_config().gif_frame_budget)
+        preview.first_frame()
+        return preview
+    except Exception as e:
+        return f"❌ Erreur de traitement d'image: {e}"
+
+async def process_image_for_display_async(image: Union[str, bytes], tag: Any = None,
+                                          wanted: Optional[Callable[[], bool]] = None
+                                          ) -> Union[Pixels, str, GifPreview]:
+    """Process image for display in chat, handling both static images and animated GIFs.
+    
+    Renders are cached by content, so the same image shown again (history,
+    forwarded copies) costs a hash instead of a decode and resize. Still
+    images are rendered by the image worker pool, GIF frames in threads.
+    Raises RequestDropped if the pool dropped the request (see
+    ImageWorkerPool for `tag` and `wanted`).
+    """
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _process_image)
+    try:
+        image, content_hash = await loop.run_in_executor(None, read_image_source, image)
+    except Exception as e:
+        return f"❌ Erreur de traitement d'image: {e}"
+    key = chat_preview_key(content_hash)
+    content = preview_cache.get(key)
+    if content is not None:
+        return content
+    
+    try:
+        content = await image_pool.run(render_still, image, app_state.get_image_dimensions(),
+                                       tag=tag, wanted=wanted)
+    except RequestDropped:
+        raise
+    except Exception as e:
+        return f"❌ Erreur de traitement d'image: {e}"
+    if content is None:
+        content = await loop.run_in_executor(None, render_gif_preview, image)
+    
+    if isinstance(content, GifPreview):
+        preview_cache.put(key, content, content.budget)
+    elif not isinstance(content, str):
+        preview_cache.put(key, content, key[2] * key[3] * PREVIEW_PIXEL_BYTES)
+    return content
+
+def make_image_thumbnail(image_path: str) -> bytes:
+    """Encode the small preview sent in place of a shared image.
+    
+    It fits UIConfig.max_image_width x max_image_height pixels, the largest
+    size receivers display: a JPEG for still images, a GIF of the first
+    frames (with their durations) for animations, as many as receivers can
+    keep rendered within gif_frame_budget (at most THUMBNAIL_MAX_FRAMES).
+    """
+    ui_config = config_manager.get_ui_config()
+    box = (ui_config.max_image_width, ui_config.max_image_height)
+    output = BytesIO()
+    with Image.open(image_path) as img:
+        if getattr(img, 'is_animated', False):
+            # Never enlarged, unlike chat previews
+            frame_box = fit_within(img.size, (min(box[0], img.width), min(box[1], img.height)))
+            frame_bytes = frame_box[0] * frame_box[1] * PREVIEW_PIXEL_BYTES
+            max_frames = min(THUMBNAIL_MAX_FRAMES, max(1, ui_config.gif_frame_budget // frame_bytes))
+            frames = []
+            durations = []
+            for frame_num in range(max_frames):
+                try:
+                    img.seek(frame_num)
+                except EOFError:
+                    break
+                durations.append(int(gif_frame_duration(img) * 1000))
+                frames.append(shrink_for_preview(img, frame_box))
+            frames[0].save(output, format='GIF', save_all=True, append_images=frames[1:],
+                           duration=durations, loop=0)
+        else:
+            img.draft('RGB', box)  # Let JPEG decode at a reduced scale
+            preview = ImageOps.exif_transpose(img).convert('RGB')
+            preview.thumbnail(box, Image.Resampling.LANCZOS)
+            preview.save(output, format='JPEG', quality=ui_config.thumbnail_quality)
+    return output.getvalue()
+
+def read_text_head(file_path: str, length: int) -> str:
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read(length)
+
+def preview_text_file(file_path: str, file_size: int) -> str:
+    """Preview text file content."""
+    try:
+        size_str = format_file_size(file_size)
+        
+        if file_size > 1024 * 50:  # 50KB limit for preview
+            return f"📄 Fichier texte\n📏 {size_str}\n\n⚠️ Fichier trop volumineux pour l'aperçu"
+        
+        content = read_text_head(file_path, 1000)  # First 1000 characters
+        preview_text = f"📄 {os.path.basename(file_path)}\n📏 {size_str}\n\n{content}"
+        if len(content) >= 1000:
+            preview_text += "\n\n... (tronqué)"
+        return preview_text
+        
+    except Exception as e:
+        return f"📄 Fichier texte\n❌ Erreur de lecture: {e}"
+
+def open_ascii_gif(file_path: str) -> Optional[GifPreview]:
+    """ASCII preview of an animated GIF for the file browser, or None if it is not animated."""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    with Image.open(BytesIO(data)) as img:
+        if not getattr(img, 'is_animated', False):
+            return None
+    # Small preview size, one character per pixel
+    return GifPreview(data, (25, 15), config_manager.get_ui_config().gif_frame_budget,
+                      render_frame=image_to_ascii, pixel_bytes=1)
 
 # ────────────────────────────── Custom Widgets ──────────────────────────
 class ChatInput(Input):
@@ -528,161 +1380,6 @@ class UniversalDirectoryTree(DirectoryTree):
         return list(paths)  # Show everything
 
 # ────────────────────────────── Modal Screens ──────────────────────────
-class SearchableDirectoryTree(DirectoryTree):
-    """DirectoryTree with fast search through visible/expanded items only."""
-
-    search_term = reactive("")
-    images_only = reactive(False)
-    show_hidden = reactive(False)
-
-    def __init__(
-        self,
-        path,
-        *,
-        search: str = "",
-        images_only: bool = False,
-        show_hidden: bool = False,
-        **kwargs,
-    ):
-        # Ensure we start with a valid path
-        if not path or not os.path.exists(path):
-            path = os.getcwd()
-        super().__init__(path, **kwargs)
-        self.search_term = search
-        self.images_only = images_only
-        self.show_hidden = show_hidden
-        self._search_timer = None
-        self._pending_filters = {}
-
-    def set_filters(
-        self,
-        *,
-        search: str | None = None,
-        images_only: bool | None = None,
-        show_hidden: bool | None = None,
-    ) -> None:
-        """Change any filter with debouncing to prevent rapid reloads."""
-        # Store the pending filter changes
-        if search is not None:
-            self._pending_filters['search'] = search
-        if images_only is not None:
-            self._pending_filters['images_only'] = images_only
-        if show_hidden is not None:
-            self._pending_filters['show_hidden'] = show_hidden
-        
-        # Cancel any existing timer
-        if self._search_timer is not None:
-            self._search_timer.stop()
-        
-        # For non-search filters (images_only, show_hidden), apply immediately
-        # Only debounce search input since that's what users type rapidly
-        if search is None and (images_only is not None or show_hidden is not None):
-            self._apply_pending_filters()
-        else:
-            # Start a new timer for search input (0.5 second delay for responsiveness)
-            self._search_timer = self.set_timer(0.5, self._apply_pending_filters)
-
-    def _apply_pending_filters(self) -> None:
-        """Apply all pending filter changes."""
-        # Apply the stored filter values
-        if 'search' in self._pending_filters:
-            self.search_term = self._pending_filters['search']
-        if 'images_only' in self._pending_filters:
-            self.images_only = self._pending_filters['images_only']
-        if 'show_hidden' in self._pending_filters:
-            self.show_hidden = self._pending_filters['show_hidden']
-        
-        # Clear pending filters
-        self._pending_filters.clear()
-        self._search_timer = None
-        
-        # Now apply the filters
-        self._force_full_reload()
-
-    def _force_full_reload(self) -> None:
-        """Force a complete reload of the tree including all expanded nodes."""
-        # Store the current expanded state
-        expanded_paths = self._get_expanded_paths()
-        
-        # Reload the entire tree
-        self.reload()
-        
-        # Restore the expanded state after a short delay
-        self.call_later(lambda: self._restore_expanded_state(expanded_paths))
-    
-    def _get_expanded_paths(self) -> set[str]:
-        """Get the paths of all currently expanded directories."""
-        expanded = set()
-        
-        def collect_expanded(node):
-            if hasattr(node, 'is_expanded') and node.is_expanded and hasattr(node, 'data') and node.data:
-                try:
-                    expanded.add(str(node.data.path))
-                except Exception:
-                    pass
-            if hasattr(node, 'children'):
-                for child in node.children:
-                    collect_expanded(child)
-        
-        if hasattr(self, 'root') and self.root:
-            collect_expanded(self.root)
-        
-        return expanded
-    
-    def _restore_expanded_state(self, expanded_paths: set[str]) -> None:
-        """Restore the expanded state of directories."""
-        def expand_matching(node):
-            if hasattr(node, 'data') and node.data:
-                try:
-                    if str(node.data.path) in expanded_paths:
-                        node.expand()
-                except Exception:
-                    pass
-            if hasattr(node, 'children'):
-                for child in node.children:
-                    expand_matching(child)
-        
-        if hasattr(self, 'root') and self.root:
-            expand_matching(self.root)
-
-    def filter_paths(self, paths):
-        """Filter only the immediate children paths (visible items only)."""
-        search = self.search_term.strip()
-        img_only = self.images_only
-        show_hidden = self.show_hidden
-        filtered = []
-
-        for path in paths:
-            name = path.name
-
-            # Skip hidden files/folders unless show_hidden is enabled
-            if not show_hidden and name.startswith("."):
-                continue
-
-            is_file = path.is_file()
-            is_dir = path.is_dir()
-
-            # Handle files
-            if is_file:
-                # Check if filename matches search term
-                if search and search.lower() not in name.lower():
-                    continue
-                
-                # Check image filter
-                if img_only and not is_image_file(name):
-                    continue
-                
-                # File passed all filters
-                filtered.append(path)
-            
-            # Handle directories
-            elif is_dir:
-                # For directories, we always include them if they pass basic filters
-                # The user can expand them to see their contents
-                filtered.append(path)
-
-        return filtered
-
 class FileBrowserModal(ModalScreen[Optional[str]]):
     """Enhanced file browser with search, filtering, and GIF animation."""
     
@@ -805,9 +1502,7 @@ class FileBrowserModal(ModalScreen[Optional[str]]):
         self.dialog_title = title
         self.selected_file = None
         self.current_preview = None
-        self.gif_frames = []
-        self.gif_frame_index = 0
-        self.gif_timer = None
+        self.preview_task: Optional[asyncio.Task] = None  # Rendering or animating the preview
     
     def compose(self) -> ComposeResult:
         with Container(id="browser_dialog"):
@@ -821,7 +1516,7 @@ class FileBrowserModal(ModalScreen[Optional[str]]):
             
             # Main browser area with tree and preview
             with Horizontal(id="main_browser_area"):
-                yield SearchableDirectoryTree("./", id="directory_tree")
+                yield SearchableDirectoryTree("./", search_delay=0.5, id="directory_tree")
                 
                 with Container(id="preview_container"):
                     yield Label("🔍 Aperçu", id="preview_title")
@@ -845,6 +1540,9 @@ class FileBrowserModal(ModalScreen[Optional[str]]):
         if event.key == "escape":
             self.dismiss(None)
     
+    def on_unmount(self) -> None:
+        self.cancel_preview()
+    
     def on_input_changed(self, event: Input.Changed) -> None:
         """Handle search input changes."""
         if event.input.id == "search_input":
@@ -871,7 +1569,7 @@ class FileBrowserModal(ModalScreen[Optional[str]]):
     def update_file_info(self, file_path: str):
         """Update file information display."""
         try:
-            filename, file_size, file_type, _ = get_file_info(file_path)
+            filename, file_size, file_type = get_display_info(file_path)
             size_str = format_file_size(file_size)
             
             # Get file icon based on type
@@ -893,193 +1591,108 @@ class FileBrowserModal(ModalScreen[Optional[str]]):
             self.query_one("#file_info").update(f"❌ Erreur: {e}")
     
     def update_preview(self, file_path: str):
-        """Update file preview with support for images and GIFs."""
+        """Show a placeholder now and render the preview in the background."""
+        self.cancel_preview()
         preview_content = self.query_one("#preview_content")
-        
+        preview_content.update(f"⏳ Chargement de l'aperçu...\n{os.path.basename(file_path)}")
+        self.preview_task = asyncio.create_task(self.render_preview(file_path, preview_content))
+    
+    def cancel_preview(self):
+        """Stop the preview being rendered or animated, when the selection changes."""
+        if self.preview_task is not None:
+            self.preview_task.cancel()
+            self.preview_task = None
+        image_pool.cancel("browser")
+    
+    async def render_preview(self, file_path: str, preview_content):
+        """Update file preview with support for images and GIFs."""
+        loop = asyncio.get_event_loop()
         try:
             filename = os.path.basename(file_path)
             file_size = os.path.getsize(file_path)
-            
-            # Stop any existing GIF animation
-            self.stop_gif_animation()
+            size_str = format_file_size(file_size)
             
             if is_image_file(filename):
                 # Handle image preview
                 if filename.lower().endswith('.gif'):
-                    self.preview_gif(file_path, preview_content)
-                else:
-                    self.preview_image(file_path, preview_content)
+                    preview = await loop.run_in_executor(None, open_ascii_gif, file_path)
+                    if preview is not None:
+                        await self.play_gif(preview, size_str, preview_content)
+                        return
+                    # Not animated, treat as regular image
+                preview_text = await self.preview_image(file_path, size_str)
             elif file_path.endswith(('.txt', '.py', '.md', '.json', '.yaml', '.yml', '.xml', '.html', '.css', '.js')):
                 # Text file preview
-                self.preview_text_file(file_path, preview_content)
+                preview_text = await loop.run_in_executor(None, preview_text_file, file_path, file_size)
             else:
                 # Generic file info
-                size_str = format_file_size(file_size)
-                preview_content.update(f"📎 {filename}\n📏 Taille: {size_str}\n\n⚠️ Aperçu non disponible pour ce type de fichier")
+                preview_text = f"📎 {filename}\n📏 Taille: {size_str}\n\n⚠️ Aperçu non disponible pour ce type de fichier"
+            preview_content.update(preview_text)
                 
         except Exception as e:
             preview_content.update(f"❌ Erreur d'aperçu: {e}")
     
-    def preview_image(self, file_path: str, preview_content):
+    async def preview_image(self, file_path: str, size_str: str) -> str:
         """Preview static images (PNG, JPG, …, SVG if rasterisable)."""
+        loop = asyncio.get_event_loop()
         try:
-            with Image.open(file_path) as img:
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
-
-                # Resize for preview box
-                preview_w, preview_h = 25, 15
-                w, h = img.size
-                r = w / h
-                if r > preview_w / preview_h:
-                    new_w, new_h = preview_w, int(preview_w / r)
-                else:
-                    new_h, new_w = preview_h, int(preview_h * r)
-                img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-                ascii_preview = self.image_to_ascii(img)
-
-            size_str = format_file_size(os.path.getsize(file_path))
-            info = f"🌄 {os.path.basename(file_path)}\n📏 {size_str} - {w}×{h}\n\n"
-            preview_content.update(info + ascii_preview)
+            preview_w, preview_h = 25, 15
+            # Browsing back and forth over the same images hits the preview cache
+            stat = os.stat(file_path)
+            key = (file_path, stat.st_size, stat.st_mtime_ns, "ascii", preview_w, preview_h)
+            cached = preview_cache.get(key)
+            if cached is None:
+                cached = await image_pool.run(render_ascii, file_path, (preview_w, preview_h), tag="browser")
+                preview_cache.put(key, cached, len(cached[0]) + 200)
+            ascii_preview, (w, h) = cached
+            return f"🌄 {os.path.basename(file_path)}\n📏 {size_str} - {w}×{h}\n\n" + ascii_preview
+        except RequestDropped:
+            raise asyncio.CancelledError()  # The selection changed
         except (OSError, Image.UnidentifiedImageError):
             # not rasterisable – just show raw XML for SVG
             try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    xml = f.read(800)
-                size_str = format_file_size(os.path.getsize(file_path))
-                preview_content.update(f"🖼️ SVG (non-rasterisable)\n📏 {size_str}\n\n{xml[:800]}…")
+                xml = await loop.run_in_executor(None, read_text_head, file_path, 800)
+                return f"🖼️ SVG (non-rasterisable)\n📏 {size_str}\n\n{xml[:800]}…"
             except Exception:
-                preview_content.update(f"🌄 Image\n❌ Aperçu impossible")
-        except Exception as e:
-            preview_content.update(f"🌄 Image\n❌ Aperçu impossible : {e}")
-    
-    def preview_gif(self, file_path: str, preview_content):
-        """Preview animated GIF with frame cycling."""
-        try:
-            with Image.open(file_path) as img:
-                if not getattr(img, 'is_animated', False):
-                    # Not animated, treat as regular image
-                    self.preview_image(file_path, preview_content)
-                    return
-                
-                # Extract all frames
-                self.gif_frames = []
-                frame_count = getattr(img, 'n_frames', 1)
-                
-                for frame_num in range(min(frame_count, 10)):  # Limit to 10 frames for performance
-                    img.seek(frame_num)
-                    frame = img.copy()
-                    if frame.mode != 'RGB':
-                        frame = frame.convert('RGB')
-                    
-                    # Small preview size
-                    preview_width, preview_height = 25, 15
-                    img_width, img_height = frame.size
-                    aspect_ratio = img_width / img_height
-                    
-                    if aspect_ratio > preview_width / preview_height:
-                        new_width = preview_width
-                        new_height = int(new_width / aspect_ratio)
-                    else:
-                        new_height = preview_height
-                        new_width = int(new_height * aspect_ratio)
-                    
-                    preview_frame = frame.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    self.gif_frames.append(preview_frame)
-                
-                # Show info and start animation
-                size_str = format_file_size(os.path.getsize(file_path))
-                info_text = f"🎬 GIF Animé\n📏 {size_str} - {frame_count} frames\n⏯️ Animation en cours...\n\n"
-                preview_content.update(info_text)
-                
-                # Start frame cycling
-                self.gif_frame_index = 0
-                self.start_gif_animation(preview_content)
-                
+                return f"🌄 Image\n❌ Aperçu impossible"
         except Exception as e:
-            preview_content.update(f"🎬 GIF\n❌ Erreur d'aperçu: {e}")
-    
-    def start_gif_animation(self, preview_content):
-        """Start GIF frame animation."""
-        if self.gif_frames:
-            self.gif_timer = self.set_interval(0.5, lambda: self.animate_gif_frame(preview_content))
-    
-    def animate_gif_frame(self, preview_content):
-        """Animate to next GIF frame."""
-        if not self.gif_frames:
-            return
-        
-        current_frame = self.gif_frames[self.gif_frame_index]
-        
-        # Create ASCII representation of the frame
-        ascii_frame = self.image_to_ascii(current_frame)
-        
-        size_str = format_file_size(os.path.getsize(self.selected_file)) if self.selected_file else "N/A"
-        frame_info = f"🎬 GIF Animé (Frame {self.gif_frame_index + 1}/{len(self.gif_frames)})\n📏 {size_str}\n\n"
-        
-        preview_content.update(frame_info + ascii_frame)
-        
-        # Move to next frame
-        self.gif_frame_index = (self.gif_frame_index + 1) % len(self.gif_frames)
-    
-    def image_to_ascii(self, img):
-        """Convert image to ASCII representation (simple version)."""
-        # Simple ASCII conversion for preview
-        ascii_chars = "@%#*+=-:. "
-        width, height = img.size
-        
-        # Further reduce size for ASCII
-        width = min(width, 40)
-        height = min(height, 20)
-        img = img.resize((width, height))
-        
-        pixels = img.getdata()
-        ascii_str = ""
-        
-        for i, pixel in enumerate(pixels):
-            if i % width == 0 and i != 0:
-                ascii_str += "\n"
-            
-            # Convert RGB to grayscale
-            gray = int(0.299 * pixel[0] + 0.587 * pixel[1] + 0.114 * pixel[2])
-            ascii_str += ascii_chars[gray * (len(ascii_chars) - 1) // 255]
-        
-        return ascii_str
-    
-    def stop_gif_animation(self):
-        """Stop GIF animation timer."""
-        if self.gif_timer:
-            self.gif_timer.stop()
-            self.gif_timer = None
-        self.gif_frames = []
-        self.gif_frame_index = 0
+            return f"🌄 Image\n❌ Aperçu impossible : {e}"
     
-    def preview_text_file(self, file_path: str, preview_content):
-        """Preview text file content."""
+    async def play_gif(self, preview: GifPreview, size_str: str, preview_content):
+        """Show each frame for its own duration, decoding the next one in the meantime, until cancelled."""
+        loop = asyncio.get_event_loop()
         try:
-            file_size = os.path.getsize(file_path)
-            size_str = format_file_size(file_size)
-            
-            if file_size > 1024 * 50:  # 50KB limit for preview
-                preview_content.update(f"📄 Fichier texte\n📏 {size_str}\n\n⚠️ Fichier trop volumineux pour l'aperçu")
+            index = 0
+            frame = await loop.run_in_executor(None, preview.render, 0)
+            if frame is None:
+                # Not even the first frame decodes
+                preview_content.update(f"🎬 GIF Animé\n📏 {size_str}\n\n❌ Aperçu impossible")
                 return
-            
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read(1000)  # First 1000 characters
+            while frame is not None:
+                position = f"{index + 1}"
+                if preview.frame_count is not None:
+                    position += f"/{preview.frame_count}"
+                preview_content.update(f"🎬 GIF Animé (Frame {position})\n📏 {size_str}\n\n" + frame)
                 
-            preview_text = f"📄 {os.path.basename(file_path)}\n📏 {size_str}\n\n{content}"
-            if len(content) >= 1000:
-                preview_text += "\n\n... (tronqué)"
-                
-            preview_content.update(preview_text)
-            
-        except Exception as e:
-            preview_content.update(f"📄 Fichier texte\n❌ Erreur de lecture: {e}")
+                due = time.monotonic() + preview.duration(index)
+                index = preview.next_index(index)
+                frame = await loop.run_in_executor(None, preview.render, index)
+                if frame is None:
+                    # Past the last frame: loop
+                    index = 0
+                    frame = await loop.run_in_executor(None, preview.render, 0)
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+        finally:
+            # Cancelling leaves a frame that was rendering running in its thread, holding the
+            # preview's lock: close from a thread as well, once that render is done
+            try:
+                await loop.run_in_executor(None, preview.close)
+            except RuntimeError:
+                preview.close()  # The executor is shut down, so no render is left running
     
     def clear_preview(self):
         """Clear the preview area."""
-        self.stop_gif_animation()
+        self.cancel_preview()
         preview_content = self.query_one("#preview_content")
         preview_content.update("Sélectionnez un fichier pour voir l'aperçu")
     
@@ -1088,19 +1701,19 @@ class FileBrowserModal(ModalScreen[Optional[str]]):
         
         if button_id == "select_file_btn":
             if self.selected_file and os.path.isfile(self.selected_file):
-                self.stop_gif_animation()  # Clean up before closing
+                self.cancel_preview()  # Clean up before closing
                 # Don't close automatically, let user decide
                 self.notify(f"Fichier sélectionné: {os.path.basename(self.selected_file)}", severity="success")
             else:
                 self.notify("Veuillez sélectionner un fichier valide", severity="warning")
         elif button_id == "confirm_file_btn":
             if self.selected_file and os.path.isfile(self.selected_file):
-                self.stop_gif_animation()
+                self.cancel_preview()
                 self.dismiss(self.selected_file)
             else:
                 self.notify("Aucun fichier sélectionné", severity="warning")
         elif button_id == "cancel_browse_btn":
-            self.stop_gif_animation()  # Clean up before closing
+            self.cancel_preview()  # Clean up before closing
             self.dismiss(None)
         elif button_id == "filter_images_btn":
             # Toggle image filter using reactive state
@@ -1621,8 +2234,7 @@ class ContactManagerModal(ModalScreen[None]):
             return
         
         # Load group conversation history
-        app_state.load_conversation(f"group_{name}")
-        self.app.chat_view.load_conversation_history()
+        asyncio.create_task(self.app.open_conversation(f"group_{name}"))
         
         # Connect to all contacts in the group
         connected_count = 0
@@ -1647,8 +2259,7 @@ class ContactManagerModal(ModalScreen[None]):
             contact = app_state.contacts[name]
             
             # Load contact conversation history
-            app_state.load_conversation(contact.name)
-            self.app.chat_view.load_conversation_history()
+            asyncio.create_task(self.app.open_conversation(contact.name))
             
             self.app.connect_to_contact(contact)
             self.notify(f"Connexion au contact '{name}' en cours...", severity="information")
@@ -1660,8 +2271,7 @@ class ContactManagerModal(ModalScreen[None]):
             group = app_state.groups[name]
             
             # Load group conversation history
-            app_state.load_conversation(f"group_{name}")
-            self.app.chat_view.load_conversation_history()
+            asyncio.create_task(self.app.open_conversation(f"group_{name}"))
             
             connected_count = 0
             for contact_name in group.contacts:
@@ -1801,7 +2411,7 @@ class FileShareModal(ModalScreen[Optional[str]]):
             return
         
         try:
-            filename, file_size, file_type, file_hash = get_file_info(file_path)
+            filename, file_size, file_type = get_display_info(file_path)
             size_str = format_file_size(file_size)
             
             # Create preview
@@ -1809,7 +2419,6 @@ class FileShareModal(ModalScreen[Optional[str]]):
                 f"📎 Fichier: {filename}",
                 f"📏 Taille: {size_str}",
                 f"🔖 Type: {file_type}",
-                f"🔐 Hash: {file_hash[:16]}...",
                 ""
             ]
             
@@ -1971,14 +2580,11 @@ class DownloadManagerModal(ModalScreen[None]):
         dt.add_columns("Nom", "Taille", "Type", "Date", "Statut")
         
         self.files.clear()
-        for msg in app_state.current_conversation:
+        for msg in app_state.loaded_messages():
             if msg.message_type == "file" and msg.file_info:
                 fi = msg.file_info
                 self.files.append((msg, fi))
-                try:
-                    date_str = datetime.fromisoformat(msg.timestamp).strftime("%d/%m %H:%M")
-                except:
-                    date_str = msg.timestamp[:16] if len(msg.timestamp) > 16 else msg.timestamp
+                date_str = format_timestamp(msg.timestamp, "%d/%m %H:%M")
                 
                 dt.add_row(
                     fi.filename,
@@ -2079,20 +2685,276 @@ class DownloadManagerModal(ModalScreen[None]):
         except Exception as e:
             self.notify(f"❌ Erreur de téléchargement: {e}", severity="error")
 
+class MessageSearchModal(ModalScreen[None]):
+    """Modal for full-text search over stored messages."""
+    
+    CSS = """
+    MessageSearchModal {
+        align: center middle;
+    }
+    
+    #search_dialog {
+        width: 90%;
+        height: 80%;
+        max-width: 120;
+        max-height: 30;
+        border: thick $primary 80%;
+        background: $surface;
+        padding: 1 2;
+    }
+    
+    #search_input {
+        width: 100%;
+        margin: 1 0;
+    }
+    
+    #search_table {
+        width: 100%;
+        height: 1fr;
+        border: solid $primary;
+    }
+    
+    #search_status {
+        width: 100%;
+        height: auto;
+        color: $text-muted;
+    }
+    """
+    
+    def compose(self) -> ComposeResult:
+        with Container(id="search_dialog"):
+            yield Label("🔎 Rechercher dans l'historique", id="search_title")
+            yield Input(placeholder="Mots à rechercher, puis Entrée", id="search_input")
+            yield DataTable(id="search_table")
+            yield Label("", id="search_status")
+    
+    def on_mount(self) -> None:
+        self.query_one("#search_table", DataTable).add_columns("Date", "Conversation", "Auteur", "Message")
+        self.query_one("#search_input").focus()
+    
+    def on_key(self, event) -> None:
+        if event.key == "escape":
+            self.dismiss()
+    
+    async def on_input_submitted(self, event: Input.Submitted) -> None:
+        query = event.value.strip()
+        if not query:
+            return
+        
+        status = self.query_one("#search_status", Label)
+        status.update("Recherche en cours...")
+        started = time.perf_counter()
+        try:
+            # The search waits for queued writes, keep it off the event loop
+            app_state.open_storage()
+            loop = asyncio.get_event_loop()
+            results = await loop.run_in_executor(None, app_state.search_messages, query)
+        except Exception as e:
+            status.update(f"❌ Erreur de recherche: {e}")
+            return
+        
+        table = self.query_one("#search_table", DataTable)
+        table.clear()
+        for result in results:
+            table.add_row(
+                format_timestamp(parse_timestamp(result["timestamp"]), "%d/%m %H:%M"),
+                result["conversation"],
+                result["sender"],
+                result["content"].replace("\n", " ")[:80],
+            )
+        elapsed = (time.perf_counter() - started) * 1000
+        status.update(f"{len(results)} résultat(s) en {elapsed:.0f} ms")
+
 # ────────────────────────────── widgets ──────────────────────────────
-class ChatView(ScrollableContainer):
+@dataclass
+class GifAnimation:
+    """Playback position of one animated preview in the chat log."""
+    preview: GifPreview
+    frame: int = 0
+    due: float = 0.0  # monotonic time at which the next frame is shown
+    loading: bool = False  # The next frame is being decoded in the background
+
+
+class LineIndex:
+    """Fenwick tree over entry heights, mapping line offsets to entries in O(log n)."""
+
+    def __init__(self):
+        self.heights: List[int] = []
+        self.tree: List[int] = [0]
+
+    def __len__(self) -> int:
+        return len(self.heights)
+
+    @property
+    def total(self) -> int:
+        return self.prefix(len(self.heights))
+
+    def prefix(self, count: int) -> int:
+        """Total height of the first `count` entries."""
+        total = 0
+        while count > 0:
+            total += self.tree[count]
+            count -= count & -count
+        return total
+
+    def append(self, height: int):
+        self.heights.append(height)
+        position = len(self.heights)
+        lowbit = position & -position
+        self.tree.append(height + self.prefix(position - 1) - self.prefix(position - lowbit))
+
+    def extend(self, heights: List[int]):
+        if len(heights) > len(self.heights):
+            self.rebuild(self.heights + heights)
+        else:
+            for height in heights:
+                self.append(height)
+
+    def set(self, index: int, height: int):
+        delta = height - self.heights[index]
+        if not delta:
+            return
+        self.heights[index] = height
+        position = index + 1
+        while position < len(self.tree):
+            self.tree[position] += delta
+            position += position & -position
+
+    def rebuild(self, heights: List[int]):
+        self.heights = list(heights)
+        self.tree = [0] * (len(self.heights) + 1)
+        for position, height in enumerate(self.heights, 1):
+            self.tree[position] += height
+            parent = position + (position & -position)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[position]
+
+    def locate(self, line: int) -> Tuple[int, int]:
+        """Return (entry index, line within entry) for an absolute line offset."""
+        position = 0
+        step = 1 << len(self.heights).bit_length()
+        while step:
+            candidate = position + step
+            if candidate < len(self.tree) and self.tree[candidate] <= line:
+                position = candidate
+                line -= self.tree[candidate]
+            step >>= 1
+        return position, line
+
+
+class ChatView(ScrollView):
+    """Virtualized chat log: entries are kept as compact records and only visible lines are rendered."""
+
+    STRIP_CACHE_SIZE = 256  # Rendered entries kept around (viewport plus overscan)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.messages = []
-        self.gif_timers = {}  # Track GIF animations by message index
-        self.gif_frames = {}  # Store GIF frames by message index
-        self.gif_frame_indices = {}  # Track current frame by message index
+        self.entries: List[Any] = []  # Compact records, or ready renderables for previews
+        self.line_index = LineIndex()
+        self.strip_cache: "OrderedDict[int, List[Strip]]" = OrderedDict()
+        self.render_width = 0
+        self.gif_animations: Dict[int, GifAnimation] = {}  # Animated previews by entry index
+        self.gif_clock = None  # Single timer driving every animation
+        self.pending_entries = 0  # Stored but not yet laid out
+        self.flush_timer = None
+        self.last_flush = 0.0
+        self.history_requested = False  # An older page is scheduled to load
+        self.preview_requests: Set[str] = set()  # History previews being loaded from the cache
+        self.missing_previews: Set[str] = set()  # History previews that were not kept
+        self.pending_slots: Dict[int, int] = {}  # Entry index of each placeholder still waiting, by handle
+        self.page_entries: List[int] = []  # Entries of each of app_state.history_pages, at the top of the log
+        self.page_requests: Set[int] = set()  # Dropped pages being read again, by start
+        self.pending_handles = itertools.count()
 
-    def add_message(self, sender, message, timestamp=None, message_type="text", file_info=None, is_image=False):
-        """Add a message to the chat view."""
+    def add_message(self, sender, message, timestamp=None, message_type="text", file_info=None, is_image=False,
+                    message_id=None, preview_hash=None):
+        """Add a message to the chat view; returns the handle of an image or file placeholder."""
         if timestamp is None:
             timestamp = datetime.now().strftime("%H:%M:%S")
 
+        # Handle legacy is_image parameter
+        if is_image and message_type == "text":
+            message_type = "image"
+        
+        # Add conversation record
+        if sender != "Système":
+            conv_msg = ConversationMessage(
+                sender=sender,
+                content=message,
+                timestamp=timestamp,
+                message_type=message_type,
+                file_info=file_info,
+                message_id=message_id,
+                preview_hash=preview_hash
+            )
+            app_state.add_message_to_conversation(conv_msg)
+        
+        entries = self.build_entries(sender, message, timestamp, message_type, file_info)
+        self.queue_entries(entries)
+        if entries[-1][0] == "pending":
+            # Handle for update_image_display / update_file_display, which may come after other messages
+            handle = next(self.pending_handles)
+            self.pending_slots[handle] = len(self.entries) - 1
+            return handle
+        return None
+
+    def build_entries(self, sender, message, timestamp, message_type="text", file_info=None) -> List[Any]:
+        """Build the compact records (header line and optional placeholder) for a message."""
+        entries = [("message", sender, message, timestamp, message_type, file_info)]
+        
+        # Add placeholder for file/image content
+        if message_type in ["file", "image"] and sender != "Système":
+            entries.append(("pending", message_type, sender == app_state.username))
+        
+        return entries
+
+    def render_entry(self, entry) -> Any:
+        """Turn a compact record into a Rich renderable."""
+        if not isinstance(entry, tuple):
+            return entry
+        
+        kind = entry[0]
+        if kind == "preview":
+            _, preview_hash, own = entry
+            if preview_hash in self.missing_previews:
+                return Text("[Aperçu non conservé]", style="dim")
+            content = preview_cache.get(chat_preview_key(preview_hash))
+            if content is None:
+                self.request_preview(preview_hash)
+                return Text("[Chargement de l'aperçu...]", style="dim")
+            return content.first_frame() if isinstance(content, GifPreview) else content
+        
+        if kind == "page":
+            page = self.history_page(entry[1])
+            if page is None or page.log is not app_state.conversation_log:
+                return Text("[Messages plus anciens non chargés]", style="dim")
+            self.request_page(page)
+            return Text(f"[Chargement de {page.stop - page.start} messages...]", style="dim")
+        
+        if kind == "pending":
+            _, message_type, own = entry
+            if message_type == "image":
+                if own:
+                    return Text("[Génération de l'aperçu...]", style="dim")
+                return Text("[Traitement de l'image reçue...]", style="dim")
+            if own:
+                return Text("[Fichier envoyé]", style="dim green")
+            return Text("[Utilisez Ctrl+D pour gérer les téléchargements]", style="dim blue")
+        
+        if kind == "file":
+            _, file_info, download_link = entry
+            size_str = format_file_size(file_info.file_size)
+            
+            if download_link:
+                content = Text(f"📥 Téléchargeable: {file_info.filename} ({size_str})\n", style="green")
+                content.append("Ctrl+D pour ouvrir le gestionnaire de téléchargements", style="dim")
+            else:
+                content = Text(f"📎 Fichier local: {file_info.filename} ({size_str})", style="blue")
+            return content
+        
+        _, sender, message, timestamp, message_type, file_info = entry
+        timestamp = format_timestamp(timestamp)
+        
         # Create message header
         if sender == app_state.username:
             msg = Text(f"[{timestamp}] ", style="bold cyan")
@@ -2104,10 +2966,6 @@ class ChatView(ScrollableContainer):
             msg = Text(f"[{timestamp}] ", style="bold cyan")
             msg.append(f"{sender}: ", style="bold yellow")
 
-        # Handle legacy is_image parameter
-        if is_image and message_type == "text":
-            message_type = "image"
-        
         # Add message content based on type
         if message_type == "file":
             if file_info:
@@ -2133,115 +2991,437 @@ class ChatView(ScrollableContainer):
         else:
             msg.append(message)
 
-        self.messages.append(msg)
-        
-        # Add conversation record
-        if sender != "Système":
-            conv_msg = ConversationMessage(
-                sender=sender,
-                content=message,
-                timestamp=timestamp,
-                message_type=message_type,
-                file_info=file_info
-            )
-            app_state.add_message_to_conversation(conv_msg)
+        return msg
+
+    def estimate_height(self, entry) -> int:
+        """Cheap height guess for entries that have not been rendered at the current width."""
+        if isinstance(entry, tuple) and entry[0] == "message" and entry[4] == "text":
+            width = max(1, self.render_width)
+            # Integer timestamps render as HH:MM:SS
+            header = len(entry[1]) + (len(entry[3]) if isinstance(entry[3], str) else 8) + 5
+            return sum((len(line) + header) // width + 1 for line in str(entry[2]).split("\n"))
+        if isinstance(entry, tuple):
+            return 2 if entry[0] == "file" else 1
+        if isinstance(entry, Text):
+            return entry.plain.count("\n") + 1
+        return 1
+
+    def get_strips(self, index: int) -> List[Strip]:
+        """Render one entry at the current width, caching the result."""
+        strips = self.strip_cache.get(index)
+        if strips is not None:
+            self.strip_cache.move_to_end(index)
+            return strips
+        
+        console = self.app.console
+        options = console.options.update_width(max(1, self.render_width))
+        renderable = None
+        animation = self.gif_animations.get(index)
+        if animation is not None:
+            # The entry stays a cache reference; the animation only picks the frame
+            renderable = animation.preview.frames.get(animation.frame)
+        if renderable is None:
+            renderable = self.render_entry(self.entries[index])
+        lines = console.render_lines(renderable, options, pad=False)
+        strips = [Strip(line) for line in lines] or [Strip.blank(0)]
+        
+        self.strip_cache[index] = strips
+        if len(self.strip_cache) > self.STRIP_CACHE_SIZE:
+            self.strip_cache.popitem(last=False)
+        
+        # Rendering gives the exact height; correct the estimate if needed
+        if self.line_index.heights[index] != len(strips):
+            self.line_index.set(index, len(strips))
+            self.update_virtual_size()
+        return strips
+
+    def append_entries(self, entries: List[Any]):
+        """Append records to the backing store; only the newest lines ever get rendered."""
+        self.entries.extend(entries)
+        self.line_index.extend([self.estimate_height(entry) for entry in entries])
+        self.pending_entries += len(entries)
+        self.flush_entries()
+
+    def queue_entries(self, entries: List[Any]):
+        """Store entries now and coalesce the layout, repaint and scroll of a burst into one pass."""
+        self.entries.extend(entries)
+        self.line_index.extend([self.estimate_height(entry) for entry in entries])
+        self.pending_entries += len(entries)
         
-        # Add placeholder for file/image content
-        if message_type in ["file", "image"] and sender != "Système":
-            if message_type == "image":
-                if sender == app_state.username:
-                    placeholder = Text("[Génération de l'aperçu...]", style="dim")
-                else:
-                    placeholder = Text("[Traitement de l'image reçue...]", style="dim")
-            else:  # file
-                if sender == app_state.username:
-                    placeholder = Text("[Fichier envoyé]", style="dim green")
-                else:
-                    placeholder = Text("[Utilisez Ctrl+D pour gérer les téléchargements]", style="dim blue")
-            
-            self.messages.append(placeholder)
-        
-        self.update_messages()
-        self.scroll_end()
-
-    def update_image_display(self, display_content: Union[Pixels, str]):
-        """Update the last image message with processed content."""
-        if self.messages and len(self.messages) >= 2:
-            message_index = len(self.messages) - 1
-            
-            if isinstance(display_content, Pixels):
-                self.messages[message_index] = display_content
-            elif isinstance(display_content, list):
-                # Handle GIF frames
-                self.gif_frames[message_index] = display_content
-                self.gif_frame_indices[message_index] = 0
-                if display_content:
-                    self.messages[message_index] = display_content[0]
-                    self.start_gif_animation(message_index)
+        if self.flush_timer is not None:
+            return
+        window = config_manager.get_ui_config().render_batch_window / 1000
+        elapsed = time.monotonic() - self.last_flush
+        if elapsed >= window:
+            # First message after a quiet period is shown right away
+            self.flush_entries()
+        else:
+            self.flush_timer = self.set_timer(max(0.01, window - elapsed), self.flush_entries)
+
+    def flush_entries(self):
+        """Lay out pending entries, repaint once and follow the end of the log."""
+        if self.flush_timer is not None:
+            self.flush_timer.stop()
+            self.flush_timer = None
+        self.last_flush = time.monotonic()
+        
+        # Measure the new tail now: it is what the viewport shows after scroll_end
+        if self.render_width:
+            lines = 0
+            for index in range(len(self.entries) - 1, len(self.entries) - self.pending_entries - 1, -1):
+                if lines >= self.size.height * 2:
+                    break
+                lines += len(self.get_strips(index))
+        self.pending_entries = 0
+        self.update_virtual_size()
+        self.refresh()
+        self.scroll_end(animate=False)
+
+    def splice_entries(self, index: int, count: int, entries: List[Any]):
+        """Replace entries [index, index + count) with `entries`, keeping the viewport on the same lines."""
+        stop = index + count
+        shift = len(entries) - count
+        above = self.line_index.prefix(stop) <= self.scroll_y  # The whole range is above the viewport
+        removed = self.line_index.prefix(stop) - self.line_index.prefix(index)
+        self.entries[index:stop] = entries
+        
+        def kept(items):
+            # Entries past the range move by `shift`, the replaced ones go
+            return ((position + shift if position >= stop else position, value)
+                    for position, value in items if not index <= position < stop)
+        self.strip_cache = OrderedDict(kept(self.strip_cache.items()))
+        self.gif_animations = dict(kept(self.gif_animations.items()))
+        self.pending_slots = {handle: position for position, handle in
+                              kept((position, handle) for handle, position in self.pending_slots.items())}
+        
+        heights = [self.estimate_height(entry) for entry in entries]
+        self.line_index.rebuild(self.line_index.heights[:index] + heights + self.line_index.heights[stop:])
+        # Render the new messages now so the scroll adjustment below is exact (page stubs are one line)
+        if self.render_width:
+            for position in range(index, index + len(entries)):
+                if not (isinstance(self.entries[position], tuple) and self.entries[position][0] == "page"):
+                    self.get_strips(position)
+        added = self.line_index.prefix(index + len(entries)) - self.line_index.prefix(index) - removed
+        
+        self.update_virtual_size()
+        if above and added:
+            self.scroll_to(y=self.scroll_y + added, animate=False)
+        self.refresh()
+
+    def set_entry(self, message_index: int, entry):
+        """Replace one entry and refresh only its lines."""
+        self.entries[message_index] = entry
+        self.strip_cache.pop(message_index, None)
+        old_height = self.line_index.heights[message_index]
+        if self.render_width:
+            self.get_strips(message_index)
+        if self.line_index.heights[message_index] == old_height:
+            self.refresh_entry(message_index)
+        else:
+            self.refresh()
+
+    def refresh_entry(self, message_index: int):
+        """Repaint the screen lines covered by one entry."""
+        top = self.line_index.prefix(message_index) - round(self.scroll_y)
+        height = self.line_index.heights[message_index]
+        if top + height > 0 and top < self.size.height:
+            self.refresh(Region(0, top, self.size.width, height))
+
+    def update_virtual_size(self):
+        self.virtual_size = Size(self.render_width, self.line_index.total)
+
+    def on_resize(self, event):
+        """Invalidate rendered lines when the width changes; heights become estimates again."""
+        width = self.size.width
+        if width != self.render_width:
+            self.render_width = width
+            self.strip_cache.clear()
+            self.update_virtual_size()
+            self.refresh()
+
+    def render_line(self, y: int) -> Strip:
+        """Render one screen line from the entry under it."""
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.size.width
+        rich_style = self.rich_style
+        line = scroll_y + y
+        
+        if not self.entries:
+            if y == 0:
+                return Strip(Text("La conversation apparaîtra ici").render(self.app.console)).crop_extend(0, width, rich_style)
+            return Strip.blank(width, rich_style)
+        if line >= self.line_index.total:
+            return Strip.blank(width, rich_style)
+        
+        index, offset = self.line_index.locate(line)
+        strips = self.get_strips(index)
+        if offset >= len(strips):
+            # The estimate was too high; the corrected layout arrives with the next refresh
+            return Strip.blank(width, rich_style)
+        return strips[offset].crop_extend(scroll_x, scroll_x + width, rich_style)
+
+    def update_image_display(self, handle: Optional[int], display_content: Union[Pixels, str, GifPreview],
+                             preview_hash: Optional[str] = None):
+        """Replace the placeholder of an image message (handle from add_message) with its content.
+        
+        With the hash of the rendered image, the entry refers to the preview
+        cache like history entries do, so the pixels are not held for the
+        whole session."""
+        message_index = self.pending_slots.pop(handle, None)
+        if message_index is not None:
+            if isinstance(display_content, str):
+                self.set_entry(message_index, Text(str(display_content), style="red"))
+            elif preview_hash and preview_cache.get(chat_preview_key(preview_hash)) is display_content:
+                own = self.entries[message_index][2]
+                self.set_entry(message_index, ("preview", preview_hash, own))
+                if isinstance(display_content, GifPreview):
+                    self.start_gif_animation(message_index, display_content)
+            elif isinstance(display_content, GifPreview):
+                # Handle GIF frames, decoded as the animation plays
+                self.set_entry(message_index, display_content.first_frame())
+                self.start_gif_animation(message_index, display_content)
             else:
-                self.messages[message_index] = Text(str(display_content), style="red")
+                self.set_entry(message_index, display_content)
             
-            self.update_messages()
-            self.scroll_end()
+            self.scroll_end(animate=False)
     
-    def start_gif_animation(self, message_index: int):
-        """Start GIF animation for a specific message."""
-        if message_index in self.gif_frames and self.gif_frames[message_index]:
-            # Stop any existing timer for this message
-            if message_index in self.gif_timers:
-                self.gif_timers[message_index].stop()
-            
-            # Start new animation timer
-            self.gif_timers[message_index] = self.set_interval(
-                0.5, lambda: self.animate_gif_frame(message_index)
-            )
+    def request_preview(self, preview_hash: str):
+        """Load a history preview from the cache in the background, once."""
+        if preview_hash not in self.preview_requests:
+            self.preview_requests.add(preview_hash)
+            asyncio.create_task(self.load_preview(preview_hash))
     
-    def animate_gif_frame(self, message_index: int):
-        """Animate to next GIF frame."""
-        if (message_index in self.gif_frames and 
-            message_index in self.gif_frame_indices and
-            self.gif_frames[message_index]):
-            
-            frames = self.gif_frames[message_index]
-            current_index = self.gif_frame_indices[message_index]
+    async def load_preview(self, preview_hash: str):
+        loop = asyncio.get_event_loop()
+        try:
+            content = await loop.run_in_executor(None, preview_cache.load_source, preview_hash)
+            if content is not None:
+                # Skipped if the entry was scrolled past before a worker got to it
+                content = await process_image_for_display_async(
+                    content, tag="history", wanted=lambda: self.is_preview_visible(preview_hash))
+        except RequestDropped:
+            return  # Requested again if it is shown again
+        finally:
+            self.preview_requests.discard(preview_hash)
+        
+        if content is None or preview_cache.get(chat_preview_key(preview_hash)) is None:
+            # Not kept on disk, unreadable, or too large for the memory cache
+            self.missing_previews.add(preview_hash)
+        
+        # Only entries rendered recently can be on screen
+        for message_index in list(self.strip_cache):
+            entry = self.entries[message_index]
+            if isinstance(entry, tuple) and entry[0] == "preview" and entry[1] == preview_hash:
+                self.set_entry(message_index, entry)
+                if isinstance(content, GifPreview) and preview_hash not in self.missing_previews:
+                    self.start_gif_animation(message_index, content)
+    
+    def is_preview_visible(self, preview_hash: str) -> bool:
+        # Only entries rendered recently can be on screen
+        return any(
+            self.entries[message_index][:2] == ("preview", preview_hash) and self.is_entry_visible(message_index)
+            for message_index in self.strip_cache
+            if isinstance(self.entries[message_index], tuple)
+        )
+    
+    def start_gif_animation(self, message_index: int, preview: GifPreview):
+        """Register a GIF with the shared animation clock."""
+        if preview.frame_count != 1:
+            animation = GifAnimation(preview, due=time.monotonic() + preview.duration(0))
+            self.gif_animations[message_index] = animation
+            self.prefetch_gif_frame(animation)
+            self.schedule_gif_clock()
+    
+    def prefetch_gif_frame(self, animation: GifAnimation):
+        """Decode the frame after the current one in the background, unless it is cached."""
+        next_frame = animation.preview.next_index(animation.frame)
+        if animation.loading or next_frame in animation.preview.frames:
+            return
+        animation.loading = True
+        asyncio.create_task(self.load_gif_frame(animation, next_frame))
+    
+    async def load_gif_frame(self, animation: GifAnimation, frame: int):
+        loop = asyncio.get_event_loop()
+        try:
+            pixels = await loop.run_in_executor(None, animation.preview.render, frame)
+        finally:
+            animation.loading = False
+        if pixels is None:
+            # Past the end: the frame count is known now, fetch the first frame instead
+            self.prefetch_gif_frame(animation)
+        self.schedule_gif_clock()
+    
+    def is_entry_visible(self, message_index: int) -> bool:
+        top = self.line_index.prefix(message_index)
+        bottom = top + self.line_index.heights[message_index]
+        return bottom > self.scroll_y and top < self.scroll_y + self.size.height
+    
+    def schedule_gif_clock(self):
+        """Arm the clock for the next frame change among on-screen GIFs; idle when none are visible."""
+        if self.gif_clock is not None:
+            self.gif_clock.stop()
+            self.gif_clock = None
+        
+        due_times = [
+            animation.due for message_index, animation in self.gif_animations.items()
+            if not animation.loading and self.is_entry_visible(message_index)
+        ]
+        if due_times:
+            # Textual timers need a positive delay
+            delay = max(0.01, min(due_times) - time.monotonic())
+            self.gif_clock = self.set_timer(delay, self.advance_gif_animations)
+    
+    def advance_gif_animations(self):
+        """Advance every visible GIF whose frame has expired, then re-arm the clock."""
+        self.gif_clock = None
+        now = time.monotonic()
+        
+        for message_index, animation in self.gif_animations.items():
+            if animation.due > now or animation.loading or not self.is_entry_visible(message_index):
+                continue
             
-            # Move to next frame
-            next_index = (current_index + 1) % len(frames)
-            self.gif_frame_indices[message_index] = next_index
+            preview = animation.preview
+            next_frame = preview.next_index(animation.frame)
+            pixels = preview.frames.get(next_frame)
+            if pixels is None:
+                # Not decoded in time: hold the current frame until it is
+                self.prefetch_gif_frame(animation)
+                continue
             
-            # Update the message with new frame
-            if message_index < len(self.messages):
-                self.messages[message_index] = frames[next_index]
-                self.update_messages()
+            animation.frame = next_frame
+            duration = preview.duration(next_frame)
+            animation.due += duration
+            if animation.due <= now:
+                # Resync instead of replaying missed frames after a pause
+                animation.due = now + duration
+            self.set_entry(message_index, self.entries[message_index])
+            self.prefetch_gif_frame(animation)
+        
+        self.schedule_gif_clock()
+    
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_y(old_value, new_value)
+        if self.gif_animations and round(old_value) != round(new_value):
+            # Resume GIFs scrolled into view, pause the ones scrolled out
+            self.schedule_gif_clock()
+        if (new_value < old_value and new_value < self.size.height
+                and app_state.history_start and not self.history_requested):
+            # Close to the top: fetch the previous page of history
+            self.history_requested = True
+            self.run_worker(self.load_older_history(), group="history")
     
     def stop_gif_animations(self):
         """Stop all GIF animations."""
-        for timer in self.gif_timers.values():
-            timer.stop()
-        self.gif_timers.clear()
+        if self.gif_clock is not None:
+            self.gif_clock.stop()
+            self.gif_clock = None
+        self.gif_animations.clear()
 
-    def update_file_display(self, file_info: FileMessage, download_link: bool = True):
-        """Update file message with download info."""
-        if self.messages and len(self.messages) >= 2:
-            size_str = format_file_size(file_info.file_size)
-            
-            if download_link:
-                content = Text(f"📥 Téléchargeable: {file_info.filename} ({size_str})\n", style="green")
-                content.append("Ctrl+D pour ouvrir le gestionnaire de téléchargements", style="dim")
-            else:
-                content = Text(f"📎 Fichier local: {file_info.filename} ({size_str})", style="blue")
-            
-            self.messages[-1] = content
-            self.update_messages()
-            self.scroll_end()
+    def update_file_display(self, handle: Optional[int], file_info: FileMessage, download_link: bool = True):
+        """Replace the placeholder of a file message (handle from add_message) with its download info."""
+        message_index = self.pending_slots.pop(handle, None)
+        if message_index is not None:
+            self.set_entry(message_index, ("file", file_info, download_link))
+            self.scroll_end(animate=False)
+
+    def clear_messages(self):
+        """Remove every message from the view."""
+        self.stop_gif_animations()
+        image_pool.cancel("history")
+        if self.flush_timer is not None:
+            self.flush_timer.stop()
+            self.flush_timer = None
+        self.pending_entries = 0
+        self.pending_slots.clear()
+        self.page_entries = []
+        self.entries = []
+        self.line_index = LineIndex()
+        self.strip_cache.clear()
+        self.update_virtual_size()
+        self.refresh()
 
     def load_conversation_history(self):
-        """Load and display conversation history."""
-        self.messages = []
-        
-        for conv_msg in app_state.current_conversation:
-            # Add the basic message
-            self.add_message(
+        """Load and display the pages of conversation history in memory."""
+        self.clear_messages()
+        entries = []
+        for page in app_state.history_pages:
+            page_entries = [("page", page.start)] if page.messages is None else self.history_entries(page.messages)
+            self.page_entries.append(len(page_entries))
+            entries.extend(page_entries)
+        self.append_entries(entries + self.history_entries(app_state.current_conversation))
+
+    async def load_older_history(self):
+        """Prepend the previous page of history, keeping the viewport on the same lines."""
+        page = await app_state.load_older_messages()
+        self.history_requested = False
+        if page is not None:
+            entries = self.history_entries(page.messages)
+            self.page_entries.insert(0, len(entries))
+            self.splice_entries(0, 0, entries)
+            self.trim_history_pages()
+
+    def history_page(self, start: int) -> Optional[HistoryPage]:
+        return next((page for page in app_state.history_pages if page.start == start), None)
+
+    def request_page(self, page: HistoryPage):
+        """Read a dropped page again in the background, once."""
+        if page.start not in self.page_requests:
+            self.page_requests.add(page.start)
+            self.run_worker(self.reload_history_page(page), group="history")
+
+    async def reload_history_page(self, page: HistoryPage):
+        """Put a dropped page back in place of its stub, now that it is scrolled into view."""
+        try:
+            if page.messages is None and not await app_state.read_history_page(page):
+                return
+        finally:
+            self.page_requests.discard(page.start)
+        if page not in app_state.history_pages:
+            return  # Dropped from the top, or the conversation changed
+        position = app_state.history_pages.index(page)
+        index = sum(self.page_entries[:position])
+        if self.entries[index] != ("page", page.start):
+            return
+        entries = self.history_entries(page.messages)
+        self.page_entries[position] = len(entries)
+        self.splice_entries(index, 1, entries)
+        self.trim_history_pages()
+
+    def trim_history_pages(self):
+        """Bound memory while scrolling: beyond UIConfig.history_max_pages loaded pages, replace
+        the ones farthest from the viewport by a one-line stub, read again when shown."""
+        pages = app_state.history_pages
+        starts = list(itertools.accumulate([0] + self.page_entries))  # First entry of each page
+        top, bottom = self.scroll_y, self.scroll_y + self.size.height
+        
+        def distance(position: int) -> float:
+            first, last = self.line_index.prefix(starts[position]), self.line_index.prefix(starts[position + 1])
+            return max(first - bottom, top - last, 0)
+        
+        loaded = [position for position, page in enumerate(pages) if page.messages is not None]
+        excess = len(loaded) - max(1, config_manager.get_ui_config().history_max_pages)
+        # Pages within a screen of the viewport stay, or they would be read back right away
+        far = [position for position in loaded if distance(position) > self.size.height]
+        dropped = sorted(far, key=distance, reverse=True)[:max(0, excess)]
+        # Bottom first, so the entry indices of the pages above stay valid
+        for position in sorted(dropped, reverse=True):
+            pages[position].messages = None
+            self.splice_entries(starts[position], self.page_entries[position], [("page", pages[position].start)])
+            self.page_entries[position] = 1
+        
+        # Stubs at the very top are not needed: scrolling up pages them in again
+        while (pages and pages[0].messages is None and pages[0].start not in self.page_requests
+               and pages[0].log is app_state.conversation_log):
+            app_state.history_start = pages.pop(0).stop
+            self.page_entries.pop(0)
+            self.splice_entries(0, 1, [])
+
+    def history_entries(self, messages: List[ConversationMessage]) -> List[Any]:
+        """Build the records of stored conversation messages."""
+        entries = []
+        for conv_msg in messages:
+            # Add the basic message, already part of the conversation record
+            message_entries = self.build_entries(
                 conv_msg.sender,
                 conv_msg.content,
                 conv_msg.timestamp,
@@ -2251,26 +3431,16 @@ class ChatView(ScrollableContainer):
             
             # For files, add download info
             if conv_msg.message_type == "file" and conv_msg.file_info:
-                if conv_msg.sender != app_state.username:
-                    self.update_file_display(conv_msg.file_info, download_link=True)
-                else:
-                    self.update_file_display(conv_msg.file_info, download_link=False)
+                download_link = conv_msg.sender != app_state.username
+                message_entries[-1] = ("file", conv_msg.file_info, download_link)
             
-            # For images, add preview if available
-            elif conv_msg.message_type == "image":
-                # Could load cached preview here
-                pass
-
-    def update_messages(self):
-        self.query("*").remove()
-        for msg in self.messages:
-            if isinstance(msg, Pixels):
-                    self.mount(Static(msg))
-            else:
-                self.mount(Static(msg))
-
-    def compose(self) -> ComposeResult:
-        yield Static("La conversation apparaîtra ici")
+            # For images, show the cached preview; it is rendered when scrolled into view
+            elif conv_msg.message_type == "image" and conv_msg.preview_hash:
+                message_entries[-1] = ("preview", conv_msg.preview_hash, conv_msg.sender == app_state.username)
+            
+            entries.extend(message_entries)
+        
+        return entries
 
 # ─────────────────────────── application ────────────────────────────
 class EncodHexApp(App):
@@ -2406,6 +3576,7 @@ class EncodHexApp(App):
         Binding("f1", "manage_contacts", "👥 Contacts", show=True),
         Binding("f2", "manage_downloads", "📥 Téléchargements", show=True),
         Binding("f3", "load_conversation", "📜 Historique", show=True),
+        Binding("f4", "search_messages", "🔎 Recherche", show=True),
         Binding("f5", "select_file", "📎 Fichier", show=True),
     ]
 
@@ -2422,6 +3593,7 @@ class EncodHexApp(App):
 
     # ────────────────────────── lifecycle ──────────────────────────
     async def on_mount(self) -> None:
+        image_pool.start()
         await self.show_welcome()
         input_field = self.query_one("#user-input")
         input_field.focus()
@@ -2429,6 +3601,10 @@ class EncodHexApp(App):
         self.set_interval(0.01, self.update_input_container_styling)
         self.set_interval(1.0, self.update_ui_status)  # Regular status updates
         
+        # Peer heartbeats, checked at the ping timeout granularity
+        network_config = config_manager.get_network_config()
+        self.set_interval(max(1, network_config.ping_timeout), self.check_peer_liveness)
+        
         self.query_one("#header").title = (
             "Chat Peer-to-Peer chiffré avec Diffie-Hellman/AES-256 - Mesh Network"
         )
@@ -2455,6 +3631,15 @@ class EncodHexApp(App):
             status = f"{app_state.username} | {app_state.local_ip}:{app_state.port} | Peers: {peer_count}"
             if peer_count > 0:
                 status += " | 🔒 Chiffré"
+                rtts = [peer.rtt for peer in app_state.get_ready_peers() if peer.rtt is not None]
+                if rtts:
+                    status += f" | RTT: {sum(rtts) / len(rtts) * 1000:.0f} ms"
+                suspects = sum(1 for peer in app_state.get_ready_peers() if peer.liveness == "suspect")
+                if suspects:
+                    status += f" | ⚠️ {suspects} peer(s) sans réponse"
+                saved = sum(peer.bytes_saved for peer in app_state.get_ready_peers())
+                if saved:
+                    status += f" | 🗜️ {format_file_size(saved)} économisés"
                 # Switch from waiting mode if we have connections
                 if app_state.in_waiting_mode and peer_count > 0:
                     app_state.in_waiting_mode = False
@@ -2502,6 +3687,9 @@ class EncodHexApp(App):
         # Show file, downloads, and history only in conversation
         if action in {"select_file", "manage_downloads", "load_conversation"}:
             return self.app_state_ui == "conversation"
+        # Search needs the SQLite store
+        if action == "search_messages":
+            return config_manager.get_storage_config().backend == "sqlite"
         # Show step back in config screens and conversation
         if action == "step_back_or_reset":
             return self.app_state_ui.startswith("setup_") or self.app_state_ui == "conversation"
@@ -2795,6 +3983,11 @@ class EncodHexApp(App):
         """Handle different types of messages in the mesh network."""
         timestamp = datetime.now().strftime("%H:%M:%S")
         
+        # Any frame from a peer proves it is alive
+        peer = app_state.peers.get(peer_key) if peer_key else None
+        if peer:
+            peer.mark_seen()
+        
         if message_type == 'hello':
             await self.handle_hello_message(data, remote_ip, remote_port, peer_key, websocket)
         
@@ -2816,6 +4009,20 @@ class EncodHexApp(App):
         elif message_type == 'file':
             await self.handle_file_message(data, peer_key)
         
+        elif message_type == 'ping':
+            await self.send_json_to_peer(remote_ip, remote_port, {
+                "type": "pong",
+                "nonce": data.get("nonce"),
+                "sender": app_state.username,
+                "sender_port": app_state.port
+            })
+        
+        elif message_type == 'pong':
+            if peer:
+                sent_at = peer.pending_pings.pop(data.get("nonce"), None)
+                if sent_at is not None:
+                    peer.record_rtt(time.monotonic() - sent_at)
+        
         elif message_type == 'ack':
             # Acknowledgment messages don't need special handling
             pass
@@ -2831,10 +4038,14 @@ class EncodHexApp(App):
         # Add peer to our network
         peer = app_state.add_peer(remote_ip, remote_port, websocket)
         peer.connection_established = True
+        peer.compression = negotiate_compression(data.get("compression"))
+        peer.heartbeat = bool(data.get("heartbeat"))
         
         # Send list of existing peers to the new peer
-        existing_peers = [(p.ip, p.port) for p in app_state.peers.values() 
-                         if (p.ip != remote_ip or p.port != remote_port) and p.connection_established]
+        # Suspect peers are left out and the most responsive ones come first
+        existing_peers = [(p.ip, p.port) for p in sorted(app_state.peers.values(), key=peer_rtt_order)
+                         if (p.ip != remote_ip or p.port != remote_port) and p.connection_established
+                         and p.liveness == "alive"]
         
         if existing_peers:
             await self.send_json_to_peer(remote_ip, remote_port, {
@@ -2887,6 +4098,8 @@ class EncodHexApp(App):
                             "type": "hello",
                             "sender": app_state.username,
                             "i_generate": False,  # Let the other peer generate if needed
+                            "compression": advertised_compression(),
+                            "heartbeat": True,
                             "timestamp": datetime.now().strftime("%H:%M:%S"),
                             "sender_port": app_state.port
                         }))
@@ -2965,6 +4178,10 @@ class EncodHexApp(App):
         shared_key = compute_shared_key(p, other_public, dh_exchange.private_key)
         peer.shared_key = str(shared_key)
         peer.encryption_ready = True
+        if "compression" in data:
+            peer.compression = negotiate_compression(data["compression"])
+        if "heartbeat" in data:
+            peer.heartbeat = bool(data["heartbeat"])
         
         self.chat_view.add_message("Système", f"🔒 Chiffrement établi avec {remote_ip}:{remote_port}!")
 
@@ -2987,8 +4204,8 @@ class EncodHexApp(App):
         app_state.message_ids.add(message_id)
         
         try:
-            decrypted_message = decrypt(data['message'], peer.shared_key)
-            self.chat_view.add_message(data.get('sender', 'Inconnu'), decrypted_message, data.get('timestamp'))
+            decrypted_message = decode_text_body(decrypt(data['message'], peer.shared_key), data.get('encoding'))
+            self.chat_view.add_message(data.get('sender', 'Inconnu'), decrypted_message, data.get('timestamp'), message_id=message_id)
             
             # Forward to other peers (FIXED: re-encrypt for each peer)
             await self.forward_decrypted_message_to_peers(
@@ -2996,7 +4213,8 @@ class EncodHexApp(App):
                 message=decrypted_message,
                 message_id=message_id,
                 timestamp=data.get('timestamp'),
-                exclude_peer=peer_key
+                exclude_peer=peer_key,
+                reached=data.get('reached')
             )
             
         except Exception as e:
@@ -3020,66 +4238,51 @@ class EncodHexApp(App):
         
         app_state.message_ids.add(message_id)
         
-        # Display placeholder immediately
-        self.chat_view.add_message(data.get('sender', 'Inconnu'), "[Image reçue - Traitement en cours...]", 
-                                 data.get('timestamp'), is_image=True)
-        
         # Process image in parallel without blocking the UI
         asyncio.create_task(self._process_received_image_parallel(
-            data, peer, message_id
+            data, peer, peer_key, message_id
         ))
+    
+    async def _process_received_image_parallel(self, data, peer, peer_key, message_id):
+        """Decrypt, keep and render a received image in the thread pool, then relay it."""
+        loop = asyncio.get_event_loop()
+        try:
+            # Decrypt and decode in memory, without a temp file, and keep the preview for history
+            def decode_image():
+                body = decrypt(data['image_data'], peer.shared_key)
+                image_bytes = decode_binary_body(body, data.get('encoding'))
+                return image_bytes, preview_cache.store_source(image_bytes)
+            
+            image_bytes, preview_hash = await loop.run_in_executor(None, decode_image)
+        except Exception as e:
+            self.chat_view.add_message("Système", f"Erreur de traitement d'image: {e}")
+            return
+        
+        # Forward to other peers without waiting for the rendering
+        if app_state.get_relay_targets(set(data.get('reached') or []), peer_key):
+            asyncio.create_task(self._relay_received_image(data, image_bytes, message_id, peer_key))
         
-        # Forward to other peers immediately (don't wait for processing)
+        # Identical images (forwarded copies, resends) come out of the render cache
+        display_content = await process_image_for_display_async(image_bytes)
+        
+        # Record and display together, so no other message lands in between
+        handle = self.chat_view.add_message(data.get('sender', 'Inconnu'), "[Image reçue]", data.get('timestamp'),
+                                   is_image=True, message_id=message_id, preview_hash=preview_hash)
+        self.chat_view.update_image_display(handle, display_content, preview_hash)
+    
+    async def _relay_received_image(self, data, image_bytes, message_id, peer_key):
         try:
-            decrypted_b64 = decrypt(data['image_data'], peer.shared_key)
             await self.forward_image_to_peers(
                 sender=data.get('sender', 'Inconnu'),
-                image_b64=decrypted_b64,
+                image_b64=base64.b64encode(image_bytes).decode('ascii'),
                 message_id=message_id,
                 timestamp=data.get('timestamp'),
-                exclude_peer=peer_key
+                exclude_peer=peer_key,
+                reached=data.get('reached')
             )
         except Exception as e:
             self.chat_view.add_message("Système", f"Erreur de forwarding d'image: {e}")
     
-    async def _process_received_image_parallel(self, data, peer, message_id):
-        """Process received image in parallel using thread pool."""
-        try:
-            # Decrypt in thread pool to avoid blocking
-            def decrypt_image():
-                return decrypt(data['image_data'], peer.shared_key)
-            
-            loop = asyncio.get_event_loop()
-            decrypted_b64 = await loop.run_in_executor(None, decrypt_image)
-            
-            # Decode and save to temp file in thread pool
-            def save_temp_image():
-                image_bytes = base64.b64decode(decrypted_b64)
-                temp_path = f"temp_image_{message_id}.png"
-                with open(temp_path, 'wb') as f:
-                    f.write(image_bytes)
-                return temp_path
-            
-            temp_path = await loop.run_in_executor(None, save_temp_image)
-            
-            # Process for display with quality settings
-            display_content = await process_image_for_display_async(temp_path)
-            
-            # Update the display on main thread
-            self.chat_view.update_image_display(display_content)
-            
-            # Clean up temp file in thread pool
-            def cleanup():
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
-            
-            await loop.run_in_executor(None, cleanup)
-            
-        except Exception as e:
-            self.chat_view.update_image_display(f"[Erreur de traitement: {e}]")
-    
     async def handle_file_message(self, data, peer_key):
         """Handle encrypted file messages."""
         if 'file_data' not in data or 'file_info' not in data:
@@ -3099,8 +4302,6 @@ class EncodHexApp(App):
         app_state.message_ids.add(message_id)
         
         try:
-            # Decrypt file data
-            decrypted_b64 = decrypt(data['file_data'], peer.shared_key)
             file_info_data = data['file_info']
             
             # Create FileMessage object
@@ -3114,111 +4315,127 @@ class EncodHexApp(App):
                 download_available=True
             )
             
-            # Save file to temp folder for verification
+            # Decrypt into the temp folder, verifying the hash on the way, off the event loop
             temp_path = os.path.join(app_state.temp_folder, f"received_{message_id}_{file_info.filename}")
-            file_bytes = base64.b64decode(decrypted_b64)
-            
-            with open(temp_path, 'wb') as f:
-                f.write(file_bytes)
-            
-            # Verify file hash
-            import hashlib
-            with open(temp_path, 'rb') as f:
-                received_hash = hashlib.sha256(f.read()).hexdigest()
+            loop = asyncio.get_event_loop()
+            verified = await loop.run_in_executor(
+                None, receive_file, data['file_data'], peer.shared_key, data.get('encoding'),
+                temp_path, file_info.file_size, file_info.file_hash)
             
-            if received_hash != file_info.file_hash:
+            if not verified:
                 self.chat_view.add_message("Système", f"⚠️ Erreur d'intégrité du fichier {file_info.filename}")
-                os.remove(temp_path)
                 return
             
             # Add message to chat
-            self.chat_view.add_message(
+            handle = self.chat_view.add_message(
                 data.get('sender', 'Inconnu'),
                 f"Fichier partagé: {file_info.filename}",
                 data.get('timestamp'),
                 "file",
-                file_info
+                file_info,
+                message_id=message_id
             )
             
             # Update file display
-            self.chat_view.update_file_display(file_info, download_link=True)
+            self.chat_view.update_file_display(handle, file_info, download_link=True)
             
             # Forward to other peers
             await self.forward_file_to_peers(
                 sender=data.get('sender', 'Inconnu'),
-                file_b64=decrypted_b64,
+                file_path=temp_path,
                 file_info_data=file_info_data,
                 message_id=message_id,
                 timestamp=data.get('timestamp'),
-                exclude_peer=peer_key
+                exclude_peer=peer_key,
+                reached=data.get('reached')
             )
             
         except Exception as e:
             self.chat_view.add_message("Système", f"Erreur de traitement du fichier: {e}")
     
-    async def forward_file_to_peers(self, sender, file_b64, file_info_data, message_id, timestamp, exclude_peer=None):
-        """Forward a decrypted file to all other peers (re-encrypted for each)."""
-        ready_peers = app_state.get_ready_peers()
+    def _plan_relay(self, reached, exclude_peer):
+        """Pick the peers to relay to and the reached set to advertise to them."""
+        reached = set(reached or [])
+        targets = app_state.get_relay_targets(reached, exclude_peer)
+        
+        # Everyone we relay to, plus ourselves and the peer we got it from, has the message
+        advertised = reached | {app_state.get_self_key()}
+        if exclude_peer:
+            advertised.add(exclude_peer)
+        advertised.update(app_state.get_peer_key(peer.ip, peer.port) for peer in targets)
+        return targets, sorted(advertised)
+
+    async def forward_file_to_peers(self, sender, file_path, file_info_data, message_id, timestamp, exclude_peer=None, reached=None):
+        """Forward a received file to the peers that don't have it yet (re-encrypted for each)."""
+        targets, advertised = self._plan_relay(reached, exclude_peer)
+        if not targets:
+            return
         
-        for peer in ready_peers:
-            peer_key = app_state.get_peer_key(peer.ip, peer.port)
-            if peer_key != exclude_peer:
-                try:
-                    # Re-encrypt with this peer's key
-                    encrypted_file = encrypt(file_b64, peer.shared_key)
-                    await self.send_json_to_peer(peer.ip, peer.port, {
-                        "type": "file",
-                        "sender": sender,
-                        "file_data": encrypted_file,
-                        "file_info": file_info_data,
-                        "message_id": message_id,
-                        "timestamp": timestamp,
-                        "sender_port": app_state.port
-                    })
-                except Exception as e:
-                    self.chat_view.add_message("Système", f"Erreur forwarding fichier vers {peer.ip}:{peer.port}: {e}")
+        # Read back from disk, only when someone needs it
+        loop = asyncio.get_event_loop()
+        wire = await loop.run_in_executor(None, WirePayload.from_file, file_path)
+        
+        for peer in targets:
+            try:
+                # Re-encrypt with this peer's key
+                encrypted_file, encoding = await wire.encrypt_for_peer(peer)
+                await self.send_json_to_peer(peer.ip, peer.port, {
+                    "type": "file",
+                    "sender": sender,
+                    "file_data": encrypted_file,
+                    "encoding": encoding,
+                    "file_info": file_info_data,
+                    "message_id": message_id,
+                    "timestamp": timestamp,
+                    "reached": advertised,
+                    "sender_port": app_state.port
+                })
+            except Exception as e:
+                self.chat_view.add_message("Système", f"Erreur forwarding fichier vers {peer.ip}:{peer.port}: {e}")
 
-    async def forward_decrypted_message_to_peers(self, sender, message, message_id, timestamp, exclude_peer=None):
-        """Forward a decrypted message to all other peers (re-encrypted for each)."""
-        ready_peers = app_state.get_ready_peers()
+    async def forward_decrypted_message_to_peers(self, sender, message, message_id, timestamp, exclude_peer=None, reached=None):
+        """Forward a decrypted message to the peers that don't have it yet (re-encrypted for each)."""
+        targets, advertised = self._plan_relay(reached, exclude_peer)
+        wire = WirePayload.from_text(message)
         
-        for peer in ready_peers:
-            peer_key = app_state.get_peer_key(peer.ip, peer.port)
-            if peer_key != exclude_peer:
-                try:
-                    # Re-encrypt with this peer's key
-                    encrypted_message = encrypt(message, peer.shared_key)
-                    await self.send_json_to_peer(peer.ip, peer.port, {
-                        "type": "text",
-                        "sender": sender,
-                        "message": encrypted_message,
-                        "message_id": message_id,
-                        "timestamp": timestamp,
-                        "sender_port": app_state.port
-                    })
-                except Exception as e:
-                    self.chat_view.add_message("Système", f"Erreur forwarding vers {peer.ip}:{peer.port}: {e}")
+        for peer in targets:
+            try:
+                # Re-encrypt with this peer's key
+                encrypted_message, encoding = await wire.encrypt_for_peer(peer)
+                await self.send_json_to_peer(peer.ip, peer.port, {
+                    "type": "text",
+                    "sender": sender,
+                    "message": encrypted_message,
+                    "encoding": encoding,
+                    "message_id": message_id,
+                    "timestamp": timestamp,
+                    "reached": advertised,
+                    "sender_port": app_state.port
+                })
+            except Exception as e:
+                self.chat_view.add_message("Système", f"Erreur forwarding vers {peer.ip}:{peer.port}: {e}")
 
-    async def forward_image_to_peers(self, sender, image_b64, message_id, timestamp, exclude_peer=None):
-        """Forward a decrypted image to all other peers (re-encrypted for each)."""
-        ready_peers = app_state.get_ready_peers()
+    async def forward_image_to_peers(self, sender, image_b64, message_id, timestamp, exclude_peer=None, reached=None):
+        """Forward a decrypted image to the peers that don't have it yet (re-encrypted for each)."""
+        targets, advertised = self._plan_relay(reached, exclude_peer)
+        wire = WirePayload.from_b64(image_b64)
         
-        for peer in ready_peers:
-            peer_key = app_state.get_peer_key(peer.ip, peer.port)
-            if peer_key != exclude_peer:
-                try:
-                    # Re-encrypt with this peer's key
-                    encrypted_image = encrypt(image_b64, peer.shared_key)
-                    await self.send_json_to_peer(peer.ip, peer.port, {
-                        "type": "image",
-                        "sender": sender,
-                        "image_data": encrypted_image,
-                        "message_id": message_id,
-                        "timestamp": timestamp,
-                        "sender_port": app_state.port
-                    })
-                except Exception as e:
-                    self.chat_view.add_message("Système", f"Erreur forwarding image vers {peer.ip}:{peer.port}: {e}")
+        for peer in targets:
+            try:
+                # Re-encrypt with this peer's key
+                encrypted_image, encoding = await wire.encrypt_for_peer(peer)
+                await self.send_json_to_peer(peer.ip, peer.port, {
+                    "type": "image",
+                    "sender": sender,
+                    "image_data": encrypted_image,
+                    "encoding": encoding,
+                    "message_id": message_id,
+                    "timestamp": timestamp,
+                    "reached": advertised,
+                    "sender_port": app_state.port
+                })
+            except Exception as e:
+                self.chat_view.add_message("Système", f"Erreur forwarding image vers {peer.ip}:{peer.port}: {e}")
 
     async def initiate_dh_exchange(self, remote_ip, remote_port, peer_key, they_generate):
         """Initiate Diffie-Hellman key exchange."""
@@ -3244,19 +4461,74 @@ class EncodHexApp(App):
             await self.send_dh_public_key_to_peer(remote_ip, remote_port, dh_exchange.public_key)
 
     async def send_json_to_peer(self, target_ip, target_port, payload):
-        """Send JSON to a specific peer with retry logic."""
-        max_retries = 2
+        """Send JSON to a specific peer through its prioritized outbox."""
+        peer = app_state.get_peer(target_ip, target_port)
+        if peer is None:
+            return await self._transmit_to_peer(target_ip, target_port, json.dumps(payload))
+        
+        if peer.outbox is None:
+            network_config = config_manager.get_network_config()
+            peer.outbox = PeerOutbox(
+                lambda message: self._transmit_to_peer(target_ip, target_port, message),
+                high_watermark=network_config.outbound_high_watermark,
+                low_watermark=network_config.outbound_low_watermark,
+            )
+        return await peer.outbox.send(payload)
+    
+    async def _transmit_to_peer(self, target_ip, target_port, message: str):
+        """Deliver a serialized frame to a specific peer with retry logic."""
+        peer = app_state.get_peer(target_ip, target_port)
+        # Suspect peers get a single attempt so they don't stall every broadcast
+        max_retries = 1 if peer and peer.liveness == "suspect" else 2
         for attempt in range(max_retries):
             try:
                 uri = f"ws://{target_ip}:{target_port}"
                 async with websockets.connect(uri, ping_timeout=5, close_timeout=3) as ws:
-                    await ws.send(json.dumps(payload))
+                    await ws.send(message)
                     return True
             except Exception as e:
                 if attempt == max_retries - 1:
+                    if peer:
+                        peer.liveness = "suspect"
                     return False
                 await asyncio.sleep(0.5)
         return False
+    
+    async def check_peer_liveness(self):
+        """Heartbeat idle peers, flag silent ones as suspect and drop dead ones."""
+        network_config = config_manager.get_network_config()
+        now = time.monotonic()
+        
+        for peer in list(app_state.peers.values()):
+            # Peers that never advertised heartbeats don't answer pings: being quiet proves nothing
+            if not peer.connection_established or not peer.heartbeat:
+                continue
+            
+            idle = now - peer.last_seen
+            if idle >= network_config.connection_timeout:
+                app_state.remove_peer(peer.ip, peer.port)
+                self.chat_view.add_message("Système", f"Peer {peer.ip}:{peer.port} ne répond plus, déconnecté")
+                continue
+            
+            if idle >= network_config.ping_interval + network_config.ping_timeout:
+                peer.liveness = "suspect"
+            
+            # Pings expire after ping_timeout
+            peer.pending_pings = {nonce: sent_at for nonce, sent_at in peer.pending_pings.items()
+                                  if now - sent_at < network_config.ping_timeout}
+            
+            # Only idle peers need a heartbeat; suspects are probed on every check
+            ping_due = now - peer.last_ping >= network_config.ping_interval
+            if idle >= network_config.ping_interval and (ping_due or peer.liveness == "suspect"):
+                nonce = f"{now:.6f}"
+                peer.pending_pings[nonce] = now
+                peer.last_ping = now
+                asyncio.create_task(self.send_json_to_peer(peer.ip, peer.port, {
+                    "type": "ping",
+                    "nonce": nonce,
+                    "sender": app_state.username,
+                    "sender_port": app_state.port
+                }))
 
     async def send_hello(self, uri, i_generate):
         """Envoie un message hello pour initier la connexion."""
@@ -3267,6 +4539,8 @@ class EncodHexApp(App):
             "type": "hello",
                     "sender": app_state.username,
             "i_generate": i_generate,
+            "compression": advertised_compression(),
+            "heartbeat": True,
             "timestamp": timestamp,
                     "sender_port": app_state.port
                 }))
@@ -3298,6 +4572,8 @@ class EncodHexApp(App):
             "type": "dh_public_key",
             "sender": app_state.username,
             "public_key": pub_key,
+            "compression": advertised_compression(),
+            "heartbeat": True,
             "timestamp": timestamp,
             "sender_port": app_state.port
         })
@@ -3306,7 +4582,7 @@ class EncodHexApp(App):
             self.chat_view.add_message("Système", f"Clé publique envoyée à {target_ip}:{target_port}")
         return success
 
-    async def broadcast_message_to_peers(self, message_text=None, image_path=None, file_path=None):
+    async def broadcast_message_to_peers(self, message_text=None, image_path=None, file_path=None, image_data=None):
         """Broadcast a message, image, or file to all connected peers CONCURRENTLY."""
         ready_peers = app_state.get_ready_peers()
         if not ready_peers:
@@ -3316,19 +4592,38 @@ class EncodHexApp(App):
         message_id = generate_message_id()
         app_state.message_ids.add(message_id)  # Prevent echo
         
+        # Every peer we address directly already has the message, so receivers
+        # must not relay it to them again
+        reached = sorted({app_state.get_self_key()} | {app_state.get_peer_key(p.ip, p.port) for p in ready_peers})
+        
+        # Read (and compress) the payload once for every peer
+        if message_text is not None:
+            wire = WirePayload.from_text(message_text)
+        elif image_path is not None:
+            # Images go out as a small preview; the full file is shared as a file message
+            if image_data is None:
+                loop = asyncio.get_event_loop()
+                image_data = await loop.run_in_executor(None, make_image_thumbnail, image_path)
+            wire = WirePayload(raw=image_data, filename=os.path.basename(image_path))
+        elif file_path is not None:
+            loop = asyncio.get_event_loop()
+            wire = await loop.run_in_executor(None, WirePayload.from_file, file_path)
+            # Hashed once for every peer, and not again if the file was already sent
+            file_info = await file_info_cache.get_async(file_path)
+        
         # Prepare tasks for concurrent sending
         send_tasks = []
         
         for peer in ready_peers:
             if message_text is not None:
                 # Text message task
-                task = self._send_text_to_peer(peer, message_text, message_id)
+                task = self._send_text_to_peer(peer, message_text, message_id, reached, wire)
             elif image_path is not None:
                 # Image message task
-                task = self._send_image_to_peer(peer, image_path, message_id)
+                task = self._send_image_to_peer(peer, image_path, message_id, reached, wire)
             elif file_path is not None:
                 # File message task
-                task = self._send_file_to_peer(peer, file_path, message_id)
+                task = self._send_file_to_peer(peer, file_path, message_id, reached, wire, file_info)
             else:
                 continue
             
@@ -3343,57 +4638,60 @@ class EncodHexApp(App):
             if failures:
                 self.chat_view.add_message("Système", f"Erreurs d'envoi: {len(failures)}/{len(send_tasks)} échecs")
     
-    async def _send_text_to_peer(self, peer: PeerConnection, message_text: str, message_id: str):
+    async def _send_text_to_peer(self, peer: PeerConnection, message_text: str, message_id: str,
+                                 reached: Optional[List[str]] = None, wire: Optional[WirePayload] = None):
         """Send a text message to a specific peer."""
         try:
             timestamp = datetime.now().strftime("%H:%M:%S")
-            encrypted_message = encrypt(message_text, peer.shared_key)
+            encrypted_message, encoding = await (wire or WirePayload.from_text(message_text)).encrypt_for_peer(peer)
             
             await self.send_json_to_peer(peer.ip, peer.port, {
                 "type": "text",
                 "sender": app_state.username,
                 "message": encrypted_message,
+                "encoding": encoding,
                 "message_id": message_id,
                     "timestamp": timestamp,
+                "reached": reached or [],
                 "sender_port": app_state.port
             })
         except Exception as e:
             self.chat_view.add_message("Système", f"Erreur d'envoi vers {peer.ip}:{peer.port}: {e}")
             raise e
     
-    async def _send_image_to_peer(self, peer: PeerConnection, image_path: str, message_id: str):
+    async def _send_image_to_peer(self, peer: PeerConnection, image_path: str, message_id: str,
+                                  reached: Optional[List[str]] = None, wire: Optional[WirePayload] = None):
         """Send an image to a specific peer."""
         try:
             timestamp = datetime.now().strftime("%H:%M:%S")
             
             # Read and encode image
-            with open(image_path, 'rb') as img_file:
-                image_data = base64.b64encode(img_file.read()).decode('utf-8')
-            
-            encrypted_image = encrypt(image_data, peer.shared_key)
+            encrypted_image, encoding = await (wire or WirePayload.from_file(image_path)).encrypt_for_peer(peer)
             
             await self.send_json_to_peer(peer.ip, peer.port, {
                 "type": "image",
                 "sender": app_state.username,
                 "image_data": encrypted_image,
+                "encoding": encoding,
                 "message_id": message_id,
                 "timestamp": timestamp,
+                "reached": reached or [],
                 "sender_port": app_state.port
             })
         except Exception as e:
             self.chat_view.add_message("Système", f"Erreur d'envoi d'image vers {peer.ip}:{peer.port}: {e}")
             raise e
     
-    async def _send_file_to_peer(self, peer: PeerConnection, file_path: str, message_id: str):
+    async def _send_file_to_peer(self, peer: PeerConnection, file_path: str, message_id: str,
+                                 reached: Optional[List[str]] = None, wire: Optional[WirePayload] = None,
+                                 file_info: Optional[Tuple[str, int, str, str]] = None):
         """Send a file to a specific peer."""
         try:
             timestamp = datetime.now().strftime("%H:%M:%S")
             
             # Get file info and read file
-            filename, file_size, file_type, file_hash = get_file_info(file_path)
-            
-            with open(file_path, 'rb') as f:
-                file_data = base64.b64encode(f.read()).decode('utf-8')
+            filename, file_size, file_type, file_hash = file_info or await file_info_cache.get_async(file_path)
+            encrypted_file, encoding = await (wire or WirePayload.from_file(file_path)).encrypt_for_peer(peer)
             
             # Create file info object
             file_info = {
@@ -3403,15 +4701,16 @@ class EncodHexApp(App):
                 "file_hash": file_hash
             }
             
-            encrypted_file = encrypt(file_data, peer.shared_key)
             
             await self.send_json_to_peer(peer.ip, peer.port, {
                 "type": "file",
                 "sender": app_state.username,
                 "file_data": encrypted_file,
+                "encoding": encoding,
                 "file_info": file_info,
                 "message_id": message_id,
                 "timestamp": timestamp,
+                "reached": reached or [],
                 "sender_port": app_state.port
             })
         except Exception as e:
@@ -3519,18 +4818,20 @@ class EncodHexApp(App):
                 
                 # Determine if it's an image or regular file
                 if is_image_file(message):
-                    # Handle as image with preview
-                    self.chat_view.add_message(app_state.username, "[Image envoyée]", message_type="image")
+                    # Make the preview sent to peers, keep it for history and show it
+                    loop = asyncio.get_event_loop()
+                    thumbnail, preview_hash = await loop.run_in_executor(None, store_image_thumbnail, message)
+                    display_content = await process_image_for_display_async(thumbnail)
+                    handle = self.chat_view.add_message(app_state.username, "[Image envoyée]", message_type="image",
+                                               preview_hash=preview_hash)
+                    self.chat_view.update_image_display(handle, display_content, preview_hash)
                     
-                    # Process image asynchronously for preview
-                    display_content = await process_image_for_display_async(message)
-                    self.chat_view.update_image_display(display_content)
-                    
-                    # Send as image
-                    await self.broadcast_message_to_peers(image_path=message)
+                    # Send the preview, then the full file once for download
+                    await self.broadcast_message_to_peers(image_path=message, image_data=thumbnail)
+                    await self.broadcast_message_to_peers(file_path=message)
                 else:
                     # Handle as regular file
-                    filename, file_size, file_type, file_hash = get_file_info(message)
+                    filename, file_size, file_type, file_hash = await file_info_cache.get_async(message)
                     file_info = FileMessage(
                         sender=app_state.username,
                         filename=filename,
@@ -3541,8 +4842,8 @@ class EncodHexApp(App):
                         download_available=False  # Local file, no download needed
                     )
                     
-                    self.chat_view.add_message(app_state.username, f"Fichier partagé: {filename}", message_type="file", file_info=file_info)
-                    self.chat_view.update_file_display(file_info, download_link=False)
+                    handle = self.chat_view.add_message(app_state.username, f"Fichier partagé: {filename}", message_type="file", file_info=file_info)
+                    self.chat_view.update_file_display(handle, file_info, download_link=False)
                     
                     # Send as file
                     await self.broadcast_message_to_peers(file_path=message)
@@ -3584,6 +4885,18 @@ class EncodHexApp(App):
         except Exception as e:
             self.notify(f"Erreur lors de l'ouverture du gestionnaire de contacts: {e}", severity="error")
     
+    async def action_search_messages(self) -> None:
+        """Open message search (F4)."""
+        storage_config = config_manager.get_storage_config()
+        if storage_config.backend != "sqlite":
+            self.notify("Recherche disponible uniquement avec le stockage SQLite", severity="warning")
+            return
+        
+        try:
+            self.push_screen(MessageSearchModal())
+        except Exception as e:
+            self.notify(f"Erreur lors de l'ouverture de la recherche: {e}", severity="error")
+    
     async def action_manage_downloads(self) -> None:
         """Open download manager (Ctrl+D)."""
         if self.app_state_ui != "conversation":
@@ -3618,25 +4931,26 @@ class EncodHexApp(App):
                 self.chat_view.add_message("Système", f"Fichier trop volumineux (max {size_str})")
                 return
                 
-            # Get file info
-            filename, file_size, file_type, file_hash = get_file_info(file_path)
+            # Get file info, hashed off the event loop (and only once, see FileInfoCache)
+            filename, file_size, file_type, file_hash = await file_info_cache.get_async(file_path)
             size_str = format_file_size(file_size)
             
             self.notify(f"Envoi de {filename} ({size_str})...", severity="information")
             
             # Determine handling based on file type
             if is_image_file(filename):
-                # Handle as image with preview
-                self.chat_view.add_message(app_state.username, f"Image: {filename}", message_type="image")
-                
-                # Process image for preview
-                display_content = await process_image_for_display_async(file_path)
-                self.chat_view.update_image_display(display_content)
+                # Make the preview once: shown here, kept for history and sent to peers
+                loop = asyncio.get_event_loop()
+                thumbnail, preview_hash = await loop.run_in_executor(None, store_image_thumbnail, file_path)
+                display_content = await process_image_for_display_async(thumbnail)
+                handle = self.chat_view.add_message(app_state.username, f"Image: {filename}", message_type="image",
+                                           preview_hash=preview_hash)
+                self.chat_view.update_image_display(handle, display_content, preview_hash)
                 
-                # Send as image for preview
-                await self.broadcast_message_to_peers(image_path=file_path)
+                # Send the small preview, generated here rather than by every receiver
+                await self.broadcast_message_to_peers(image_path=file_path, image_data=thumbnail)
                 
-                # Also send as file for full-quality download
+                # The full-quality file is transferred once, for download
                 await self.broadcast_message_to_peers(file_path=file_path)
             else:
                 # Handle as regular file
@@ -3650,8 +4964,8 @@ class EncodHexApp(App):
                     download_available=False
                 )
                 
-                self.chat_view.add_message(app_state.username, f"Fichier partagé: {filename}", message_type="file", file_info=file_info)
-                self.chat_view.update_file_display(file_info, download_link=False)
+                handle = self.chat_view.add_message(app_state.username, f"Fichier partagé: {filename}", message_type="file", file_info=file_info)
+                self.chat_view.update_file_display(handle, file_info, download_link=False)
                 
                 # Send as file
                 await self.broadcast_message_to_peers(file_path=file_path)
@@ -3663,17 +4977,25 @@ class EncodHexApp(App):
             self.chat_view.add_message("Système", f"Erreur d'envoi: {e}")
             self.notify(f"❌ Erreur d'envoi: {e}", severity="error")
     
+    async def open_conversation(self, identifier: str):
+        """Load a conversation's newest page off the event loop, then display it."""
+        if await app_state.load_conversation_async(identifier) is not None:
+            self.chat_view.load_conversation_history()
+            if app_state.conversation_log is not None and app_state.conversation_log.locked:
+                self.chat_view.add_message("Système", "Historique chiffré illisible (clé de stockage différente ou "
+                                           "chiffrement désactivé) : les nouveaux messages ne seront pas enregistrés")
+    
+    async def connect_with_history(self, contact: Contact):
+        await self.open_conversation(contact.name)
+        await self.establish_full_peer_connection(contact.ip, contact.port)
+    
     def connect_to_contact(self, contact: Contact):
         """Connect to a contact from the contact manager."""
         try:
             self.notify(f"Connexion à {contact.name} ({contact.ip}:{contact.port})...", severity="information")
             
-            # Load conversation history for this contact
-            app_state.load_conversation(contact.name)
-            self.chat_view.load_conversation_history()
-            
-            # Create connection task
-            asyncio.create_task(self.establish_full_peer_connection(contact.ip, contact.port))
+            # Load conversation history for this contact, then connect
+            asyncio.create_task(self.connect_with_history(contact))
             
         except Exception as e:
             self.notify(f"Erreur de connexion à {contact.name}: {e}", severity="error")
@@ -3692,14 +5014,16 @@ class EncodHexApp(App):
                        severity="information")
             
             # Display locally first with placeholder
-            self.chat_view.add_message(app_state.username, "[Image en cours d'envoi...]", is_image=True)
+            handle = self.chat_view.add_message(app_state.username, "[Image en cours d'envoi...]", is_image=True)
             
-            # Process image asynchronously with current quality settings
-            display_content = await process_image_for_display_async(image_path)
-            self.chat_view.update_image_display(display_content)
+            # Make the preview sent to peers once, and show it from the preview cache
+            loop = asyncio.get_event_loop()
+            thumbnail, preview_hash = await loop.run_in_executor(None, store_image_thumbnail, image_path)
+            display_content = await process_image_for_display_async(thumbnail)
+            self.chat_view.update_image_display(handle, display_content, preview_hash)
             
             # Send to peers concurrently (ensure fresh message ID each time)
-            await self.broadcast_message_to_peers(image_path=image_path)
+            await self.broadcast_message_to_peers(image_path=image_path, image_data=thumbnail)
             
             # Success notification
             self.notify(f"✅ Image envoyée avec succès!", severity="information")
@@ -3732,9 +5056,7 @@ class EncodHexApp(App):
     async def reset_to_connection_setup(self, message=None):
         """Reset the application for new connection setup."""
         # Reset state
-        app_state.hello_done.clear()
-        app_state.peers.clear()
-        app_state.dh_exchanges.clear()
+        app_state.clear_peers()
         app_state.message_ids.clear()
         app_state.in_waiting_mode = False
         
@@ -3786,6 +5108,10 @@ class EncodHexApp(App):
                 except:
                     pass
         
+        app_state.close_conversation()
+        snapshot_writer.flush()
+        image_pool.shutdown()
+        
         # Close server
         if app_state.websocket_server:
             app_state.websocket_server.close()
@@ -3809,6 +5135,8 @@ class EncodHexApp(App):
             await self.action_manage_downloads()
         elif key_str == "f3":
             await self.action_load_conversation()
+        elif key_str == "f4":
+            await self.action_search_messages()
         elif key_str == "f5":
             await self.action_select_file()
         elif key_str == "ctrl+r":